@@ -0,0 +1,89 @@
+#imports
+import struct
+
+class ChunkBitmap :
+    """
+    A compact record of which chunks of a single file have been handled, stored as one bit per chunk index
+    Membership checks and additions are O(1), and the number of chunks set is kept as a running count
+    """
+
+    #################### PROPERTIES ####################
+
+    @property
+    def n_total_chunks(self) :
+        return self.__n_total_chunks #the total number of chunks in the file
+    @property
+    def n_chunks_set(self) :
+        return self.__n_chunks_set #the number of chunks that have been added so far
+    @property
+    def complete(self) :
+        return self.__n_chunks_set==self.__n_total_chunks #whether every chunk in the file has been added
+
+    #################### SPECIAL FUNCTIONS ####################
+
+    def __init__(self,n_total_chunks,bits=None) :
+        """
+        n_total_chunks = the total number of chunks to expect for the file
+        bits           = an existing bitmap to start from (optional, used in deserializing)
+        """
+        if n_total_chunks<1 :
+            raise ValueError(f'ERROR: a ChunkBitmap needs at least one chunk but n_total_chunks={n_total_chunks}!')
+        self.__n_total_chunks = n_total_chunks
+        n_bytes = (n_total_chunks+7)//8
+        if bits is None :
+            self.__bits = bytearray(n_bytes)
+            self.__n_chunks_set = 0
+        else :
+            if len(bits)!=n_bytes :
+                errmsg = f'ERROR: bitmap for {n_total_chunks} chunks should have {n_bytes} bytes, '
+                errmsg+= f'but {len(bits)} were given!'
+                raise ValueError(errmsg)
+            self.__bits = bytearray(bits)
+            self.__n_chunks_set = bin(int.from_bytes(self.__bits,'little')).count('1')
+
+    def __contains__(self,chunk_i) :
+        byte_i, mask = self.__get_byte_index_and_mask(chunk_i)
+        return (self.__bits[byte_i] & mask)!=0
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def add(self,chunk_i) :
+        """
+        Mark the chunk with the given index as added
+        Returns True if the chunk was newly added, and False if it had already been added before
+        """
+        byte_i, mask = self.__get_byte_index_and_mask(chunk_i)
+        if self.__bits[byte_i] & mask :
+            return False
+        self.__bits[byte_i]|=mask
+        self.__n_chunks_set+=1
+        return True
+
+    def to_bytes(self) :
+        """
+        Return the bitmap serialized as bytes (can be read back in with ChunkBitmap.from_bytes)
+        """
+        return struct.pack('>Q',self.__n_total_chunks)+bytes(self.__bits)
+
+    @classmethod
+    def from_bytes(cls,bytestring) :
+        """
+        Return a ChunkBitmap rebuilt from bytes created by to_bytes
+        """
+        if len(bytestring)<8 :
+            raise ValueError(f'ERROR: {len(bytestring)} bytes is too short to be a serialized ChunkBitmap!')
+        n_total_chunks = struct.unpack('>Q',bytestring[:8])[0]
+        return cls(n_total_chunks,bytestring[8:])
+
+    #################### PRIVATE HELPER FUNCTIONS ####################
+
+    def __get_byte_index_and_mask(self,chunk_i) :
+        """
+        Return the index of the byte and the bit mask corresponding to a given chunk index
+        (chunk indices start from 1, like DataFileChunk.chunk_i)
+        """
+        if chunk_i<1 or chunk_i>self.__n_total_chunks :
+            errmsg = f'ERROR: chunk index {chunk_i} is out of range for a file with {self.__n_total_chunks} chunks!'
+            raise IndexError(errmsg)
+        bit_i = chunk_i-1
+        return bit_i>>3, 1<<(bit_i&7)
@@ -28,6 +28,30 @@ class DataFileHandlingConstants :
     @property
     def FILE_IN_PROGRESS(self) :
         return 0  # code indicating that a file is in the process of being reconstructed
+    @property
+    def PARTIAL_FILE_EXT(self) :
+        return '.partial' # extension for the (hidden) files in which files on disk are reconstructed
+    @property
+    def HASH_READ_SIZE(self) :
+        return 1048576 # number of bytes to read at a time when checking the hash of a reconstructed file on disk
+    @property
+    def CHECKPOINT_FILE_EXT(self) :
+        return '.checkpoint' # extension for the (hidden) files holding the state of files being reconstructed
+    @property
+    def PROCESSED_FILE_INDEX_NAME(self) :
+        return '.processed_file_index.sqlite' # name of the database file holding the index of processed files
+    @property
+    def OUTPUT_CONTENT_INDEX_NAME(self) :
+        return '.output_content_index.sqlite' # name of the database file (inside the output directory) holding 
+                                              #the index of the files that already exist there
+    @property
+    def N_SKIPPED_FILES_TO_REMEMBER(self) :
+        return 10000 # how many of the most recently skipped files each worker thread remembers 
+                     #(the paths listed as skipped, and the hashes used to skip the rest of their chunks)
+    @property
+    def QUARANTINE_DIR_NAME(self) :
+        return '.quarantine' # name of the directory (inside the output directory by default) holding 
+                             #incomplete files that stopped receiving data before they were reconstructed
     
 DATA_FILE_HANDLING_CONST=DataFileHandlingConstants()
 
@@ -48,10 +72,39 @@ class RunOptionConstants :
     def N_DEFAULT_DOWNLOAD_THREADS(self) :
         return 4      # default number of threads to use when downloading chunks of a file
     @property
+    def N_DEFAULT_WORKER_PROCESSES(self) :
+        return 1      # default number of processes to split consuming messages between
+    @property
+    def N_DEFAULT_PROCESSING_WORKERS(self) :
+        return 0      # default number of processes in a pool to process fully-read files in (0 = don't use a pool)
+    @property
     def DEFAULT_CHUNK_SIZE(self) :
         return 16384  # default size in bytes of each file upload chunk
     @property
     def DEFAULT_MAX_UPLOAD_QUEUE_SIZE(self) :
         return 3000   # default maximum number of items allowed in the upload Queue at once
+    @property
+    def CONSUMER_BATCH_SIZE(self) :
+        return 100    # maximum number of messages each consumer thread gets at once
+    @property
+    def CONSUMER_POLL_TIMEOUT(self) :
+        return 0.5    # number of seconds each consumer thread waits for new messages before checking on 
+                      #the state of the process and doing any idle-time work
+    @property
+    def DEFAULT_CHECKPOINT_EVERY(self) :
+        return 1000   # default number of messages each download thread reads between checkpointing 
+                      #in-progress files and committing its consumer's offsets
+    @property
+    def CHECKPOINT_TIMEOUT(self) :
+        return 60     # max number of seconds a download thread waits for the threads it's handed chunks to 
+                      #to checkpoint them before giving up on committing its offsets until the next time
+    @property
+    def DEFAULT_MAX_MEMORY_BYTES(self) :
+        return 2147483648 # default total size of in-progress files a stream processor will hold in memory 
+                          #before spilling the least recently updated ones to disk
+    @property
+    def DEFAULT_STALE_FILE_TIMEOUT(self) :
+        return 86400  # default number of seconds a file being reconstructed can go without receiving any 
+                      #new chunks before its partial data are quarantined and it's forgotten about
 
 RUN_OPT_CONST = RunOptionConstants()
@@ -1,11 +1,24 @@
 #imports
 from .utilities import producer_callback, PRODUCER_CALLBACK_LOGGER
 from .config import INTERNAL_PRODUCTION_CONST
-from ..utilities.logging import Logger
+from ..utilities.logging import Logger, RateLimitedWarnings
 from ..utilities.misc import populated_kwargs
+from ..my_kafka.config import MSG_HEADER_CONST
+from ..utilities.metrics import METRICS
 from hashlib import sha512
 import time, pathlib
 
+#metrics
+N_BYTES_READ = METRICS.counter('openmsi_bytes_read_total',
+                               'Bytes of file chunks read (and hashed again) to produce them')
+N_MSGS_PRODUCED = METRICS.counter('openmsi_messages_produced_total','File chunk messages handed to producers')
+N_BYTES_PRODUCED = METRICS.counter('openmsi_bytes_produced_total','Bytes of file data in messages handed to producers')
+PRODUCE_SECS = METRICS.histogram('openmsi_produce_seconds',
+                                 'Time taken by each call to produce a file chunk message (including serialization)')
+
+#rate-limited warnings for file chunks that couldn't be produced
+DROPPED_CHUNK_WARNINGS = RateLimitedWarnings('dropped_chunk','file chunks dropped because they failed to buffer')
+
 # DataFileChunk Class 
 class DataFileChunk :
     """
@@ -49,11 +62,40 @@ class DataFileChunk :
         if key_pp!='' :
             key_pp+='_'
         return f'{key_pp}{self.filename}_chunk_{self.chunk_i}_of_{self.n_total_chunks}' #the key of the message
+    @property
+    def relative_filepath(self) :
+        subdir_str = self.subdir_str
+        if subdir_str in ('','.') :
+            return self.filename
+        return f'{subdir_str}/{self.filename}' #the path to the file relative to its root directory (as a string)
+    @property
+    def message_headers(self) :
+        headers = [(MSG_HEADER_CONST.FILE_ID,self.file_hash[:MSG_HEADER_CONST.FILE_ID_N_BYTES].hex().encode()),
+                   (MSG_HEADER_CONST.CHUNK_I,str(self.chunk_i).encode()),
+                   (MSG_HEADER_CONST.N_TOTAL_CHUNKS,str(self.n_total_chunks).encode()),
+                   (MSG_HEADER_CONST.RELPATH,self.relative_filepath.encode()),
+                   (MSG_HEADER_CONST.HASH_ALGORITHM,MSG_HEADER_CONST.HASH_ALGORITHM_NAME.encode()),
+                   (MSG_HEADER_CONST.PRODUCED_AT,f'{time.time():.6f}'.encode()),
+                  ]
+        if self.file_size is not None :
+            headers.append((MSG_HEADER_CONST.FILE_SIZE,str(self.file_size).encode()))
+        if self.detected_at is not None :
+            headers.append((MSG_HEADER_CONST.DETECTED_AT,f'{self.detected_at:.6f}'.encode()))
+        if self.chunked_at is not None :
+            headers.append((MSG_HEADER_CONST.CHUNKED_AT,f'{self.chunked_at:.6f}'.encode()))
+        return headers #compact copies of the chunk's metadata to attach to its message (computed when called)
+    @property
+    def headers(self) :
+        return self.__headers #the headers of the message this chunk was consumed from (decoded; empty if not consumed)
+    @headers.setter
+    def headers(self,h) :
+        self.__headers=h
 
     #################### SPECIAL FUNCTIONS ####################
 
     def __init__(self,filepath,filename,file_hash,chunk_hash,chunk_offset_read,chunk_offset_write,chunk_size,chunk_i,
-                 n_total_chunks,rootdir=None,filename_append='',data=None) :
+                 n_total_chunks,rootdir=None,filename_append='',data=None,file_size=None,detected_at=None,
+                 chunked_at=None) :
         """
         filepath           = path to this chunk's file 
                              (fully resolved if being produced, may be relative if it was consumed)
@@ -71,6 +113,11 @@ class DataFileChunk :
         filename_append    = string to append to the stem of the filename when the file is reconstructed
         data               = the actual binary data of this chunk of the file 
                              (can be set later if this chunk is being produced and not consumed)
+        file_size          = the total size (in bytes) of the reconstructed file 
+                             (may be None for chunks consumed from messages that didn't include it)
+        detected_at        = the time (in seconds since the epoch) the file was found to be uploaded (optional)
+        chunked_at         = the time the file was done being read and broken into chunks (optional)
+        (detected_at and chunked_at are sent in message headers, to trace how long files take to be reconstructed)
         """
         self.__filepath = filepath
         self.filename = filename
@@ -84,6 +131,10 @@ class DataFileChunk :
         self.__rootdir = rootdir
         self.filename_append = filename_append
         self.__data = data
+        self.file_size = file_size
+        self.detected_at = detected_at
+        self.chunked_at = chunked_at
+        self.__headers = {}
 
     def __eq__(self,other) :
         if not isinstance(other,DataFileChunk) :
@@ -99,6 +150,7 @@ class DataFileChunk :
         retval = retval and self.n_total_chunks == other.n_total_chunks
         retval = retval and self.subdir_str == other.subdir_str
         retval = retval and self.filename_append == other.filename_append
+        retval = retval and self.file_size == other.file_size
         retval = retval and self.__data == other.data
         return retval
 
@@ -107,6 +159,8 @@ class DataFileChunk :
     def produce_to_topic(self,producer,topic_name,logger,**kwargs) :
         """
         Upload the file chunk as a message to the specified topic using the specified SerializingProducer
+        The chunk's metadata are also attached to the message as headers, so that they can be read without
+        deserializing the message's value
         Meant to be run in parallel
         producer     = the producer to use
         topic_name   = the name of the topic to produce the message to
@@ -134,7 +188,12 @@ class DataFileChunk :
         success=False; total_wait_secs=0 
         if (not success) and total_wait_secs<kwargs['timeout'] :
             try :
-                producer.produce(topic=topic_name,key=self.message_key,value=self,on_delivery=producer_callback)
+                start_time = time.perf_counter()
+                producer.produce(topic=topic_name,key=self.message_key,value=self,headers=self.message_headers,
+                                 on_delivery=producer_callback)
+                PRODUCE_SECS.observe(time.perf_counter()-start_time)
+                N_MSGS_PRODUCED.inc()
+                N_BYTES_PRODUCED.inc(self.chunk_size)
                 success=True
             except BufferError :
                 time.sleep(kwargs['retry_sleep'])
@@ -142,7 +201,7 @@ class DataFileChunk :
         if not success :
             warnmsg = f'WARNING: message with key {self.message_key} failed to buffer for more than '
             warnmsg+= f'{total_wait_secs}s and was dropped!'
-            logger.warning(warnmsg)
+            DROPPED_CHUNK_WARNINGS.warning(logger,warnmsg)
         producer.poll(0.025)
 
     #################### PRIVATE HELPER FUNCTIONS ####################
@@ -174,3 +233,4 @@ class DataFileChunk :
             logger.error(msg,ValueError)
         #set the chunk's data value
         self.__data = data
+        N_BYTES_READ.inc(len(data))
@@ -1,17 +1,26 @@
 #imports
-import datetime, time
-from threading import Lock
+import os, datetime, time
 from ..utilities.controlled_process import ControlledProcessMultiThreaded
 from ..utilities.runnable import Runnable
-from ..utilities.misc import populated_kwargs
+from ..utilities.misc import populated_kwargs, get_filepaths_message
+from ..utilities.metrics import METRICS
 from ..my_kafka.consumer_group import ConsumerGroup
 from .config import DATA_FILE_HANDLING_CONST, RUN_OPT_CONST
 from .download_data_file import DownloadDataFileToDisk
+from .output_content_index import OutputContentIndex
 from .data_file_directory import DataFileDirectory
+from .file_shard import CheckpointRequest, FileShardRouter
+from .worker_processes import WorkerProcessGroup
 
 class DataFileDownloadDirectory(DataFileDirectory,ControlledProcessMultiThreaded,ConsumerGroup,Runnable) :
     """
     Class representing a directory into which files are being reconstructed
+    Each worker thread owns the files whose paths hash to its shard, and chunks for files owned by other threads
+    are handed off to them, so that no locks are needed to reconstruct files in parallel
+    An index of the files already in the directory is kept so that files that would be reconstructed with
+    the same contents they already have are skipped without writing anything
+    The work can also be split up between several worker processes (each with its own threads and consumers), 
+    in which case this object supervises the processes and combines the progress they report
     """
 
     #################### PROPERTIES ####################
@@ -21,37 +30,127 @@ class DataFileDownloadDirectory(DataFileDirectory,ControlledProcessMultiThreaded
         return {} #Overload this in child classes to define additional keyword arguments 
                   #that should go to the specific datafile constructor
     @property
+    def data_files_by_path(self) :
+        data_files_by_path = {}
+        for shard in self.__shards :
+            data_files_by_path.update(shard.get_data_files_snapshot())
+        return data_files_by_path #the files being reconstructed by all of the worker threads in this process
+    @property
     def n_msgs_read(self) :
-        return self.__n_msgs_read
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_msgs_read')
+        return sum([shard.n_msgs_read for shard in self.__shards])
     @property
     def completely_reconstructed_filepaths(self) :
-        return self.__completely_reconstructed_filepaths
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('completely_reconstructed_filepaths')
+        return [fp for shard in self.__shards for fp in list(shard.completed_filepaths)]
+    @property
+    def skipped_filepaths(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('skipped_filepaths')
+        return [fp for shard in self.__shards for fp in shard.get_skipped_filepaths()] #(only the most recent)
+    @property
+    def n_files_skipped(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_files_skipped')
+        return sum([shard.n_files_skipped for shard in self.__shards])
+    @property
+    def quarantined_filepaths(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('quarantined_filepaths')
+        return list(self.__quarantined_filepaths)
+    @property
+    def in_progress_filepaths(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('in_progress_filepaths')
+        return [datafile.full_filepath for datafile in self.data_files_by_path.values()]
     @property
     def progress_msg(self) :
         progress_msg = 'The following files have been recognized so far:\n'
-        for datafile in self.data_files_by_path.values() :
-            progress_msg+=f'\t{datafile.full_filepath} (in progress)\n'
+        for fp in self.in_progress_filepaths :
+            progress_msg+=f'\t{fp} (in progress)\n'
         for fp in self.completely_reconstructed_filepaths :
             progress_msg+=f'\t{fp} (completed)\n'
+        for fp in self.skipped_filepaths :
+            progress_msg+=f'\t{fp} (skipped, identical file already exists)\n'
+        for fp in self.quarantined_filepaths :
+            progress_msg+=f'\t{fp} (stale, quarantined)\n'
         return progress_msg
 
     #################### PUBLIC FUNCTIONS ####################
 
-    def __init__(self,*args,datafile_type=DownloadDataFileToDisk,**kwargs) :
+    def __new__(cls,*args,**kwargs) :
+        #remember the arguments used to create this object so that copies of it can be made in worker processes
+        obj = super().__new__(cls)
+        obj.__init_args = args
+        obj.__init_kwargs = {k:v for k,v in kwargs.items() if k!='logger'}
+        return obj
+
+    def __init__(self,*args,datafile_type=DownloadDataFileToDisk,
+                 checkpoint_every=RUN_OPT_CONST.DEFAULT_CHECKPOINT_EVERY,
+                 stale_file_timeout=RUN_OPT_CONST.DEFAULT_STALE_FILE_TIMEOUT,quarantine_dir=None,
+                 skip_existing_files=True,n_processes=RUN_OPT_CONST.N_DEFAULT_WORKER_PROCESSES,
+                 process_group_member=None,**kwargs) :
         """
-        datafile_type = the type of datafile that the consumed messages should be assumed to represent
-        In this class datafile_type should be something that extends DownloadDataFileToDisk
+        datafile_type        = the type of datafile that the consumed messages should be assumed to represent
+                               In this class datafile_type should be something that extends DownloadDataFileToDisk
+        checkpoint_every     = the number of messages each thread should read between checkpointing the files it's 
+                               written to and committing its consumer's offsets (checkpointing also happens 
+                               whenever a thread finds no new messages and when the process is shut down)
+        stale_file_timeout   = the number of seconds a file can go without receiving a new chunk before it's 
+                               considered stale; stale files are forgotten about and their partial data are moved 
+                               to the quarantine directory (None to never expire files)
+        quarantine_dir       = the directory to move the partial data for stale files into 
+                               (default is a hidden subdirectory of the output directory)
+        skip_existing_files  = if True, keep an index of the files in the output directory and drop the chunks of
+                               any file that already exists there with the same contents instead of writing it again
+        n_processes          = the number of worker processes to split the work between, each using n_threads 
+                               threads (with 1, everything runs in this process)
+        process_group_member = set for the objects created in each worker process (not meant to be given otherwise)
         """    
         kwargs = populated_kwargs(kwargs,{'n_consumers':kwargs.get('n_threads')})
+        #offsets are committed manually, only after the chunks they cover have been flushed to disk
+        kwargs['enable_auto_commit'] = False
+        #if the work is split between worker processes, this process just runs one thread to supervise each of them
+        n_threads_per_process = kwargs.get('n_threads')
+        if n_processes>1 and process_group_member is None :
+            kwargs['n_threads'] = n_processes
+            kwargs['n_consumers'] = 0
         super().__init__(*args,**kwargs)
         if not issubclass(datafile_type,DownloadDataFileToDisk) :
             errmsg = 'ERROR: DataFileDownloadDirectory requires a datafile_type that is a subclass of '
             errmsg+= f'DownloadDataFileToDisk but {datafile_type} was given!'
             self.logger.error(errmsg,ValueError)
         self.__datafile_type = datafile_type
-        self.__n_msgs_read = 0
-        self.__completely_reconstructed_filepaths = []
-        self.__thread_locks = {}
+        self.__n_threads_per_process = n_threads_per_process
+        self.__worker_processes = None
+        self.__router = None
+        self.__shards = []
+        if n_processes>1 and process_group_member is None :
+            if self.uses_in_memory_loopback :
+                errmsg = f'ERROR: {self.__class__.__name__} cannot split work between {n_processes} worker processes '
+                errmsg+= 'using an in-memory loopback broker, because each process would get its own empty broker! '
+                errmsg+= 'Use a "loopback://path/to/dir" address (like the one in loopback_files.config) '
+                errmsg+= 'to keep the loopback logs in segment files shared between processes instead.'
+                self.logger.error(errmsg,ValueError)
+            snapshot_defaults = {'n_msgs_read':0,'completely_reconstructed_filepaths':[],'skipped_filepaths':[],
+                                 'n_files_skipped':0,'quarantined_filepaths':[],'in_progress_filepaths':[]}
+            self.__worker_processes = WorkerProcessGroup(self.__class__,self.__init_args,self.__init_kwargs,
+                                                         n_processes,'reconstruct',snapshot_defaults,self.logger)
+        else :
+            #the files being reconstructed and the counters for each worker thread (split up between 
+            #the threads of every worker process if there are several)
+            self.__router = FileShardRouter(self.n_threads,process_group_member)
+            self.__shards = self.__router.shards
+        self.__checkpoint_every = checkpoint_every
+        self.__stale_file_timeout = stale_file_timeout
+        if quarantine_dir is None :
+            quarantine_dir = self.dirpath/DATA_FILE_HANDLING_CONST.QUARANTINE_DIR_NAME
+        self.__quarantine_dir = quarantine_dir
+        self.__quarantined_filepaths = []
+        self.__skip_existing_files = skip_existing_files
+        self.__content_index = None
 
     def reconstruct(self) :
         """
@@ -59,80 +158,304 @@ class DataFileDownloadDirectory(DataFileDirectory,ControlledProcessMultiThreaded
         to which they correspond. Runs until the user inputs a command to shut it down. Returns the total number 
         of messages consumed, as well as the number of files whose reconstruction was completed during the run. 
         """
-        msg = f'Will reconstruct files from messages in the {self.topic_name} topic using {self.n_threads} '
-        msg+= f'thread{"s" if self.n_threads!=1 else ""}'
-        self.logger.info(msg)
-        lock = Lock()
-        self.run([(lock,self.consumers[i]) for i in range(self.n_threads)])
-        return self.__n_msgs_read, self.__completely_reconstructed_filepaths
+        msg = f'Will reconstruct files from messages in the {self.topic_name} topic using '
+        METRICS.gauge('openmsi_files_in_progress','Files partially reconstructed',
+                      function=lambda : len(self.in_progress_filepaths))
+        if self.__worker_processes is not None :
+            msg+= f'{self.n_threads} worker processes with {self.__n_threads_per_process} '
+            msg+= f'thread{"s" if self.__n_threads_per_process!=1 else ""} each'
+            self.logger.info(msg)
+            self.run([(i,) for i in range(self.n_threads)])
+        else :
+            msg+= f'{self.n_threads} thread{"s" if self.n_threads!=1 else ""}'
+            self.logger.info(msg)
+            if self.__skip_existing_files :
+                self.__content_index = OutputContentIndex(self.dirpath)
+            self.run([(self.__shards[i],self.consumers[i]) for i in range(self.n_threads)])
+        return self.n_msgs_read, self.completely_reconstructed_filepaths
 
     #################### PRIVATE HELPER FUNCTIONS ####################
 
-    def _run_worker(self,lock,consumer) :
+    def _run_worker(self,*args) :
+        """
+        Supervise one of the worker processes if the work is split up between them, 
+        or otherwise consume messages and reconstruct files in this thread
+        Several iterations of this function run in parallel threads as part of a ControlledProcessMultiThreaded
+        """
+        if self.__worker_processes is not None :
+            self.__worker_processes.supervise(self,*args)
+        else :
+            self.__consume_and_reconstruct(*args)
+
+    def __consume_and_reconstruct(self,shard,consumer) :
         """
         Consume messages expected to be DataFileChunks and try to write their data to disk in the directory, 
         paying attention to whether/how the files they're coming from end up fully reconstructed or mismatched 
         with their original hashes.
-        Several iterations of this function run in parallel threads as part of a ControlledProcessMultiThreaded
+        Chunks of files owned by other threads' shards are handed off to them, and chunks handed off by other 
+        threads are written in between consuming batches of messages
         """
+        #keep track of the other shards this thread has handed chunks to since its offsets were last committed
+        shards_to_checkpoint = set()
+        n_msgs_since_checkpoint = 0
         #start the loop for while the controlled process is alive
         while self.alive :
-            #consume a DataFileChunk message from the topic
-            dfc = consumer.get_next_message(self.logger,0)
-            if dfc is None :
-                time.sleep(0.25) #wait just a bit to not over-tax things
-                continue
-            #set the chunk's rootdir to the working directory
-            if dfc.rootdir is not None :
-                errmsg = f'ERROR: message with key {dfc.message_key} has rootdir={dfc.rootdir} '
-                errmsg+= '(should be None as it was just consumed)! Will ignore this message and continue.'
-                self.logger.error(errmsg)
-            dfc.rootdir = self.dirpath
-            #add the chunk's data to the file that's being reconstructed
-            with lock :
-                self.__n_msgs_read+=1
-                if dfc.filepath not in self.data_files_by_path.keys() :
-                    self.data_files_by_path[dfc.filepath] = self.__datafile_type(dfc.filepath,
-                                                                                 logger=self.logger,
-                                                                                 **self.other_datafile_kwargs)
-                    self.__thread_locks[dfc.filepath] = Lock()
-            return_value = self.data_files_by_path[dfc.filepath].add_chunk(dfc,self.__thread_locks[dfc.filepath])
-            if return_value in (DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS,
-                                DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE) :
-                continue
-            elif return_value==DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE :
-                warnmsg = f'WARNING: hashes for file {self.data_files_by_path[dfc.filepath].filename} not matched '
-                warnmsg+= 'after reconstruction! All data have been written to disk, but not as they were uploaded.'
-                self.logger.warning(warnmsg)
-                with lock :
-                    del self.data_files_by_path[dfc.filepath]
-                    del self.__thread_locks[dfc.filepath]
-            elif return_value==DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE :
-                msg = f'File {self.data_files_by_path[dfc.filepath].full_filepath.relative_to(dfc.rootdir)} '
-                msg+= 'successfully reconstructed from stream'
-                self.logger.info(msg)
-                self.__completely_reconstructed_filepaths.append(dfc.filepath)
-                with lock :
-                    del self.data_files_by_path[dfc.filepath]
-                    del self.__thread_locks[dfc.filepath]
+            #checkpoint and commit if enough messages have been read since the last time
+            if n_msgs_since_checkpoint>=self.__checkpoint_every :
+                self.__checkpoint_and_commit(shard,consumer,shards_to_checkpoint)
+                n_msgs_since_checkpoint = 0
+                self.__quarantine_stale_files(shard)
+            #consume a batch of DataFileChunk messages from the topic, waiting a bit for them to arrive 
+            #(unless other threads have handed off chunks that should be written right away)
+            timeout = 0 if not shard.queue.empty() else RUN_OPT_CONST.CONSUMER_POLL_TIMEOUT
+            dfcs = consumer.get_next_messages(self.logger,RUN_OPT_CONST.CONSUMER_BATCH_SIZE,timeout)
+            shard.n_msgs_read+=len(dfcs)
+            n_msgs_since_checkpoint+=len(dfcs)
+            for dfc in dfcs :
+                shard_i = self.__router.get_shard_index(dfc.filepath)
+                if shard_i==shard.index :
+                    self.__add_chunk(shard,dfc)
+                else :
+                    self.__router.hand_off(dfc,shard_i)
+                    shards_to_checkpoint.add(shard_i)
+            n_items = self.__handle_queued_items(shard)
+            if len(dfcs)==0 and n_items==0 :
+                #checkpoint and commit and clean up stale files while there's nothing else to do
+                if n_msgs_since_checkpoint>0 :
+                    self.__checkpoint_and_commit(shard,consumer,shards_to_checkpoint)
+                    n_msgs_since_checkpoint = 0
+                self.__quarantine_stale_files(shard)
+        #checkpoint and commit one last time before shutting down
+        self.__checkpoint_and_commit(shard,consumer,shards_to_checkpoint)
+        #keep handling chunks and checkpoint requests from other threads until they've all stopped too
+        self.__router.set_finished(shard)
+        while not self.__router.all_finished() :
+            self.__handle_queued_items(shard,RUN_OPT_CONST.CONSUMER_POLL_TIMEOUT)
+        self.__handle_queued_items(shard)
 
     def _on_check(self) :
-        msg = f'{self.__n_msgs_read} messages read, {len(self.__completely_reconstructed_filepaths)} files '
+        msg = f'{self.n_msgs_read} messages read, {len(self.completely_reconstructed_filepaths)} files '
         msg+= 'completely reconstructed so far'
+        if self.n_files_skipped>0 :
+            msg+=f', {self.n_files_skipped} files skipped because they already existed'
+        if len(self.quarantined_filepaths)>0 :
+            msg+=f', {len(self.quarantined_filepaths)} stale files quarantined in {self.__quarantine_dir}'
         self.logger.debug(msg)
-        if len(self.data_files_by_path)>0 or len(self.__completely_reconstructed_filepaths)>0 :
+        if ( len(self.in_progress_filepaths)>0 or len(self.completely_reconstructed_filepaths)>0 or 
+             self.n_files_skipped>0 or len(self.quarantined_filepaths)>0 ) :
             self.logger.debug(self.progress_msg)
 
     def _on_shutdown(self) :
         super()._on_shutdown()
         for consumer in self.consumers :
             consumer.close()
+        if self.__router is not None :
+            self.__router.join()
+        if self.__content_index is not None :
+            self.__content_index.close()
+
+    def _on_diagnostic_command(self,cmd) :
+        #the worker processes (if there are any) each write out or log their own diagnostics
+        super()._on_diagnostic_command(cmd)
+        if self.__worker_processes is not None :
+            self.__worker_processes.send_command(cmd)
+
+    def _get_state_sizes(self) :
+        return {'files being reconstructed':len(self.data_files_by_path),
+                'chunks handed off between threads':sum([shard.queue.qsize() for shard in self.__shards]),
+                'files waiting to be checkpointed':sum([len(shard.filepaths_to_checkpoint) 
+                                                        for shard in self.__shards]),
+               }
+
+    def _get_file_progress(self) :
+        return [(df.full_filepath,df.progress) for df in self.data_files_by_path.values()]
+
+    def _on_scale(self,n_threads) :
+        if self.__worker_processes is not None :
+            errmsg = 'WARNING: the number of threads cannot be changed while running in several worker processes'
+            self.logger.warning(errmsg)
+            return
+        super()._on_scale(n_threads)
+
+    def _get_args_per_thread_after_scaling(self,n_threads) :
+        #move the files being reconstructed to the shards that own them now, and add or remove consumers
+        self.__router.resize(n_threads)
+        self.__shards = self.__router.shards
+        self.set_n_consumers(n_threads)
+        return [(self.__shards[i],self.consumers[i]) for i in range(n_threads)]
+
+    def __add_chunk(self,shard,dfc) :
+        """
+        Add a single consumed DataFileChunk to the file that's being reconstructed in the given (owned) shard, 
+        and handle the file being completed or mismatched with its original hash
+        """
+        #set the chunk's rootdir to the working directory
+        if dfc.rootdir is not None :
+            errmsg = f'ERROR: message with key {dfc.message_key} has rootdir={dfc.rootdir} '
+            errmsg+= '(should be None as it was just consumed)! Will ignore this message and continue.'
+            self.logger.error(errmsg)
+        dfc.rootdir = self.dirpath
+        #drop the chunk without writing anything if its file already exists with the same contents
+        if self.__content_index is not None and shard.skip_file(dfc.filepath,dfc.file_hash,
+                                                                 lambda : self.__already_exists(dfc)) :
+            return
+        #add the chunk's data to the file that's being reconstructed
+        if dfc.filepath not in shard.data_files_by_path.keys() :
+            shard.data_files_by_path[dfc.filepath] = self.__datafile_type(dfc.filepath,
+                                                                          logger=self.logger,
+                                                                          **self.other_datafile_kwargs)
+        shard.last_chunk_times[dfc.filepath] = time.monotonic()
+        shard.filepaths_to_checkpoint.add(dfc.filepath)
+        datafile = shard.data_files_by_path[dfc.filepath]
+        return_value = datafile.add_chunk(dfc)
+        if return_value==DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE :
+            warnmsg = f'WARNING: hashes for file {datafile.filename} not matched after reconstruction! '
+            warnmsg+= f'All data have been written to {datafile.partial_filepath}, but not as they were uploaded.'
+            self.logger.warning(warnmsg)
+            self.__forget_file(shard,dfc.filepath)
+        elif return_value==DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE :
+            msg = f'File {datafile.full_filepath.relative_to(dfc.rootdir)} '
+            msg+= 'successfully reconstructed from stream'
+            self.logger.info(msg)
+            datafile.latency_trace.report(datafile.full_filepath.relative_to(dfc.rootdir),self.logger)
+            shard.completed_filepaths.append(dfc.filepath)
+            self.__forget_file(shard,dfc.filepath)
+            if self.__content_index is not None :
+                try :
+                    self.__content_index.record(datafile.full_filepath,dfc.file_hash)
+                except Exception as e :
+                    warnmsg = f'WARNING: failed to add {datafile.full_filepath} to the index of the output '
+                    warnmsg+= f'directory! It will be hashed again if any more of its chunks are received. Error: {e}'
+                    self.logger.warning(warnmsg)
+
+    def __already_exists(self,dfc) :
+        """
+        Return True if the file that the given chunk belongs to already exists in the output directory with the same
+        contents (according to the index of the directory)
+        """
+        full_filepath = self.__datafile_type.get_full_filepath(dfc)
+        try :
+            existing_file_hash = self.__content_index.get_file_hash(full_filepath)
+        except Exception as e :
+            warnmsg = f'WARNING: failed to look up {full_filepath} in the index of the output directory! '
+            warnmsg+= f'The file will be reconstructed. Error: {e}'
+            self.logger.warning(warnmsg)
+            return False
+        if existing_file_hash is None or existing_file_hash!=dfc.file_hash :
+            return False
+        msg = f'Skipping {full_filepath.relative_to(self.dirpath)} because a file with the same contents '
+        msg+= 'already exists there'
+        self.logger.info(msg)
+        return True
+
+    def __handle_queued_items(self,shard,timeout=None) :
+        """
+        Add any chunks that other threads have handed off to the given shard, and answer any of their requests 
+        for checkpoints, waiting up to timeout seconds for something to arrive (not at all if timeout is None)
+        Returns the number of items that were handled
+        """
+        items = shard.get_items(timeout)
+        for item in items :
+            if isinstance(item,CheckpointRequest) :
+                item.set_done(self.__write_checkpoints(shard))
+            else :
+                self.__add_chunk(shard,item)
+        return len(items)
+
+    def __write_checkpoints(self,shard) :
+        """
+        Write checkpoints for any files in the given shard that have received chunks since the last time
+        Files that have been completely reconstructed in the meantime were already flushed to disk when they finished
+        Returns True if every checkpoint was written successfully
+        """
+        for filepath in shard.filepaths_to_checkpoint :
+            datafile = shard.data_files_by_path.get(filepath)
+            if datafile is None :
+                continue
+            try :
+                datafile.write_checkpoint()
+            except Exception as e :
+                errmsg = f'ERROR: failed to write checkpoint for {filepath}! Offsets will not be committed. '
+                errmsg+= f'Error: {e}'
+                self.logger.error(errmsg)
+                return False
+        shard.filepaths_to_checkpoint.clear()
+        return True
+
+    def __checkpoint_and_commit(self,shard,consumer,shards_to_checkpoint) :
+        """
+        Write checkpoints for the files in this thread's shard and make sure the other shards this thread has handed 
+        chunks to have done the same (after writing those chunks), and then commit the offsets of the messages 
+        the given consumer has read so far
+        Keeps handling items handed off to this thread's own shard while it waits, and clears the given set of 
+        shard indices when it's done
+        Gives up without committing (until the next time) if the other shards take too long to respond
+        (requests to shards in worker processes that have died fail right away)
+        """
+        requests = [self.__router.request_checkpoint(shard_i) for shard_i in shards_to_checkpoint]
+        succeeded = self.__write_checkpoints(shard)
+        wait_start = time.monotonic()
+        while not all([request.is_done() for request in requests]) :
+            if time.monotonic()-wait_start>RUN_OPT_CONST.CHECKPOINT_TIMEOUT :
+                errmsg = 'ERROR: other threads did not checkpoint the chunks handed off to them within '
+                errmsg+= f'{RUN_OPT_CONST.CHECKPOINT_TIMEOUT} seconds! Offsets will not be committed.'
+                self.logger.error(errmsg)
+                return
+            self.__handle_queued_items(shard,0.01)
+        if not (succeeded and all([request.succeeded for request in requests])) :
+            return
+        shards_to_checkpoint.clear()
+        consumer.commit_offsets(self.logger)
+
+    def __quarantine_stale_files(self,shard) :
+        """
+        Forget about any files in the given (owned) shard that haven't received a new chunk in longer than 
+        the stale file timeout, moving their partial data into the quarantine directory and removing their 
+        checkpoint files
+        """
+        if self.__stale_file_timeout is None :
+            return
+        now = time.monotonic()
+        stale_filepaths = [fp for fp,t in shard.last_chunk_times.items() if now-t>self.__stale_file_timeout]
+        for filepath in stale_filepaths :
+            datafile = shard.data_files_by_path[filepath]
+            quarantined_filepath = None
+            try :
+                if datafile.partial_filepath is not None and datafile.partial_filepath.is_file() :
+                    rel_filepath = datafile.full_filepath.relative_to(self.dirpath)
+                    quarantined_filepath = self.__quarantine_dir/rel_filepath.parent
+                    quarantined_filepath/= rel_filepath.name+DATA_FILE_HANDLING_CONST.PARTIAL_FILE_EXT
+                    quarantined_filepath.parent.mkdir(parents=True,exist_ok=True)
+                    os.replace(datafile.partial_filepath,quarantined_filepath)
+                if datafile.checkpoint_filepath is not None and datafile.checkpoint_filepath.is_file() :
+                    datafile.checkpoint_filepath.unlink()
+            except Exception as e :
+                errmsg = f'ERROR: failed to quarantine partial data for stale file {filepath}! Error: {e}'
+                self.logger.error(errmsg)
+            self.__forget_file(shard,filepath)
+            self.__quarantined_filepaths.append(filepath)
+            warnmsg = f'WARNING: file {filepath} has not received any new data in over '
+            warnmsg+= f'{self.__stale_file_timeout} seconds and will no longer be reconstructed '
+            warnmsg+= f'({datafile.n_chunks_downloaded} chunks were received). '
+            if quarantined_filepath is not None :
+                warnmsg+= f'Its partial data have been moved to {quarantined_filepath}.'
+            self.logger.warning(warnmsg)
+
+    def __forget_file(self,shard,filepath) :
+        """
+        Remove everything stored about a file being reconstructed in the given (owned) shard
+        """
+        del shard.data_files_by_path[filepath]
+        del shard.last_chunk_times[filepath]
+        shard.filepaths_to_checkpoint.discard(filepath)
+        shard.skipped_file_hashes.pop(filepath,None)
 
     #################### CLASS METHODS ####################
 
     @classmethod
     def get_command_line_arguments(cls) :
-        args = ['output_dir','config','topic_name','update_seconds','consumer_group_ID']
+        args = ['output_dir','config','topic_name','update_seconds','consumer_group_ID','n_processes',
+                'stale_file_timeout','include','exclude','control_socket','metrics_port']
         kwargs = {'n_threads':RUN_OPT_CONST.N_DEFAULT_DOWNLOAD_THREADS}
         return args,kwargs
 
@@ -146,8 +469,15 @@ class DataFileDownloadDirectory(DataFileDirectory,ControlledProcessMultiThreaded
         #make the download directory
         reconstructor_directory = cls(args.output_dir,args.config,args.topic_name,
                                       n_threads=args.n_threads,
+                                      n_processes=args.n_processes,
+                                      stale_file_timeout=args.stale_file_timeout if args.stale_file_timeout>0 else None,
                                       consumer_group_ID=args.consumer_group_ID,
+                                      include_globs=args.include,
+                                      exclude_globs=args.exclude,
                                       update_secs=args.update_seconds,
+                                      control_socket=args.control_socket,
+                                      metrics_port=args.metrics_port,
+                                      **cls.get_profiling_kwargs(args),
                                      )
         #start the reconstructor running
         run_start = datetime.datetime.now()
@@ -165,6 +495,16 @@ class DataFileDownloadDirectory(DataFileDirectory,ControlledProcessMultiThreaded
         for fn in complete_filenames :
             msg+=f'\n\t{fn}'
         reconstructor_directory.logger.info(msg)
+        if reconstructor_directory.n_files_skipped>0 :
+            msg = get_filepaths_message(reconstructor_directory.skipped_filepaths,
+                                        'skipped because identical files already existed in the output directory',
+                                        reconstructor_directory.n_files_skipped)
+            reconstructor_directory.logger.info(msg)
+        quarantined_filepaths = reconstructor_directory.quarantined_filepaths
+        if len(quarantined_filepaths)>0 :
+            msg = get_filepaths_message(quarantined_filepaths,
+                                        'never completed and quarantined after receiving no new data for too long')
+            reconstructor_directory.logger.info(msg)
 
 #################### MAIN METHOD TO RUN FROM COMMAND LINE ####################
 
@@ -1,17 +1,40 @@
 #imports
-import pathlib, traceback
-from threading import Lock
-from abc import ABC, abstractmethod
+import pathlib, traceback, time
+from collections import OrderedDict
 from ..utilities.misc import populated_kwargs
 from ..utilities.logging import LogOwner
 from ..utilities.controlled_process import ControlledProcessMultiThreaded
+from ..utilities.metrics import METRICS
 from ..my_kafka.consumer_group import ConsumerGroup
-from .config import DATA_FILE_HANDLING_CONST
+from .config import RUN_OPT_CONST, DATA_FILE_HANDLING_CONST
 from .download_data_file import DownloadDataFileToMemory
+from .file_shard import FileShardRouter
+from .worker_processes import WorkerProcessGroup
+from .processing_pool import FileProcessingPool, ProcessingResult
+from .reorder_buffer import ReorderBuffer
+from .processed_file_index import ProcessedFileIndex
 
-class DataFileStreamProcessor(ControlledProcessMultiThreaded,LogOwner,ConsumerGroup,ABC) :
+#metrics
+N_FILES_PROCESSED = METRICS.counter('openmsi_files_processed_total','Fully read files processed successfully')
+N_FILES_PROCESSING_FAILED = METRICS.counter('openmsi_files_processing_failed_total',
+                                            'Fully read files that could not be processed')
+FILE_PROCESSING_SECS = METRICS.histogram('openmsi_file_processing_seconds',
+                                         'Time taken to process each fully read file (from submission to the pool)')
+
+class DataFileStreamProcessor(ControlledProcessMultiThreaded,LogOwner,ConsumerGroup) :
     """
     A class to consume DataFileChunk messages into memory and perform some operation(s) when entire files are available
+    Several processors can be registered to run on each file, so that every file is only consumed and reconstructed 
+    once no matter how many different things are done with it
+    Child classes can also have each file's data passed to them in order as they arrive, to start processing files 
+    before they're complete
+    An index of the files that have already been processed can be kept so that they're skipped (without being 
+    reconstructed) if they're read again
+    Each worker thread owns (and processes) the files whose paths hash to its shard, and chunks for files owned by 
+    other threads are handed off to them, so that no locks are needed to reconstruct files in parallel
+    Fully-read files can be processed in a pool of separate processes instead of in the threads that consume messages
+    The work can also be split up between several worker processes (each with its own threads and consumers), 
+    in which case this object supervises the processes and combines the progress they report
     """
 
     #################### PROPERTIES ####################
@@ -20,34 +43,166 @@ class DataFileStreamProcessor(ControlledProcessMultiThreaded,LogOwner,ConsumerGr
     def other_datafile_kwargs(self) :
         return {} #Overload in child classes to add additional keyword arguments to the datafile constructor
     @property
+    def pool_processing_function(self) :
+        #Overload in child classes with a picklable function (like a staticmethod) that works like 
+        #_process_downloaded_data_file, to allow files to be processed in a pool of separate processes
+        #(only used if no processors have been registered with add_processor)
+        return None
+    @property
+    def other_processing_kwargs(self) :
+        return {} #Overload in child classes to add additional keyword arguments to the pool processing function
+    @property
+    def streams_data_in_order(self) :
+        #Overload in child classes to return True to have _on_contiguous_data called with each file's data 
+        #in order as they arrive and _on_file_complete called once each file's hash has been checked
+        return False
+    @property
+    def processor_version(self) :
+        #Overload in child classes to change the version recorded in the index of processed files
+        #(files processed by an older version will be processed again)
+        return '1'
+    @property
+    def processor_names(self) :
+        return list(self.__processors.keys()) #the names of the processors registered with add_processor
+    @property
     def n_msgs_read(self) :
-        return self.__n_msgs_read
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_msgs_read')
+        return sum([shard.n_msgs_read for shard in self.__shards])
     @property
     def processed_filepaths(self) :
-        return self.__processed_filepaths
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('processed_filepaths')
+        return [fp for shard in self.__shards for fp in list(shard.completed_filepaths)]
+    @property
+    def skipped_filepaths(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('skipped_filepaths')
+        return [fp for shard in self.__shards for fp in shard.get_skipped_filepaths()] #(only the most recent)
+    @property
+    def n_files_skipped(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_files_skipped')
+        return sum([shard.n_files_skipped for shard in self.__shards])
+    @property
+    def in_progress_filepaths(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('in_progress_filepaths')
+        return [datafile.full_filepath for datafile in self.__get_in_progress_datafiles()]
     @property
     def progress_msg(self) :
         progress_msg = 'The following files have been recognized so far:\n'
-        for datafile in self.__data_files_by_filepath.values() :
-            progress_msg+=f'\t{datafile.full_filepath} (in progress)\n'
+        for fp in self.in_progress_filepaths :
+            progress_msg+=f'\t{fp} (in progress)\n'
         for fp in self.processed_filepaths :
             progress_msg+=f'\t{fp} (completed)\n'
+        for fp in self.skipped_filepaths :
+            progress_msg+=f'\t{fp} (skipped, already processed)\n'
         return progress_msg
+    @property
+    def n_bytes_in_memory(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_bytes_in_memory')
+        return sum([df.n_bytes_in_memory for df in self.__get_in_progress_datafiles()])
+    @property
+    def n_files_spilled(self) :
+        if self.__worker_processes is not None :
+            return self.__worker_processes.get_combined('n_files_spilled')
+        return len([df for df in self.__get_in_progress_datafiles() if df.spilled])
 
     #################### PUBLIC FUNCTIONS ####################
 
-    def __init__(self,*args,datafile_type=DownloadDataFileToMemory,**kwargs) :
+    def __new__(cls,*args,**kwargs) :
+        #remember the arguments used to create this object so that copies of it can be made in worker processes
+        obj = super().__new__(cls)
+        obj.__init_args = args
+        obj.__init_kwargs = {k:v for k,v in kwargs.items() if k!='logger'}
+        return obj
+
+    def __init__(self,*args,datafile_type=DownloadDataFileToMemory,
+                 max_memory_bytes=RUN_OPT_CONST.DEFAULT_MAX_MEMORY_BYTES,spill_dir=None,
+                 n_processes=RUN_OPT_CONST.N_DEFAULT_WORKER_PROCESSES,process_group_member=None,
+                 n_processing_workers=RUN_OPT_CONST.N_DEFAULT_PROCESSING_WORKERS,max_pending_files=None,
+                 processed_file_index=None,**kwargs) :
+        """
+        datafile_type    = the type of DownloadDataFileToMemory to reconstruct files as
+        max_memory_bytes = the total size of in-progress files to hold in memory at once; once it's exceeded 
+                           the least recently updated files are spilled to temporary files on disk 
+                           (split evenly between the worker threads of every process; None for no limit)
+        spill_dir        = the directory in which to create temporary files for spilled data 
+                           (the system default temporary directory is used if None)
+        n_processes      = the number of worker processes to split the work between, each using n_threads 
+                           threads (with 1, everything runs in this process)
+        process_group_member = set for the objects created in each worker process (not meant to be given otherwise)
+        n_processing_workers = the number of processes in a pool to process fully-read files in 
+                               (with 0, files are processed in the threads that consume messages)
+        max_pending_files    = the maximum number of files waiting on or being processed in the pool at once 
+                               (consuming messages pauses until some are done; default is twice the pool size)
+        processed_file_index = the path to a database file to use as a persistent index of the files that have been 
+                               processed, so that files are skipped if they've already been processed with the same 
+                               contents by the same processors and version (None to process every file)
+        """
         kwargs = populated_kwargs(kwargs,{'n_consumers':kwargs.get('n_threads')})
+        #if the work is split between worker processes, this process just runs one thread to supervise each of them
+        n_threads_per_process = kwargs.get('n_threads')
+        if n_processes>1 and process_group_member is None :
+            kwargs['n_threads'] = n_processes
+            kwargs['n_consumers'] = 0
         super().__init__(*args,**kwargs)
         if not issubclass(datafile_type,DownloadDataFileToMemory) :
             errmsg = 'ERROR: DataFileStreamProcessor requires a datafile_type that is a subclass of '
             errmsg+= f'DownloadDataFileToMemory but {datafile_type} was given!'
             self.logger.error(errmsg,ValueError)
         self.__datafile_type = datafile_type
-        self.__n_msgs_read = 0
-        self.__processed_filepaths = []
-        self.__data_files_by_filepath = {}
-        self.__thread_locks = {}
+        self.__max_memory_bytes = max_memory_bytes
+        self.__spill_dir = spill_dir
+        self.__n_processing_workers = n_processing_workers
+        self.__max_pending_files = max_pending_files
+        self.__processing_pool = None
+        #the processors registered to run on each file (name -> (function, kwargs))
+        self.__processors = OrderedDict()
+        self.__processed_file_index_path = processed_file_index
+        self.__processed_file_index = None
+        self.__n_threads_per_process = n_threads_per_process
+        self.__worker_processes = None
+        self.__router = None
+        self.__shards = []
+        if n_processes>1 and process_group_member is None :
+            if self.uses_in_memory_loopback :
+                errmsg = f'ERROR: {self.__class__.__name__} cannot split work between {n_processes} worker processes '
+                errmsg+= 'using an in-memory loopback broker, because each process would get its own empty broker! '
+                errmsg+= 'Use a "loopback://path/to/dir" address (like the one in loopback_files.config) '
+                errmsg+= 'to keep the loopback logs in segment files shared between processes instead.'
+                self.logger.error(errmsg,ValueError)
+            snapshot_defaults = {'n_msgs_read':0,'processed_filepaths':[],'skipped_filepaths':[],'n_files_skipped':0,
+                                 'in_progress_filepaths':[],'n_bytes_in_memory':0,'n_files_spilled':0}
+            self.__worker_processes = WorkerProcessGroup(self.__class__,self.__init_args,self.__init_kwargs,
+                                                         n_processes,'process_files_as_read',snapshot_defaults,
+                                                         self.logger)
+        else :
+            #the in-progress files and the counters for each worker thread (split up between 
+            #the threads of every worker process if there are several)
+            self.__router = FileShardRouter(self.n_threads,process_group_member)
+            self.__shards = self.__router.shards
+
+    def add_processor(self,function,name=None,**kwargs) :
+        """
+        Register a function to run on every file that's fully read, in addition to any others already registered
+        (if any processors are registered, they're used instead of _process_downloaded_data_file)
+        Each processor is called as function(datafile,**kwargs) and should return None if processing was successful 
+        and an Exception otherwise. To use a pool of processes, functions must be picklable (like module-level 
+        functions or staticmethods), and when running in several worker processes they must be registered 
+        in the constructor so that every process registers them too.
+
+        function = the function to call on each fully-read file
+        name     = a name for the processor to use in log messages (defaults to the function's name)
+        kwargs   = other keyword arguments to pass to the function
+        """
+        if name is None :
+            name = function.__name__
+        if name in self.__processors.keys() :
+            self.logger.error(f'ERROR: a processor named {name} has already been registered!',ValueError)
+        self.__processors[name] = (function,kwargs)
 
     def process_files_as_read(self) :
         """
@@ -55,93 +210,415 @@ class DataFileStreamProcessor(ControlledProcessMultiThreaded,LogOwner,ConsumerGr
         Uses several parallel threads to consume message and process fully read files. 
         Returns the total number of messages read and a list of the fully processed filenames.
         """
-        msg = f'Will process files from messages in the {self.topic_name} topic using {self.n_threads} '
-        msg+= f'thread{"s" if self.n_threads>1 else ""}'
-        self.logger.info(msg)
-        lock = Lock()
-        self.run([(lock,self.consumers[i]) for i in range(self.n_threads)])
-        return self.__n_msgs_read, self.__processed_filepaths
+        msg = f'Will process files from messages in the {self.topic_name} topic using '
+        METRICS.gauge('openmsi_files_in_progress','Files partially read',
+                      function=lambda : len(self.in_progress_filepaths))
+        METRICS.gauge('openmsi_bytes_in_memory','Bytes of partially read files held in memory',
+                      function=lambda : self.n_bytes_in_memory)
+        if self.__worker_processes is not None :
+            msg+= f'{self.n_threads} worker processes with {self.__n_threads_per_process} '
+            msg+= f'thread{"s" if self.__n_threads_per_process>1 else ""} each'
+            self.logger.info(msg)
+            self.run([(i,) for i in range(self.n_threads)])
+        else :
+            msg+= f'{self.n_threads} thread{"s" if self.n_threads>1 else ""}'
+            if self.__processed_file_index_path is not None :
+                self.__processed_file_index = ProcessedFileIndex(self.__processed_file_index_path)
+            if self.__n_processing_workers>0 :
+                if len(self.__processors)==0 and self.pool_processing_function is None :
+                    errmsg = f'ERROR: {self.__class__.__name__} does not define a pool_processing_function '
+                    errmsg+= 'or have any processors registered, so its files cannot be processed in a pool of '
+                    errmsg+= 'separate processes!'
+                    self.logger.error(errmsg,ValueError)
+                self.__processing_pool = FileProcessingPool(self.__get_processors(),
+                                                            self.__n_processing_workers,
+                                                            self.__max_pending_files)
+                msg+= f' and a pool of {self.__n_processing_workers} process'
+                msg+= f'{"es" if self.__n_processing_workers>1 else ""} to process files'
+            self.logger.info(msg)
+            self.run([(self.__shards[i],self.consumers[i]) for i in range(self.n_threads)])
+        return self.n_msgs_read, self.processed_filepaths
 
     #################### PRIVATE HELPER FUNCTIONS ####################
 
-    @abstractmethod
     def _process_downloaded_data_file(self,datafile) :
         """
         Perform some operations on a given data file that has been fully read from the stream
         Returns None if processing was successful and an Exception otherwise
-        Not implemented in the base class
+        Not implemented in the base class (child classes should overload this or register processors instead)
+        """
+        errmsg = f'ERROR: {self.__class__.__name__} does not implement _process_downloaded_data_file '
+        errmsg+= 'and has no processors registered!'
+        return NotImplementedError(errmsg)
+
+    def _on_contiguous_data(self,datafile,offset,data) :
+        """
+        Called (if streams_data_in_order is True) whenever more of a file's data become available contiguously from 
+        the beginning of the file, even if the chunks arrived out of order, so that processing can start before 
+        the whole file is available. The data can't be trusted until _on_file_complete is called for the file.
+        datafile = the file being reconstructed
+        offset   = the offset in the file of the start of the new data
+        data     = a memoryview of the new data (only valid during this call; copy anything to keep; 
+                   read-only in Python 3.8+, and shouldn't be written to in any version)
+        Raising an exception stops the rest of the file's data from being passed to this function
+        Does nothing in the base class
+        """
+        pass
+
+    def _on_file_complete(self,datafile,hashes_match) :
+        """
+        Called (if streams_data_in_order is True) once every chunk of a file has been added and its hash has been 
+        checked, after all of its data have been passed to _on_contiguous_data and before it's processed
+        hashes_match = True if the reconstructed file's hash matched the original file's hash
+        Does nothing in the base class
         """
         pass
 
     def _on_check(self) :
-        msg = f'{self.__n_msgs_read} messages read, {len(self.__processed_filepaths)} files fully processed so far'
+        msg = f'{self.n_msgs_read} messages read, {len(self.processed_filepaths)} files fully processed so far'
+        self.logger.debug(msg)
+        msg = f'{self.n_bytes_in_memory} bytes of in-progress files held in memory '
+        msg+= f'(budget = {self.__max_memory_bytes} bytes), {self.n_files_spilled} in-progress '
+        msg+= f'file{"" if self.n_files_spilled==1 else "s"} spilled to disk'
         self.logger.debug(msg)
-        if len(self.__data_files_by_filepath)>0 or len(self.__processed_filepaths)>0 :
+        if len(self.in_progress_filepaths)>0 or len(self.processed_filepaths)>0 :
             self.logger.debug(self.progress_msg)
 
-    def _run_worker(self,lock,consumer) :
+    def _on_shutdown(self) :
+        super()._on_shutdown()
+        if self.__router is not None :
+            self.__router.join()
+        #remove the temporary files holding the data of any files that were spilled to disk and never finished
+        for shard in self.__shards :
+            for datafile in shard.data_files_by_path.values() :
+                datafile.close_spill_file()
+        if self.__processing_pool is not None :
+            self.__processing_pool.shutdown()
+        if self.__processed_file_index is not None :
+            self.__processed_file_index.close()
+
+    def _on_diagnostic_command(self,cmd) :
+        #the worker processes (if there are any) each write out or log their own diagnostics
+        super()._on_diagnostic_command(cmd)
+        if self.__worker_processes is not None :
+            self.__worker_processes.send_command(cmd)
+
+    def _get_state_sizes(self) :
+        return {'files being read':len(self.__get_in_progress_datafiles()),
+                'bytes of partially read files in memory':self.n_bytes_in_memory,
+                'files spilled to disk':self.n_files_spilled,
+                'chunks handed off between threads':sum([shard.queue.qsize() for shard in self.__shards]),
+                'files waiting to be processed':sum([shard.n_files_processing for shard in self.__shards]),
+               }
+
+    def _get_file_progress(self) :
+        return [(df.full_filepath,df.progress) for df in self.__get_in_progress_datafiles()]
+
+    def _on_scale(self,n_threads) :
+        if self.__worker_processes is not None :
+            errmsg = 'WARNING: the number of threads cannot be changed while running in several worker processes'
+            self.logger.warning(errmsg)
+            return
+        super()._on_scale(n_threads)
+
+    def _get_args_per_thread_after_scaling(self,n_threads) :
+        #move the files being read to the shards that own them now, and add or remove consumers
+        self.__router.resize(n_threads)
+        self.__shards = self.__router.shards
+        self.set_n_consumers(n_threads)
+        return [(self.__shards[i],self.consumers[i]) for i in range(n_threads)]
+
+    def _run_worker(self,*args) :
+        """
+        Supervise one of the worker processes if the work is split up between them, 
+        or otherwise consume messages and process files in this thread
+        Several iterations of this function run in parallel threads as part of a ControlledProcessMultiThreaded
+        """
+        if self.__worker_processes is not None :
+            self.__worker_processes.supervise(self,*args)
+        else :
+            self.__consume_and_process(*args)
+
+    def __consume_and_process(self,shard,consumer) :
         """
         Consume messages expected to be DataFileChunks and add their data to a file being reconstructed in memory, 
         paying attention to when each file has received all of its data and checking their contents against their 
         original hashes.
-        Several iterations of this function run in parallel threads as part of a ControlledProcessMultiThreaded
+        Chunks of files owned by other threads' shards are handed off to them, and chunks handed off by other 
+        threads are added in between consuming batches of messages
         """
         #start the loop for while the controlled process is alive
         while self.alive :
-            #consume a message from the topic
-            dfc = consumer.get_next_message(self.logger,0)
-            if dfc is None :
+            #consume a batch of messages from the topic, waiting a bit for them to arrive 
+            #(unless other threads have handed off chunks that should be added right away)
+            timeout = 0 if not shard.queue.empty() else RUN_OPT_CONST.CONSUMER_POLL_TIMEOUT
+            dfcs = consumer.get_next_messages(self.logger,RUN_OPT_CONST.CONSUMER_BATCH_SIZE,timeout)
+            shard.n_msgs_read+=len(dfcs)
+            for dfc in dfcs :
+                shard_i = self.__router.get_shard_index(dfc.filepath)
+                if shard_i==shard.index :
+                    self.__add_chunk(shard,dfc)
+                else :
+                    self.__router.hand_off(dfc,shard_i)
+            self.__handle_queued_items(shard)
+        #keep adding chunks handed off by other threads until they've all stopped too,
+        #and wait for any files still being processed in the pool
+        self.__router.set_finished(shard)
+        while (not self.__router.all_finished()) or shard.n_files_processing>0 :
+            self.__handle_queued_items(shard,RUN_OPT_CONST.CONSUMER_POLL_TIMEOUT)
+        self.__handle_queued_items(shard)
+
+    def __handle_queued_items(self,shard,timeout=None) :
+        """
+        Add the chunks handed off to the given (owned) shard by other threads, and handle the results of 
+        processing its files in the pool
+        """
+        for item in shard.get_items(timeout) :
+            if isinstance(item,ProcessingResult) :
+                shard.n_files_processing-=1
+                FILE_PROCESSING_SECS.observe(time.perf_counter()-item.submit_time)
+                short_filepath = item.full_filepath.relative_to((pathlib.Path()).resolve())
+                self.__on_file_processed(shard,item.filepath,short_filepath,item.get(),item.file_hash,
+                                         item.latency_trace)
+            else :
+                self.__add_chunk(shard,item)
+
+    def __add_chunk(self,shard,dfc) :
+        """
+        Add a single consumed DataFileChunk to the file that's being reconstructed in memory in the given 
+        (owned) shard, and process the file if it's been fully read
+        """
+        #set the chunk's rootdir to the current directory
+        if dfc.rootdir is not None :
+            errmsg = f'ERROR: message with key {dfc.message_key} has rootdir={dfc.rootdir} '
+            errmsg+= '(should be None as it was just consumed)! Will ignore this message and continue.'
+            self.logger.error(errmsg)
+        dfc.rootdir = (pathlib.Path()).resolve()
+        #drop the chunk without reconstructing anything if its file has already been processed
+        if self.__processed_file_index is not None and shard.skip_file(dfc.filepath,dfc.file_hash,
+                                                                        lambda : self.__already_processed(dfc)) :
+            return
+        #add the chunk's data to the file that's being reconstructed
+        if dfc.filepath not in shard.data_files_by_path.keys() :
+            shard.data_files_by_path[dfc.filepath] = self.__datafile_type(dfc.filepath,
+                                                                          logger=self.logger,
+                                                                          **self.other_datafile_kwargs)
+        datafile = shard.data_files_by_path[dfc.filepath]
+        return_value = datafile.add_chunk(dfc)
+        #pass along any of the file's data that are newly available in order
+        if self.streams_data_in_order and return_value!=DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE :
+            self.__stream_new_data(shard,dfc,datafile,return_value)
+        #if the message was consumed and everything is moving along fine
+        if return_value in (DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS,
+                            DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE) :
+            #mark the file as the most recently updated and spill files to disk if there are too many in memory
+            if return_value==DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS :
+                shard.data_files_by_path.move_to_end(dfc.filepath)
+                self.__enforce_memory_budget(shard)
+            return
+        #if the file hashes didn't match
+        elif return_value==DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE :
+            warnmsg = f'WARNING: file hashes for file {datafile.filename} '
+            warnmsg+= 'not matched after being fully read! This file will not be processed.'
+            self.logger.warning(warnmsg)
+            del shard.data_files_by_path[dfc.filepath]
+            shard.reorder_buffers.pop(dfc.filepath,None)
+            datafile.close_spill_file()
+        #if the file has had all of its messages read successfully
+        elif return_value==DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE :
+            short_filepath = datafile.full_filepath.relative_to(dfc.rootdir)
+            del shard.data_files_by_path[dfc.filepath]
+            shard.reorder_buffers.pop(dfc.filepath,None)
+            try :
+                self.__process_complete_file(shard,dfc,datafile,short_filepath)
+            finally :
+                datafile.close_spill_file()
+
+    def __process_complete_file(self,shard,dfc,datafile,short_filepath) :
+        """
+        Run the processors on a file in the given (owned) shard that's been fully read, 
+        or hand it off to the pool to be processed if there is one
+        """
+        #only run the processors that haven't already processed a file with the same contents
+        processors = self.__get_processors()
+        if self.__processed_file_index is not None :
+            already_processed = self.__processed_file_index.get_processed(dfc.file_hash,
+                                                                          self.__get_processor_keys(processors),
+                                                                          self.processor_version)
+            processors = {name:processor for name,processor in processors.items() 
+                          if self.__get_processor_key(name) not in already_processed}
+            #(another file with the same contents may have been processed while this one was being read)
+            if len(processors)==0 :
+                msg = f'Skipping processing {short_filepath} because a file with the same contents '
+                msg+= 'has already been processed'
+                self.logger.info(msg)
+                shard.add_skipped_file(dfc.filepath,dfc.file_hash)
+                return
+        #hand the file off to the pool to be processed if there is one
+        if self.__processing_pool is not None :
+            self.logger.info(f'Submitting {short_filepath} to be processed...')
+            shard.n_files_processing+=1
+            self.__processing_pool.submit(dfc.filepath,datafile,self.other_datafile_kwargs,shard.queue.put,
+                                          file_hash=dfc.file_hash,processor_names=list(processors.keys()))
+            return
+        msg = f'Processing {short_filepath}...'
+        self.logger.info(msg)
+        results = {}
+        start_time = time.perf_counter()
+        for name,(function,kwargs) in processors.items() :
+            try :
+                results[name] = (function(datafile,**kwargs),None)
+            except Exception as e :
+                results[name] = (e,traceback.format_exc())
+        FILE_PROCESSING_SECS.observe(time.perf_counter()-start_time)
+        self.__on_file_processed(shard,dfc.filepath,short_filepath,results,dfc.file_hash,datafile.latency_trace)
+
+    def __already_processed(self,dfc) :
+        """
+        Return True if the file that the given chunk belongs to has already been processed by every processor
+        (according to the index of processed files)
+        """
+        processor_keys = self.__get_processor_keys(self.__get_processors())
+        already_processed = self.__processed_file_index.get_processed(dfc.file_hash,processor_keys,
+                                                                      self.processor_version)
+        if len(already_processed)<len(processor_keys) :
+            return False
+        previous_filepath = self.__processed_file_index.get_filepath(dfc.file_hash,processor_keys[0],
+                                                                     self.processor_version)
+        msg = f'Skipping {dfc.filepath} because a file with the same contents ({previous_filepath}) '
+        msg+= 'has already been processed'
+        self.logger.info(msg)
+        return True
+
+    def __get_processor_key(self,name) :
+        """
+        Return the key identifying the processor with the given name in the index of processed files
+        """
+        return f'{self.__class__.__name__}/{name}'
+
+    def __get_processor_keys(self,processors) :
+        """
+        Return a list of the keys identifying the given processors in the index of processed files
+        """
+        return [self.__get_processor_key(name) for name in processors.keys()]
+
+    def __stream_new_data(self,shard,dfc,datafile,return_value) :
+        """
+        Pass any of a file's data that became available in order when the given chunk was added to 
+        _on_contiguous_data, and call _on_file_complete if the file is done
+        """
+        if dfc.filepath not in shard.reorder_buffers.keys() :
+            shard.reorder_buffers[dfc.filepath] = ReorderBuffer()
+        reorder_buffer = shard.reorder_buffers[dfc.filepath]
+        #the reorder buffer is set to None if the subclass stopped streaming this file
+        if reorder_buffer is not None :
+            start, end = reorder_buffer.add(dfc.chunk_offset_write,len(dfc.data))
+            if end>start :
+                file_data = datafile.data_memoryview
+                data = file_data[start:end]
+                #(memoryviews can only be made read-only in Python 3.8+)
+                if hasattr(data,'toreadonly') :
+                    data = data.toreadonly()
+                try :
+                    self._on_contiguous_data(datafile,start,data)
+                except Exception :
+                    self.logger.info(traceback.format_exc())
+                    warnmsg = f'WARNING: streaming data from {dfc.filepath} failed at offset {start}. '
+                    warnmsg+= 'The rest of its data will not be streamed, but it will still be processed once complete.'
+                    self.logger.warning(warnmsg)
+                    shard.reorder_buffers[dfc.filepath] = None
+                finally :
+                    #release the views so the buffer underneath them can still be resized
+                    data.release()
+                    file_data.release()
+        if return_value in (DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE,
+                            DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE) :
+            hashes_match = return_value==DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE
+            try :
+                self._on_file_complete(datafile,hashes_match)
+            except Exception :
+                self.logger.info(traceback.format_exc())
+                self.logger.warning(f'WARNING: _on_file_complete failed for {dfc.filepath}!')
+
+    def __get_processors(self) :
+        """
+        Return a dictionary of the processors to run on each file (name -> (function, kwargs)): the registered 
+        processors if there are any, or otherwise just the processing function defined by this class
+        """
+        if len(self.__processors)>0 :
+            return self.__processors
+        if self.__n_processing_workers>0 :
+            return {self.__class__.__name__:(self.pool_processing_function,self.other_processing_kwargs)}
+        return {self.__class__.__name__:(self._process_downloaded_data_file,{})}
+
+    def __on_file_processed(self,shard,filepath,short_filepath,results,file_hash,latency_trace=None) :
+        """
+        Record a file in the given (owned) shard as processed if every processor was successful,
+        and log what went wrong otherwise
+        results       = a dictionary of (return value, formatted traceback or None) tuples keyed by processor name
+        file_hash     = the hash of the file's contents, to record the successful processors in the index
+        latency_trace = the file's FileLatencyTrace, to report how long it took to get through each stage
+        """
+        failed_names = []
+        for name,(processing_retval,tb) in results.items() :
+            if processing_retval is None :
                 continue
-            #set the chunk's rootdir to the current directory
-            if dfc.rootdir is not None :
-                errmsg = f'ERROR: message with key {dfc.message_key} has rootdir={dfc.rootdir} '
-                errmsg+= '(should be None as it was just consumed)! Will ignore this message and continue.'
-                self.logger.error(errmsg)
-            dfc.rootdir = (pathlib.Path()).resolve()
-            #add the chunk's data to the file that's being reconstructed
-            with lock :
-                self.__n_msgs_read+=1
-                if dfc.filepath not in self.__data_files_by_filepath.keys() :
-                    self.__data_files_by_filepath[dfc.filepath] = self.__datafile_type(dfc.filepath,
-                                                                                           logger=self.logger,
-                                                                                           **self.other_datafile_kwargs)
-                    self.__thread_locks[dfc.filepath] = Lock()
-            return_value = self.__data_files_by_filepath[dfc.filepath].add_chunk(dfc,self.__thread_locks[dfc.filepath])
-            #if the message was consumed and everything is moving along fine
-            if return_value in (DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS,
-                                DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE) :
+            failed_names.append(name)
+            if tb is not None :
+                self.logger.info(tb)
+            elif isinstance(processing_retval,Exception) :
+                try :
+                    raise processing_retval
+                except Exception :
+                    self.logger.info(traceback.format_exc())
+            else :
+                self.logger.error(f'Return value from {name} processing = {processing_retval}')
+        #record the processors that succeeded in the index so they won't run on the same contents again
+        succeeded_names = [name for name in results.keys() if name not in failed_names]
+        if self.__processed_file_index is not None and len(succeeded_names)>0 :
+            self.__processed_file_index.record(file_hash,[self.__get_processor_key(n) for n in succeeded_names],
+                                               self.processor_version,filepath)
+        #if it was able to be processed
+        if len(failed_names)==0 :
+            self.logger.info(f'Fully-read file {short_filepath} successfully processed')
+            shard.completed_filepaths.append(filepath)
+            N_FILES_PROCESSED.inc()
+            if latency_trace is not None :
+                latency_trace.set_processed()
+                latency_trace.report(short_filepath,self.logger)
+        #warn if it wasn't processed correctly
+        else :
+            errmsg = f'ERROR: Fully-read file {short_filepath} was not able to be processed'
+            if len(results)>1 :
+                errmsg+= f' by {", ".join(failed_names)}'
+            errmsg+= '. Check log lines above for more details on the specific error. '
+            errmsg+= 'The messages for this file will need to be consumed again if the file is to be processed!'
+            self.logger.warning(errmsg)
+            N_FILES_PROCESSING_FAILED.inc()
+
+    def __enforce_memory_budget(self,shard) :
+        """
+        Spill in-progress files in the given (owned) shard to disk, starting from the least recently updated, 
+        until the total size of the shard's data held in memory is within its share of the budget
+        """
+        if self.__max_memory_bytes is None :
+            return
+        max_shard_bytes = self.__max_memory_bytes//self.__router.n_total_shards
+        n_bytes_in_memory = sum([df.n_bytes_in_memory for df in shard.data_files_by_path.values()])
+        for filepath,datafile in shard.data_files_by_path.items() :
+            if n_bytes_in_memory<=max_shard_bytes :
+                break
+            n_bytes = datafile.n_bytes_in_memory
+            if n_bytes==0 :
                 continue
-            #if the file hashes didn't match
-            elif return_value==DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE :
-                warnmsg = f'WARNING: file hashes for file {self.__data_files_by_filepath[dfc.filepath].filename} '
-                warnmsg+= 'not matched after being fully read! This file will not be processed.'
-                self.logger.warning(warnmsg)
-                with lock :
-                    del self.__data_files_by_filepath[dfc.filepath]
-                    del self.__thread_locks[dfc.filepath]
-            #if the file has had all of its messages read successfully
-            elif return_value==DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE :
-                short_filepath = self.__data_files_by_filepath[dfc.filepath].full_filepath.relative_to(dfc.rootdir)
-                msg = f'Processing {short_filepath}...'
-                self.logger.info(msg)
-                processing_retval = self._process_downloaded_data_file(self.__data_files_by_filepath[dfc.filepath])
-                #if it was able to be processed
-                if processing_retval is None :
-                    self.logger.info(f'Fully-read file {short_filepath} successfully processed')
-                    self.__processed_filepaths.append(dfc.filepath)
-                #warn if it wasn't processed correctly
-                else :
-                    if isinstance(processing_retval,Exception) :
-                        try :
-                            raise processing_retval
-                        except Exception :
-                            self.logger.info(traceback.format_exc())
-                    else :
-                        self.logger.error(f'Return value from _process_downloaded_data_file = {processing_retval}')
-                    errmsg = f'ERROR: Fully-read file {short_filepath} was not able to be processed. '
-                    errmsg+= 'Check log lines above for more details on the specific error. '
-                    errmsg+= 'The messages for this file will need to be consumed again if the file is to be processed!'
-                    self.logger.warning(errmsg)
-                with lock :
-                    del self.__data_files_by_filepath[dfc.filepath]
-                    del self.__thread_locks[dfc.filepath]
+            datafile.spill_to_disk(self.__spill_dir)
+            n_bytes_in_memory-=n_bytes
+            msg = f'Spilled {n_bytes} bytes of in-progress file {filepath} to disk to stay within the memory budget'
+            self.logger.debug(msg)
+
+    def __get_in_progress_datafiles(self) :
+        """
+        Return a list of the files currently being reconstructed by all of the worker threads
+        (safe to call from threads other than the workers)
+        """
+        return [df for shard in self.__shards for df in shard.get_data_files_snapshot().values()]
@@ -5,6 +5,7 @@ from queue import Queue
 from ..utilities.runnable import Runnable
 from ..utilities.controlled_process import ControlledProcessSingleThread
 from ..utilities.misc import populated_kwargs
+from ..utilities.metrics import METRICS
 from ..my_kafka.my_producers import MySerializingProducer
 from .utilities import produce_from_queue_of_file_chunks
 from .config import RUN_OPT_CONST
@@ -89,15 +90,17 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
             msg+='files in '
         msg+=f'{self.dirpath} to the {topic_name} topic using {kwargs["n_threads"]} threads'
         self.logger.info(msg)
+        self.__topic_name = topic_name
         self.__upload_queue = Queue(kwargs['max_queue_size'])
         self.__upload_threads = []
+        #the number of upload threads that have been sent a "None" to stop after a "scale N" command
+        self.__n_upload_threads_stopping = 0
         for ti in range(kwargs['n_threads']) :
-            t = Thread(target=produce_from_queue_of_file_chunks,args=(self.__upload_queue,
-                                                                      self.__producer,
-                                                                      topic_name,
-                                                                      self.logger))
-            t.start()
-            self.__upload_threads.append(t)
+            self.__start_upload_thread()
+        METRICS.gauge('openmsi_upload_queue_size','File chunks waiting in the upload queue',
+                      function=self.__upload_queue.qsize)
+        METRICS.gauge('openmsi_upload_threads','Threads producing file chunks from the upload queue',
+                      function=self.__get_n_upload_threads)
         #loop until the user inputs a command to stop
         self.run()
         #return a list of filepaths that have been uploaded
@@ -120,6 +123,8 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
     #################### PRIVATE HELPER FUNCTIONS ####################
 
     def _run_iteration(self) :
+        #forget about any upload threads that have stopped after a "scale N" command
+        self.__prune_upload_threads()
         #check for new files in the directory if we haven't already found some to run
         if not self.have_file_to_upload :
             self.__find_new_files()
@@ -127,9 +132,11 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
         for datafile in self.data_files_by_path.values() :
             if datafile.upload_in_progress or datafile.waiting_to_upload :
                 datafile.add_chunks_to_upload_queue(self.__upload_queue,
-                                                    n_threads=len(self.__upload_threads),
+                                                    n_threads=self.__get_n_upload_threads(),
                                                     chunk_size=self.__chunk_size)
-                return
+                return True
+        #if there's nothing to upload, wait a bit before looking for new files again
+        return False
 
     def _on_check(self) :
         #log progress so far
@@ -148,17 +155,66 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
             for datafile in self.data_files_by_path.values() :
                 if datafile.upload_in_progress :
                     datafile.add_chunks_to_upload_queue(self.__upload_queue,
-                                                        n_threads=len(self.__upload_threads),
+                                                        n_threads=self.__get_n_upload_threads(),
                                                         chunk_size=self.__chunk_size)
                     break
         #stop the uploading threads by adding "None"s to their queues and joining them
-        for ut in self.__upload_threads :
+        for ti in range(self.__get_n_upload_threads()) :
             self.__upload_queue.put(None)
         for ut in self.__upload_threads :
             ut.join()
         self.logger.info('Waiting for all enqueued messages to be delivered (this may take a moment)....')
         self.__producer.flush() #don't move on until all enqueued messages have been sent/received
 
+    def _on_scale(self,n_threads) :
+        """
+        Change the number of threads producing messages from the upload queue: new threads are started right away, 
+        and threads to remove are each sent a "None" through the queue, so they stop cleanly once everything 
+        enqueued before it has been produced
+        """
+        self.__prune_upload_threads()
+        n_running = self.__get_n_upload_threads()
+        for ti in range(n_threads-n_running) :
+            self.__start_upload_thread()
+        for ti in range(n_running-n_threads) :
+            self.__upload_queue.put(None)
+            self.__n_upload_threads_stopping+=1
+        self.logger.info(f'Uploading using {n_threads} threads (was {n_running})')
+
+    def _get_state_sizes(self) :
+        return {'files recognized':len(self.data_files_by_path),
+                'file chunks waiting to be enqueued':sum([len(df.chunks_to_upload) 
+                                                          for df in self.data_files_by_path.values()]),
+                'file chunks in the upload queue':self.__upload_queue.qsize(),
+               }
+
+    def _get_file_progress(self) :
+        return [(df.filepath.relative_to(self.dirpath),df.upload_progress) for df in self.data_files_by_path.values() 
+                if df.upload_in_progress or df.waiting_to_upload]
+
+    def __get_n_upload_threads(self) :
+        #the number of upload threads that are running and haven't been told to stop
+        return len(self.__upload_threads)-self.__n_upload_threads_stopping
+
+    def __start_upload_thread(self) :
+        target = produce_from_queue_of_file_chunks
+        if self.profiler is not None :
+            target = self.profiler.wrap(target)
+        t = Thread(target=target,args=(self.__upload_queue,
+                                       self.__producer,
+                                       self.__topic_name,
+                                       self.logger))
+        t.start()
+        self.__upload_threads.append(t)
+
+    def __prune_upload_threads(self) :
+        #join and forget about upload threads that have stopped after being sent a "None"
+        stopped_threads = [t for t in self.__upload_threads if not t.is_alive()]
+        for t in stopped_threads :
+            t.join()
+            self.__upload_threads.remove(t)
+        self.__n_upload_threads_stopping-=len(stopped_threads)
+
     def __find_new_files(self,to_upload=True) :
         """
         Search the directory for any unrecognized files and add them to _data_files_by_path
@@ -194,7 +250,8 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
 
     @classmethod
     def get_command_line_arguments(cls) :
-        args = ['upload_dir','config','topic_name','chunk_size','queue_max_size','update_seconds','new_files_only']
+        args = ['upload_dir','config','topic_name','chunk_size','queue_max_size','update_seconds','new_files_only',
+                'control_socket','metrics_port']
         kwargs = {'n_threads':RUN_OPT_CONST.N_DEFAULT_UPLOAD_THREADS}
         return args, kwargs
 
@@ -206,7 +263,8 @@ class DataFileUploadDirectory(DataFileDirectory,ControlledProcessSingleThread,Ru
         parser = cls.get_argument_parser()
         args = parser.parse_args(args=args)
         #make the DataFileDirectory for the specified directory
-        upload_file_directory = cls(args.upload_dir,update_secs=args.update_seconds)
+        upload_file_directory = cls(args.upload_dir,update_secs=args.update_seconds,control_socket=args.control_socket,
+                                    metrics_port=args.metrics_port,**cls.get_profiling_kwargs(args))
         #listen for new files in the directory and run uploads as they come in until the process is shut down
         run_start = datetime.datetime.now()
         if args.new_files_only :
@@ -1,10 +1,32 @@
 #imports
-import os
+import os, mmap, tempfile, time, msgpack
+import numpy as np
+try :
+    from multiprocessing import shared_memory
+except ImportError : #(Python 3.7; complete files are sent to other processes as pickled bytes instead)
+    shared_memory = None
+from io import RawIOBase
 from hashlib import sha512
 from contextlib import nullcontext
 from abc import ABC, abstractmethod
 from .config import DATA_FILE_HANDLING_CONST
 from .data_file import DataFile
+from .chunk_bitmap import ChunkBitmap
+from .file_latency_trace import FileLatencyTrace
+from ..utilities.metrics import METRICS
+
+#metrics
+N_CHUNKS_WRITTEN = METRICS.counter('openmsi_chunks_written_total','File chunks added to files being reconstructed')
+N_BYTES_WRITTEN = METRICS.counter('openmsi_bytes_written_total',
+                                  'Bytes of file chunks added to files being reconstructed')
+N_FILES_COMPLETED = METRICS.counter('openmsi_files_completed_total',
+                                    'Files fully reconstructed with contents matching their original hashes')
+N_FILES_MISMATCHED = METRICS.counter('openmsi_files_mismatched_total',
+                                     'Files fully reconstructed with contents not matching their original hashes')
+CHUNK_WRITE_SECS = METRICS.histogram('openmsi_chunk_write_seconds',
+                                     'Time taken to add each chunk to the file being reconstructed')
+HASH_CHECK_SECS = METRICS.histogram('openmsi_file_hash_check_seconds',
+                                    'Time taken to check the hash of each fully reconstructed file')
 
 class DownloadDataFile(DataFile,ABC) :
     """
@@ -26,6 +48,17 @@ class DownloadDataFile(DataFile,ABC) :
     @property
     def full_filepath(self) :
         return self.__full_filepath
+    @property
+    def n_chunks_downloaded(self) :
+        return 0 if self._chunks_downloaded is None else self._chunks_downloaded.n_chunks_set
+    @property
+    def progress(self) :
+        if self._chunks_downloaded is None :
+            return 0.
+        return self.n_chunks_downloaded/self._chunks_downloaded.n_total_chunks #the fraction of chunks added so far
+    @property
+    def latency_trace(self) :
+        return self.__latency_trace #the times at which this file reached each stage of being uploaded/reconstructed
 
     @property
     @abstractmethod
@@ -34,9 +67,10 @@ class DownloadDataFile(DataFile,ABC) :
 
     def __init__(self,*args,**kwargs) :
         super().__init__(*args,**kwargs)
-        #start an empty set of this file's downloaded offsets
-        self._chunk_offsets_downloaded = []
+        #the bitmap of this file's downloaded chunks (created when the first chunk is added)
+        self._chunks_downloaded = None
         self.__full_filepath = None
+        self.__latency_trace = FileLatencyTrace()
 
     def add_chunk(self,dfc,thread_lock=nullcontext(),*args,**kwargs) :
         """
@@ -49,9 +83,11 @@ class DownloadDataFile(DataFile,ABC) :
         thread_lock = the lock object to acquire/release so that race conditions don't affect 
                       reconstruction of the files (optional, only needed if running this function asynchronously)
         """
-        #if this chunk's offset has already been written to disk, return the "already written" code
+        #if this chunk has already been written to disk, return the "already written" code
         with thread_lock :
-            already_written = dfc.chunk_offset_write in self._chunk_offsets_downloaded
+            if self._chunks_downloaded is None :
+                self._chunks_downloaded = self._get_initial_chunk_bitmap(dfc)
+            already_written = dfc.chunk_i in self._chunks_downloaded
         if already_written :
             return DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE
         #the filepath of this DownloadDataFile and of the given DataFileChunk must match
@@ -59,6 +95,11 @@ class DownloadDataFile(DataFile,ABC) :
             errmsg = f'ERROR: filepath mismatch between data file chunk with {dfc.filepath} and '
             errmsg+= f'data file with {self.filepath}'
             self.logger.error(errmsg,ValueError)
+        #the total number of chunks must match what's already expected for the file
+        if dfc.n_total_chunks!=self._chunks_downloaded.n_total_chunks :
+            errmsg = f'ERROR: data file chunk {dfc.chunk_i} for {self.filepath} says the file has '
+            errmsg+= f'{dfc.n_total_chunks} chunks but {self._chunks_downloaded.n_total_chunks} are expected'
+            self.logger.error(errmsg,ValueError)
         #modify the filepath to include any append to the name
         full_filepath = self.__class__.get_full_filepath(dfc)
         if self.__full_filepath is None :
@@ -71,20 +112,50 @@ class DownloadDataFile(DataFile,ABC) :
             self.logger.error(errmsg,ValueError)
         #acquire the thread lock to make sure this process is the only one dealing with this particular file
         with thread_lock:
+            #another thread may have added the same chunk in the meantime
+            if dfc.chunk_i in self._chunks_downloaded :
+                return DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE
             #call the function to actually add the chunk
+            start_time = time.perf_counter()
             self._on_add_chunk(dfc,*args,**kwargs)
-            #add the offset of the added chunk to the set of reconstructed file chunks
-            self._chunk_offsets_downloaded.append(dfc.chunk_offset_write)
-            last_chunk = len(self._chunk_offsets_downloaded)==dfc.n_total_chunks
+            CHUNK_WRITE_SECS.observe(time.perf_counter()-start_time)
+            N_CHUNKS_WRITTEN.inc()
+            N_BYTES_WRITTEN.inc(dfc.chunk_size)
+            self.__latency_trace.add_chunk(dfc)
+            #add the index of the added chunk to the bitmap of reconstructed file chunks
+            self._chunks_downloaded.add(dfc.chunk_i)
+            last_chunk = self._chunks_downloaded.complete
         #if this chunk was the last that needed to be added, check the hashes
         if last_chunk :
-            if self.check_file_hash!=dfc.file_hash :
+            start_time = time.perf_counter()
+            hashes_match = self.check_file_hash==dfc.file_hash
+            HASH_CHECK_SECS.observe(time.perf_counter()-start_time)
+            self.__latency_trace.set_completed()
+            self._on_reconstruction_complete(hashes_match)
+            if not hashes_match :
+                N_FILES_MISMATCHED.inc()
                 return DATA_FILE_HANDLING_CONST.FILE_HASH_MISMATCH_CODE
             else :
+                N_FILES_COMPLETED.inc()
                 return DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE
         else :
             return DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS
 
+    def _get_initial_chunk_bitmap(self,dfc) :
+        """
+        Return the bitmap to use to keep track of which chunks have been added, given the first chunk being added
+        Starts from nothing in the base class, but can be overridden to start from some saved state
+        """
+        return ChunkBitmap(dfc.n_total_chunks)
+
+    def _on_reconstruction_complete(self,hashes_match) :
+        """
+        A function to run once every chunk of the file has been added and its hash has been checked
+        hashes_match = True if the reconstructed file's hash matched the original file's hash
+        Does nothing in the base class
+        """
+        pass
+
     @abstractmethod
     def _on_add_chunk(dfc,*args,**kwargs) :
         """
@@ -98,68 +169,342 @@ class DownloadDataFile(DataFile,ABC) :
 class DownloadDataFileToDisk(DownloadDataFile) :
     """
     Class to represent a data file that will be reconstructed on disk using messages read from a topic
+    The file is reconstructed under a hidden temporary name (preallocated to its full size if the size is known), 
+    and only moved to its final location once its hash has been checked.
+    The chunks that have been written can be periodically checkpointed to a file alongside the file being 
+    reconstructed, so that a process that is restarted can pick up where it left off
     """
 
+    @staticmethod
+    def get_partial_filepath(full_filepath) :
+        """
+        Return the path to the temporary file in which a file at the given path is reconstructed
+        """
+        return full_filepath.parent/f'.{full_filepath.name}{DATA_FILE_HANDLING_CONST.PARTIAL_FILE_EXT}'
+
+    @staticmethod
+    def get_checkpoint_filepath(full_filepath) :
+        """
+        Return the path to the checkpoint file for a file being reconstructed at the given path
+        """
+        return full_filepath.parent/f'.{full_filepath.name}{DATA_FILE_HANDLING_CONST.CHECKPOINT_FILE_EXT}'
+
     @property
     def check_file_hash(self) :
         check_file_hash = sha512()
-        with open(self.full_filepath,'rb') as fp :
-            data = fp.read()
-        check_file_hash.update(data)
+        with open(self.partial_filepath,'rb') as fp :
+            data = fp.read(DATA_FILE_HANDLING_CONST.HASH_READ_SIZE)
+            while len(data)>0 :
+                check_file_hash.update(data)
+                data = fp.read(DATA_FILE_HANDLING_CONST.HASH_READ_SIZE)
         return check_file_hash.digest()
+    @property
+    def partial_filepath(self) :
+        if self.full_filepath is None :
+            return None
+        return self.__class__.get_partial_filepath(self.full_filepath)
+    @property
+    def checkpoint_filepath(self) :
+        if self.full_filepath is None :
+            return None
+        return self.__class__.get_checkpoint_filepath(self.full_filepath)
 
     def __init__(self,*args,**kwargs) :
         super().__init__(*args,**kwargs)
         #create the parent directory of the file if it doesn't exist yet (in case the file is in a new subdirectory)
         if not self.filepath.parent.is_dir() :
             self.filepath.parent.mkdir(parents=True)
+        #the hash of the original file (set when the first chunk is added)
+        self.__file_hash = None
+        #whether data have been written to the file since it was last flushed to disk
+        self.__needs_fsync = False
+
+    def write_checkpoint(self) :
+        """
+        Flush everything written to the file so far to disk, and then save the bitmap of the chunks it contains 
+        alongside it so the reconstruction can be resumed later. Does nothing if the file is already complete.
+        This function should be called with the thread lock passed to add_chunk acquired (if there is one)
+        """
+        if self._chunks_downloaded is None or self._chunks_downloaded.complete :
+            return
+        self.__fsync()
+        checkpoint_bytes = msgpack.packb([self.__file_hash,self._chunks_downloaded.to_bytes()],use_bin_type=True)
+        temp_filepath = self.checkpoint_filepath.with_name(f'{self.checkpoint_filepath.name}.tmp')
+        with open(temp_filepath,'wb') as fp :
+            fp.write(checkpoint_bytes)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp_filepath,self.checkpoint_filepath)
+
+    def _get_initial_chunk_bitmap(self,dfc) :
+        """
+        Start from the bitmap in this file's checkpoint if there is a valid one, or from nothing otherwise
+        """
+        self.__file_hash = dfc.file_hash
+        full_filepath = self.__class__.get_full_filepath(dfc)
+        checkpoint_filepath = self.__class__.get_checkpoint_filepath(full_filepath)
+        partial_filepath = self.__class__.get_partial_filepath(full_filepath)
+        if checkpoint_filepath.is_file() and partial_filepath.is_file() :
+            try :
+                file_hash, bitmap_bytes = msgpack.unpackb(checkpoint_filepath.read_bytes(),raw=False)
+                bitmap = ChunkBitmap.from_bytes(bitmap_bytes)
+                if file_hash==dfc.file_hash and bitmap.n_total_chunks==dfc.n_total_chunks :
+                    msg = f'Resuming reconstruction of {full_filepath} from a checkpoint with '
+                    msg+= f'{bitmap.n_chunks_set}/{bitmap.n_total_chunks} chunks already written'
+                    self.logger.info(msg)
+                    return bitmap
+            except Exception as e :
+                warnmsg = f'WARNING: failed to read checkpoint file {checkpoint_filepath} and it will be ignored. '
+                warnmsg+= f'Error: {e}'
+                self.logger.warning(warnmsg)
+        return super()._get_initial_chunk_bitmap(dfc)
 
     def _on_add_chunk(self,dfc) :
         """
         Add the data from a given file chunk to this file on disk
+        (the data are flushed to disk in write_checkpoint and when the file is complete)
         """
-        mode = 'r+b' if self.full_filepath.is_file() else 'w+b'
-        with open(self.full_filepath,mode) as fp :
+        if self.partial_filepath.is_file() :
+            mode = 'r+b'
+        else :
+            mode = 'w+b'
+        with open(self.partial_filepath,mode) as fp :
+            #allocate space for the whole file at once when it's first created, if its size is known
+            if mode=='w+b' and dfc.file_size is not None and dfc.file_size>0 :
+                self.__preallocate(fp,dfc.file_size)
             fp.seek(dfc.chunk_offset_write)
             fp.write(dfc.data)
-            fp.flush()
+        self.__needs_fsync = True
+
+    def _on_reconstruction_complete(self,hashes_match) :
+        """
+        Flush the complete file to disk and remove its checkpoint file, 
+        then move it to its final location if its hash matched the original
+        """
+        self.__fsync()
+        if self.checkpoint_filepath.is_file() :
+            self.checkpoint_filepath.unlink()
+        if hashes_match :
+            os.replace(self.partial_filepath,self.full_filepath)
+
+    def __fsync(self) :
+        """
+        Make sure any data written to the file are flushed to disk
+        """
+        if not self.__needs_fsync :
+            return
+        with open(self.partial_filepath,'r+b') as fp :
             os.fsync(fp.fileno())
-            fp.close()
+        self.__needs_fsync = False
+
+    def __preallocate(self,fp,file_size) :
+        """
+        Set the size of a newly-created file on disk, reserving its space all at once if the OS can
+        """
+        if hasattr(os,'posix_fallocate') :
+            try :
+                os.posix_fallocate(fp.fileno(),0,file_size)
+                return
+            except OSError :
+                pass
+        os.ftruncate(fp.fileno(),file_size)
+
+class MemoryviewReader(RawIOBase) :
+    """
+    A read-only binary file-like object reading from a buffer without copying it (like a BytesIO that doesn't 
+    hold its own copy of the data), so that code expecting a file can read file data that are held in memory
+    The buffer can't be resized or closed until the reader is closed
+    """
+
+    def __init__(self,buffer) :
+        """
+        buffer = any object supporting the buffer protocol (bytes, bytearray, mmap, memoryview, etc.)
+        """
+        super().__init__()
+        self.__view = memoryview(buffer).cast('B')
+        self.__position = 0
+
+    def readable(self) :
+        return True
+
+    def seekable(self) :
+        return True
+
+    def readinto(self,b) :
+        n_bytes = max(min(len(b),len(self.__view)-self.__position),0)
+        b[:n_bytes] = self.__view[self.__position:self.__position+n_bytes]
+        self.__position+=n_bytes
+        return n_bytes
+
+    def seek(self,offset,whence=os.SEEK_SET) :
+        if whence==os.SEEK_SET :
+            position = offset
+        elif whence==os.SEEK_CUR :
+            position = self.__position+offset
+        elif whence==os.SEEK_END :
+            position = len(self.__view)+offset
+        else :
+            raise ValueError(f'ERROR: invalid whence ({whence}) in call to seek!')
+        if position<0 :
+            raise ValueError(f'ERROR: negative seek position {position}!')
+        self.__position = position
+        return self.__position
+
+    def tell(self) :
+        return self.__position
+
+    def close(self) :
+        if not self.closed :
+            self.__view.release()
+        super().close()
 
 class DownloadDataFileToMemory(DownloadDataFile) :
     """
     Class to represent a data file that will be held in memory and populated by the contents of messages from a topic
+    Each chunk's data are copied into a single buffer at their offset as they arrive (the buffer is allocated 
+    to the full size of the file when the first chunk arrives if the size is known)
+    A file that's in progress can be "spilled" to a temporary file on disk to free up memory; its data will 
+    be memory-mapped back from that file when they are needed
+    A complete file's data can also be moved into a block of shared memory so that other processes can read them
     """
 
     @property
     def bytestring(self) :
-        if self.__bytestring is None :
-            self.__create_bytestring()
-        return self.__bytestring
+        #the file data as a bytearray, or an mmap if spilled to disk, or a memoryview of shared memory (not a copy)
+        return self.__get_buffer()
+    @property
+    def data_memoryview(self) :
+        return memoryview(self.__get_buffer()) #a memoryview of the file data (not a copy)
+    @property
+    def data_array(self) :
+        return np.frombuffer(self.__get_buffer(),dtype=np.uint8) #a NumPy array of the file's bytes (not a copy)
+    @property
+    def data_reader(self) :
+        return MemoryviewReader(self.__get_buffer()) #a new file-like object reading the file data (not a copy; 
+                                                      #close it when done so the buffer can be released)
     @property
     def check_file_hash(self) :
         check_file_hash = sha512()
-        check_file_hash.update(self.bytestring)
+        check_file_hash.update(self.__get_buffer())
         return check_file_hash.digest()
+    @property
+    def spilled(self) :
+        return self.__spill_file is not None #whether this file's data have been moved to a temporary file on disk
+    @property
+    def n_bytes_in_memory(self) :
+        if self.spilled or self.__shared_memory is not None :
+            return 0
+        return len(self.__buffer) #the size of the data held in memory (not shared) for this file
 
     def __init__(self,*args,**kwargs) :
         super().__init__(*args,**kwargs)
-        #start a dictionary of the file data by their offsets
-        self.__chunk_data_by_offset = {}
-        #placeholder for the eventual full data bytestring
-        self.__bytestring = None
+        #the buffer holding the file data
+        self.__buffer = bytearray()
+        #the temporary file holding the data after they've been spilled to disk, and the mmap of it
+        self.__spill_file = None
+        self.__spill_mmap = None
+        #the block of shared memory holding the data instead, and the number of bytes in it that belong to this file
+        self.__shared_memory = None
+        self.__n_shared_bytes = 0
+
+    def spill_to_disk(self,dirpath=None) :
+        """
+        Move the data held in memory for this file to a temporary file on disk (in dirpath if it's given)
+        Any chunks added afterward will be written to the temporary file instead
+        This function should be called with the thread lock passed to add_chunk acquired (if there is one)
+        """
+        if self.spilled :
+            return
+        self.__spill_file = tempfile.TemporaryFile(dir=dirpath)
+        self.__spill_file.write(self.__buffer)
+        self.__spill_file.flush()
+        self.__buffer = None
+
+    def move_to_shared_memory(self) :
+        """
+        Copy this file's data into a new block of shared memory, free the copy held here, and return 
+        the SharedMemory object (its name can be passed to another process calling use_shared_memory)
+        The caller is responsible for closing and unlinking the block when it's done with it
+        No more chunks should be added to the file afterward
+        """
+        buffer = self.__get_buffer()
+        n_bytes = len(buffer)
+        shm = shared_memory.SharedMemory(create=True,size=max(n_bytes,1))
+        shm.buf[:n_bytes] = buffer
+        self.close_spill_file()
+        self.__buffer = None
+        self.use_shared_memory(shm,n_bytes)
+        return shm
+
+    def close_spill_file(self) :
+        """
+        Close (and so remove) the temporary file this file's data were spilled to and the mmap of it, if there are any
+        Should be called once the file is complete and done being used or is discarded, since the data held 
+        only in the temporary file can't be used afterward
+        """
+        if not self.spilled :
+            return
+        self.__close_spill_mmap()
+        self.__spill_file.close()
+        self.__spill_file = None
+
+    def use_shared_memory(self,shm,n_bytes) :
+        """
+        Read this file's data from the first n_bytes of a given block of shared memory 
+        (created by move_to_shared_memory, possibly in another process) without copying them
+        """
+        self.__shared_memory = shm
+        self.__n_shared_bytes = n_bytes
+
+    def use_bytes(self,data) :
+        """
+        Read this file's data from a given bytes object (sent from another process where shared memory 
+        isn't available) without copying them
+        No more chunks should be added to the file afterward
+        """
+        self.__buffer = data
 
     def _on_add_chunk(self,dfc) :
         """
-        Add the data from a given file chunk to the dictionary of data by offset
+        Copy the data from a given file chunk into the buffer at its offset
+        """
+        if self.spilled :
+            #an existing mmap sees the new data, but not past the size the file had when it was mapped
+            if self.__spill_mmap is not None and dfc.chunk_offset_write+len(dfc.data)>len(self.__spill_mmap) :
+                self.__close_spill_mmap()
+            self.__spill_file.seek(dfc.chunk_offset_write)
+            self.__spill_file.write(dfc.data)
+            self.__spill_file.flush()
+            return
+        #allocate the whole buffer at once the first time if the size of the file is known
+        if len(self.__buffer)==0 and dfc.file_size is not None :
+            self.__buffer = bytearray(dfc.file_size)
+        #otherwise extend the buffer (with zeros) if it needs to grow to fit this chunk
+        chunk_end = dfc.chunk_offset_write+len(dfc.data)
+        if chunk_end>len(self.__buffer) :
+            self.__buffer.extend(bytes(chunk_end-len(self.__buffer)))
+        self.__buffer[dfc.chunk_offset_write:chunk_end] = dfc.data
+
+    def __get_buffer(self) :
+        """
+        Return the object holding the file data (memory-mapping the temporary file if the data were spilled)
         """
-        self.__chunk_data_by_offset[dfc.chunk_offset_write] = dfc.data
+        if self.__shared_memory is not None :
+            return self.__shared_memory.buf[:self.__n_shared_bytes]
+        if not self.spilled :
+            return self.__buffer
+        if self.__spill_mmap is None :
+            self.__spill_mmap = mmap.mmap(self.__spill_file.fileno(),0,access=mmap.ACCESS_READ)
+        return self.__spill_mmap
 
-    def __create_bytestring(self) :
+    def __close_spill_mmap(self) :
         """
-        Makes all of the data held in the dictionary into a single bytestring ordered by offset of each chunk
+        Close the mmap of the temporary file the data were spilled to, if there is one
         """
-        bytestring = b''
-        for data in [self.__chunk_data_by_offset[offset] for offset in sorted(self.__chunk_data_by_offset.keys())] :
-            bytestring+=data
-        self.__bytestring = bytestring
+        if self.__spill_mmap is None :
+            return
+        try :
+            self.__spill_mmap.close()
+        except BufferError : #(views of it are still in use; it's unmapped once they've all been released)
+            pass
+        self.__spill_mmap = None
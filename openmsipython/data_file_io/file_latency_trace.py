@@ -0,0 +1,96 @@
+#imports
+import time
+from ..utilities.metrics import METRICS
+from ..my_kafka.config import MSG_HEADER_CONST
+
+class FileLatencyTrace :
+    """
+    The times at which a file reached each stage on its way from being detected in an upload directory to being
+    reconstructed (and processed) on the consuming end, and the latencies between them
+    Times on the uploading end come from the headers of the file's messages, and times on the consuming end
+    are recorded as its chunks are added. All times are in seconds since the epoch, so latencies between stages
+    on different machines are only as accurate as their clocks are in sync.
+    """
+
+    #the stages that are reported: (name, time the stage starts, time the stage ends)
+    STAGES = (
+        ('chunking','detected_at','chunked_at'),               #reading and hashing the file to break it into chunks
+        ('upload_queue','chunked_at','first_produced_at'),     #waiting in the upload queue to start being produced
+        ('producing','first_produced_at','last_produced_at'),  #producing every chunk of the file
+        ('transport','first_produced_at','first_arrived_at'),  #from producing the first chunk to consuming it
+        ('reconstruction','first_arrived_at','completed_at'),  #from consuming the first chunk to the file being done
+        ('processing','completed_at','processed_at'),          #processing the fully reconstructed file
+        ('end_to_end','detected_at','done_at'),                #from detecting the file to being done with it
+    )
+
+    @property
+    def done_at(self) :
+        return self.processed_at if self.processed_at is not None else self.completed_at
+
+    def __init__(self) :
+        #times from the uploading end (None for messages produced without them)
+        self.detected_at = None
+        self.chunked_at = None
+        self.first_produced_at = None
+        self.last_produced_at = None
+        #times from the consuming end
+        self.first_arrived_at = None
+        self.completed_at = None
+        self.processed_at = None
+
+    def add_chunk(self,dfc) :
+        """
+        Record the arrival of a consumed DataFileChunk, along with the times in its message headers
+        """
+        if self.first_arrived_at is None :
+            self.first_arrived_at = time.time()
+            self.detected_at = self.__get_header_time(dfc,MSG_HEADER_CONST.DETECTED_AT)
+            self.chunked_at = self.__get_header_time(dfc,MSG_HEADER_CONST.CHUNKED_AT)
+        produced_at = self.__get_header_time(dfc,MSG_HEADER_CONST.PRODUCED_AT)
+        if produced_at is not None :
+            if self.first_produced_at is None or produced_at<self.first_produced_at :
+                self.first_produced_at = produced_at
+            if self.last_produced_at is None or produced_at>self.last_produced_at :
+                self.last_produced_at = produced_at
+
+    def set_completed(self) :
+        self.completed_at = time.time()
+
+    def set_processed(self) :
+        self.processed_at = time.time()
+
+    def get_latencies(self) :
+        """
+        Return a dictionary of the latency of each stage (in seconds) whose start and end times are both known
+        """
+        latencies = {}
+        for name,start_name,end_name in self.STAGES :
+            start = getattr(self,start_name)
+            end = getattr(self,end_name)
+            if start is not None and end is not None :
+                latencies[name] = end-start
+        return latencies
+
+    def report(self,filepath,logger) :
+        """
+        Record the latency of each known stage in its metric histogram and log them all in a single line
+        filepath = the (relative) path to the file to use in the log message
+        logger   = the logger to use
+        """
+        latencies = self.get_latencies()
+        if len(latencies)==0 :
+            return
+        for name,latency in latencies.items() :
+            METRICS.histogram(f'openmsi_file_latency_{name}_seconds',
+                              f'Time each file spent in the "{name}" stage').observe(latency)
+        logger.info(f'Latency for {filepath}: '+' '.join([f'{n}={l:.3f}s' for n,l in latencies.items()]))
+
+    @staticmethod
+    def __get_header_time(dfc,name) :
+        value = dfc.headers.get(name)
+        if value is None :
+            return None
+        try :
+            return float(value)
+        except (TypeError,ValueError) :
+            return None
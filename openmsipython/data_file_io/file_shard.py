@@ -0,0 +1,349 @@
+#imports
+import zlib, itertools
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+from collections import OrderedDict, deque
+from .config import DATA_FILE_HANDLING_CONST
+
+class CheckpointRequest :
+    """
+    A marker put in a FileShard's queue by another worker thread that needs every chunk it routed to that shard
+    to be safely stored before it can commit its consumer's offsets
+    The owner of the shard reaches the marker after it's handled all of those chunks, does whatever is needed
+    to store them, and then sets the marker as done
+    """
+
+    @property
+    def succeeded(self) :
+        return self.__succeeded
+
+    def __init__(self) :
+        self.__done = Event()
+        self.__succeeded = False
+
+    def set_done(self,succeeded) :
+        self.__succeeded = succeeded
+        self.__done.set()
+
+    def is_done(self) :
+        return self.__done.is_set()
+
+class FileShard :
+    """
+    The state owned by a single worker thread when the files being reconstructed are split up between threads
+    Every file is routed to exactly one shard based on a hash of its path, so only the thread that owns a shard
+    ever touches the files in it (or the counters that belong to it) and no locks are needed to reconstruct them.
+    Chunks consumed by other threads are handed over to the owning thread through the shard's queue.
+    """
+
+    @staticmethod
+    def get_shard_index(filepath,n_shards) :
+        """
+        Return the index of the shard that owns a file with the given path
+        (stable across threads, processes, and restarts, unlike the built-in hash function)
+        """
+        return zlib.crc32(str(filepath).encode())%n_shards
+
+    @property
+    def index(self) :
+        return self.__index #the index of this shard (and of the thread that owns it)
+    @property
+    def data_files_by_path(self) :
+        return self.__data_files_by_path #the files owned by this shard, from least to most recently updated
+    @property
+    def queue(self) :
+        return self.__queue #the queue of chunks and CheckpointRequests handed to this shard by other threads
+    @property
+    def finished(self) :
+        return self.__finished #an Event that's set when the thread owning this shard has stopped consuming
+
+    def __init__(self,index) :
+        self.__index = index
+        self.__data_files_by_path = OrderedDict()
+        self.__queue = Queue()
+        self.__finished = Event()
+        #counters and lists that only the owning thread modifies (summed/combined across shards on demand)
+        self.n_msgs_read = 0
+        self.completed_filepaths = []
+        self.n_files_skipped = 0
+        #(only the most recently skipped files are listed)
+        self.skipped_filepaths = deque(maxlen=DATA_FILE_HANDLING_CONST.N_SKIPPED_FILES_TO_REMEMBER)
+        #the number of files submitted to be processed elsewhere whose results haven't been handled yet
+        self.n_files_processing = 0
+        #other state to keep for each file, keyed by filepath like data_files_by_path
+        self.last_chunk_times = {}
+        self.filepaths_to_checkpoint = set()
+        self.reorder_buffers = {}
+        #the hashes of the files that were skipped, from least to most recently skipped
+        self.skipped_file_hashes = OrderedDict()
+
+    def move_to(self,shards,get_shard_index) :
+        """
+        Move everything stored in this shard into the given shards (when the number of shards changes): 
+        the state kept for each file goes to the shard that owns the file afterward, and the counters and lists 
+        are added to those of the first shard
+        Should only be called while no thread owns either this shard or the given ones, and after everything in 
+        this shard's queue has been handled
+
+        shards          = the new list of shards
+        get_shard_index = a function returning the index of the new shard that owns the file with a given path
+        """
+        for filepath,datafile in self.__data_files_by_path.items() :
+            shards[get_shard_index(filepath)].data_files_by_path[filepath] = datafile
+        for name in ('last_chunk_times','reorder_buffers','skipped_file_hashes') :
+            for filepath,value in getattr(self,name).items() :
+                getattr(shards[get_shard_index(filepath)],name)[filepath] = value
+        for filepath in self.filepaths_to_checkpoint :
+            shards[get_shard_index(filepath)].filepaths_to_checkpoint.add(filepath)
+        shards[0].n_msgs_read+=self.n_msgs_read
+        shards[0].completed_filepaths+=self.completed_filepaths
+        shards[0].n_files_skipped+=self.n_files_skipped
+        shards[0].skipped_filepaths.extend(self.skipped_filepaths)
+        shards[0].n_files_processing+=self.n_files_processing
+        self.__data_files_by_path = OrderedDict()
+        self.n_msgs_read = 0
+        self.completed_filepaths = []
+        self.n_files_skipped = 0
+        self.skipped_filepaths.clear()
+        self.n_files_processing = 0
+        self.last_chunk_times = {}
+        self.filepaths_to_checkpoint = set()
+        self.reorder_buffers = {}
+        self.skipped_file_hashes = OrderedDict()
+
+    def skip_file(self,filepath,file_hash,is_duplicate) :
+        """
+        Return True if the chunks of the file at the given path with the given hash should be dropped because 
+        the file is a duplicate of one that's already been handled, calling the given function (with no arguments, 
+        returning True if the file is a duplicate) when the first chunk of the file arrives and remembering 
+        the answer for the rest of its chunks
+        """
+        if filepath in self.__data_files_by_path.keys() :
+            return False
+        skipped_file_hash = self.skipped_file_hashes.get(filepath)
+        if skipped_file_hash is not None and skipped_file_hash==file_hash :
+            return True
+        if not is_duplicate() :
+            return False
+        self.add_skipped_file(filepath,file_hash)
+        return True
+
+    def add_skipped_file(self,filepath,file_hash) :
+        """
+        Record that the file at the given path with the given hash was skipped, forgetting about the least 
+        recently skipped file if too many are remembered
+        """
+        self.skipped_file_hashes[filepath] = file_hash
+        self.skipped_file_hashes.move_to_end(filepath)
+        while len(self.skipped_file_hashes)>DATA_FILE_HANDLING_CONST.N_SKIPPED_FILES_TO_REMEMBER :
+            self.skipped_file_hashes.popitem(last=False)
+        self.skipped_filepaths.append(filepath)
+        self.n_files_skipped+=1
+
+    def get_skipped_filepaths(self) :
+        """
+        Return a list of the most recently skipped files that's safe to get from threads other than the owner
+        """
+        while True :
+            try :
+                return list(self.skipped_filepaths)
+            except RuntimeError :
+                pass
+
+    def get_data_files_snapshot(self) :
+        """
+        Return a copy of the dictionary of files owned by this shard that's safe to use from threads other than 
+        the owner (copying again if the owner changes the dictionary while it's being copied)
+        """
+        while True :
+            try :
+                return OrderedDict(self.__data_files_by_path)
+            except RuntimeError :
+                pass
+
+    def get_items(self,timeout=None) :
+        """
+        Return a list of everything that's currently in this shard's queue,
+        waiting up to timeout seconds for the first item if the queue is empty (don't wait at all if timeout is None)
+        """
+        items = []
+        try :
+            if timeout is not None :
+                items.append(self.__queue.get(timeout=timeout))
+            while True :
+                items.append(self.__queue.get_nowait())
+        except Empty :
+            pass
+        return items
+
+class FileShardRouter :
+    """
+    Routes DataFileChunks to the FileShards that own their files
+    The shards may all belong to the threads of this process, or (when running in several worker processes) be spread 
+    out over the threads of every process. In that case chunks and checkpoint requests for shards in other processes 
+    are sent through those processes' queues, and a thread running here hands the ones sent to this process 
+    to the right shards and sends back replies to checkpoint requests once they're done.
+    """
+
+    @property
+    def shards(self) :
+        return self.__shards #the shards owned by the threads of this process
+    @property
+    def n_total_shards(self) :
+        return self.__n_total_shards #the number of shards in all processes
+
+    def __init__(self,n_threads,process_group_member=None) :
+        """
+        n_threads            = the number of threads (and shards) in this process
+        process_group_member = the WorkerProcessGroupMember holding the queues and events shared with 
+                               the other processes (None if this process is the only one)
+        """
+        self.__member = process_group_member
+        process_index = 0 if self.__member is None else self.__member.index
+        n_processes = 1 if self.__member is None else len(self.__member.inbound_queues)
+        self.__n_threads = n_threads
+        self.__n_total_shards = n_processes*n_threads
+        self.__shards = [FileShard(process_index*n_threads+i) for i in range(n_threads)]
+        #checkpoint requests that have been sent to other processes (and the index of the process each went to), by ID
+        self.__pending_requests = {}
+        self.__pending_requests_lock = Lock()
+        self.__request_ids = itertools.count()
+        #the indices of other processes that have died (and will never reply to checkpoint requests)
+        self.__dead_processes = set()
+        self.__thread = None
+        if self.__member is not None :
+            self.__thread = Thread(target=self.__handle_inbound_items)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def get_shard_index(self,filepath) :
+        """
+        Return the index of the shard that owns the file with the given path
+        """
+        return FileShard.get_shard_index(filepath,self.__n_total_shards)
+
+    def hand_off(self,dfc,shard_index) :
+        """
+        Hand a DataFileChunk off to the shard with the given index
+        """
+        local_shard = self.__get_local_shard(shard_index)
+        if local_shard is not None :
+            local_shard.queue.put(dfc)
+        else :
+            self.__member.inbound_queues[shard_index//self.__n_threads].put(('chunk',shard_index,dfc))
+
+    def request_checkpoint(self,shard_index) :
+        """
+        Put a CheckpointRequest in the queue of the shard with the given index (after everything handed off to it 
+        from this thread so far) and return it
+        """
+        local_shard = self.__get_local_shard(shard_index)
+        request = CheckpointRequest()
+        if local_shard is not None :
+            local_shard.queue.put(request)
+        else :
+            process_index = shard_index//self.__n_threads
+            with self.__pending_requests_lock :
+                if process_index in self.__dead_processes :
+                    request.set_done(False)
+                    return request
+                request_id = next(self.__request_ids)
+                self.__pending_requests[request_id] = (process_index,request)
+            item = ('checkpoint',shard_index,self.__member.index,request_id)
+            self.__member.inbound_queues[process_index].put(item)
+        return request
+
+    def set_finished(self,shard) :
+        """
+        Mark that the thread owning the given shard has stopped consuming messages
+        """
+        shard.finished.set()
+        if self.__member is not None and all([s.finished.is_set() for s in self.__shards]) :
+            self.__member.finished_events[self.__member.index].set()
+
+    def all_finished(self) :
+        """
+        Return True if the threads owning every shard in every process have stopped consuming messages
+        """
+        if not all([s.finished.is_set() for s in self.__shards]) :
+            return False
+        if self.__member is None :
+            return True
+        return all([e.is_set() for e in self.__member.finished_events])
+
+    def resize(self,n_threads) :
+        """
+        Change the number of threads (and shards) in this process, moving the files each shard owns 
+        (and everything stored about them) to the shards that own them afterward
+        Only possible if this process is the only one, and should only be called while none of the threads 
+        owning the shards are running (after they've all finished handling the items in their queues)
+        """
+        if self.__member is not None :
+            raise RuntimeError('ERROR: the number of shards cannot be changed when running in several processes!')
+        old_shards = self.__shards
+        self.__n_threads = n_threads
+        self.__n_total_shards = n_threads
+        self.__shards = [FileShard(i) for i in range(n_threads)]
+        for shard in old_shards :
+            shard.move_to(self.__shards,self.get_shard_index)
+
+    def join(self) :
+        """
+        Wait for the thread handling items sent from other processes to finish (after every process has finished)
+        """
+        if self.__thread is not None :
+            self.__thread.join()
+
+    def __get_local_shard(self,shard_index) :
+        """
+        Return the shard with the given index if it's owned by this process, or None otherwise
+        """
+        local_index = shard_index-self.__shards[0].index
+        if 0<=local_index<self.__n_threads :
+            return self.__shards[local_index]
+        return None
+
+    def __handle_inbound_items(self) :
+        """
+        Hand off chunks and checkpoint requests sent to this process from other processes to the right shards, 
+        send back replies to those requests when they're done, and pass replies to this process's requests 
+        along to the threads waiting on them (failing any requests sent to processes that have died)
+        Runs in a separate thread until every process has finished
+        """
+        inbound_queue = self.__member.inbound_queues[self.__member.index]
+        replies_to_send = []
+        while True :
+            try :
+                item = inbound_queue.get(timeout=0.05)
+            except Empty :
+                item = None
+            if item is not None :
+                if item[0]=='chunk' :
+                    self.__get_local_shard(item[1]).queue.put(item[2])
+                elif item[0]=='checkpoint' :
+                    request = CheckpointRequest()
+                    self.__get_local_shard(item[1]).queue.put(request)
+                    replies_to_send.append((item[2],item[3],request))
+                elif item[0]=='reply' :
+                    with self.__pending_requests_lock :
+                        pending = self.__pending_requests.pop(item[1],None)
+                    if pending is not None :
+                        pending[1].set_done(item[2])
+                elif item[0]=='dead' :
+                    self.__fail_requests_to(item[1])
+            for reply in [r for r in replies_to_send if r[2].is_done()] :
+                self.__member.inbound_queues[reply[0]].put(('reply',reply[1],reply[2].succeeded))
+                replies_to_send.remove(reply)
+            if item is None and len(replies_to_send)==0 and self.all_finished() :
+                break
+
+    def __fail_requests_to(self,process_index) :
+        """
+        Mark that the process with the given index has died and fail every checkpoint request waiting on it
+        """
+        with self.__pending_requests_lock :
+            self.__dead_processes.add(process_index)
+            request_ids = [rid for rid,(pi,_) in self.__pending_requests.items() if pi==process_index]
+            requests = [self.__pending_requests.pop(rid)[1] for rid in request_ids]
+        for request in requests :
+            request.set_done(False)
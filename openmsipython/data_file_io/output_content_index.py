@@ -0,0 +1,80 @@
+#imports
+import os
+from hashlib import sha512
+from .config import DATA_FILE_HANDLING_CONST
+from .sqlite_index import SQLiteIndex
+
+class OutputContentIndex(SQLiteIndex) :
+    """
+    A sidecar index of the files that already exist in an output directory (their paths relative to the directory,
+    sizes, modification times, and hashes), so that files that would be reconstructed with contents identical to
+    what's already on disk can be skipped without writing anything
+    Entries are built lazily: a file's hash is only computed the first time it's looked up (or again if its size or
+    modification time has changed since), and entries are updated whenever a file is successfully reconstructed
+    """
+
+    #################### SPECIAL FUNCTIONS ####################
+
+    def __init__(self,dirpath,filepath=None) :
+        """
+        dirpath  = the path to the output directory whose contents are indexed
+        filepath = the path to the database file holding the index (created if it doesn't exist;
+                   default is a hidden file in the output directory)
+        """
+        self.__dirpath = dirpath
+        if filepath is None :
+            filepath = self.__dirpath/DATA_FILE_HANDLING_CONST.OUTPUT_CONTENT_INDEX_NAME
+        super().__init__(filepath,'''CREATE TABLE IF NOT EXISTS output_files (
+                                         relpath TEXT PRIMARY KEY,
+                                         size INTEGER NOT NULL,
+                                         mtime_ns INTEGER NOT NULL,
+                                         file_hash BLOB NOT NULL)''')
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def get_file_hash(self,full_filepath) :
+        """
+        Return the hash of the contents of the file at the given path in the output directory
+        (or None if there is no file there), computing it and adding it to the index if the file
+        isn't indexed yet or has changed since it was
+        """
+        relpath = self.__get_relpath(full_filepath)
+        try :
+            stat = os.stat(full_filepath)
+        except FileNotFoundError :
+            self._write('DELETE FROM output_files WHERE relpath=?',(relpath,))
+            return None
+        query = 'SELECT file_hash FROM output_files WHERE relpath=? AND size=? AND mtime_ns=?'
+        row = self._fetchone(query,(relpath,stat.st_size,stat.st_mtime_ns))
+        if row is not None :
+            return row[0]
+        file_hash = sha512()
+        with open(full_filepath,'rb') as fp :
+            data = fp.read(DATA_FILE_HANDLING_CONST.HASH_READ_SIZE)
+            while len(data)>0 :
+                file_hash.update(data)
+                data = fp.read(DATA_FILE_HANDLING_CONST.HASH_READ_SIZE)
+        file_hash = file_hash.digest()
+        self.__insert(relpath,stat,file_hash)
+        return file_hash
+
+    def record(self,full_filepath,file_hash) :
+        """
+        Record that the file at the given path in the output directory was just written with the given hash
+        """
+        self.__insert(self.__get_relpath(full_filepath),os.stat(full_filepath),file_hash)
+
+    #################### PRIVATE HELPER FUNCTIONS ####################
+
+    def __get_relpath(self,full_filepath) :
+        """
+        Return the path of a file in the output directory relative to the directory, as stored in the index
+        """
+        return full_filepath.relative_to(self.__dirpath).as_posix()
+
+    def __insert(self,relpath,stat,file_hash) :
+        """
+        Add or replace the entry for the file at the given relative path, given the result of os.stat on it
+        """
+        self._write('INSERT OR REPLACE INTO output_files VALUES (?,?,?,?)',
+                    (relpath,stat.st_size,stat.st_mtime_ns,file_hash))
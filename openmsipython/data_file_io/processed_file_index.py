@@ -0,0 +1,57 @@
+#imports
+import time
+from .sqlite_index import SQLiteIndex
+
+class ProcessedFileIndex(SQLiteIndex) :
+    """
+    A persistent index of the files that have been processed successfully, keyed by the hash of each file's contents
+    and the type and version of the processor that handled it, so that files already processed don't need to be
+    reconstructed and processed again (after a restart, when replaying a topic, or with a new consumer group)
+    """
+
+    #################### SPECIAL FUNCTIONS ####################
+
+    def __init__(self,filepath) :
+        """
+        filepath = the path to the database file holding the index (created if it doesn't exist)
+        """
+        super().__init__(filepath,'''CREATE TABLE IF NOT EXISTS processed_files (
+                                         file_hash BLOB NOT NULL,
+                                         processor TEXT NOT NULL,
+                                         version TEXT NOT NULL,
+                                         filepath TEXT NOT NULL,
+                                         processed_at REAL NOT NULL,
+                                         PRIMARY KEY (file_hash,processor,version))''')
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def get_processed(self,file_hash,processors,version) :
+        """
+        Return the subset of the given processor names that have already processed a file with the given hash
+        using the given version
+        """
+        processors = list(processors)
+        if len(processors)==0 :
+            return set()
+        query = 'SELECT processor FROM processed_files WHERE file_hash=? AND version=? '
+        query+= f'AND processor IN ({",".join(["?"]*len(processors))})'
+        rows = self._fetchall(query,(file_hash,version,*processors))
+        return set([row[0] for row in rows])
+
+    def get_filepath(self,file_hash,processor,version) :
+        """
+        Return the path of the file with the given hash when it was processed by the given processor and version
+        (or None if it hasn't been)
+        """
+        query = 'SELECT filepath FROM processed_files WHERE file_hash=? AND processor=? AND version=?'
+        row = self._fetchone(query,(file_hash,processor,version))
+        return None if row is None else row[0]
+
+    def record(self,file_hash,processors,version,filepath) :
+        """
+        Record that a file with the given hash (found at the given filepath) has been processed successfully
+        by each of the given processor names using the given version
+        """
+        now = time.time()
+        rows = [(file_hash,processor,version,str(filepath),now) for processor in processors]
+        self._write_many('INSERT OR REPLACE INTO processed_files VALUES (?,?,?,?,?)',rows)
@@ -0,0 +1,199 @@
+#imports
+import multiprocessing, traceback, time
+from threading import BoundedSemaphore, Lock
+try :
+    from multiprocessing import shared_memory
+except ImportError : #(Python 3.7; file data are pickled to the worker processes instead)
+    shared_memory = None
+from concurrent.futures import ProcessPoolExecutor
+from ..utilities.logging import Logger
+
+#the logger used by the data files rebuilt in each pool worker process (created the first time it's needed)
+POOL_WORKER_LOGGER = None
+
+def process_data_file_in_shared_memory(processing_function,datafile_type,filepath,shm_name,n_bytes,
+                                       datafile_kwargs,processing_kwargs) :
+    """
+    The function run by the pool worker processes: rebuild a data file whose data are in the block of shared memory
+    with the given name, and call the processing function on it
+    Returns the processing function's return value (None if processing was successful)
+    and a formatted traceback if it was an Exception (None otherwise)
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    datafile = get_pool_worker_datafile(datafile_type,filepath,datafile_kwargs)
+    datafile.use_shared_memory(shm,n_bytes)
+    retval = run_processing_function(processing_function,datafile,processing_kwargs)
+    del datafile
+    try :
+        shm.close()
+    except BufferError :
+        pass #the processing function kept a view of the data; the block is released when this process exits
+    return retval
+
+def process_data_file_from_bytes(processing_function,datafile_type,filepath,data,datafile_kwargs,processing_kwargs) :
+    """
+    The function run by the pool worker processes if shared memory isn't available (Python 3.7): rebuild a data 
+    file from its pickled data and call the processing function on it
+    Returns the same as process_data_file_in_shared_memory
+    """
+    datafile = get_pool_worker_datafile(datafile_type,filepath,datafile_kwargs)
+    datafile.use_bytes(data)
+    return run_processing_function(processing_function,datafile,processing_kwargs)
+
+def get_pool_worker_datafile(datafile_type,filepath,datafile_kwargs) :
+    global POOL_WORKER_LOGGER
+    if POOL_WORKER_LOGGER is None :
+        POOL_WORKER_LOGGER = Logger(f'{datafile_type.__name__}ProcessingWorker')
+    return datafile_type(filepath,logger=POOL_WORKER_LOGGER,**datafile_kwargs)
+
+def run_processing_function(processing_function,datafile,processing_kwargs) :
+    """
+    Call a processing function on a data file and return its return value and a formatted traceback 
+    if it was an Exception (None otherwise)
+    """
+    try :
+        processing_retval = processing_function(datafile,**processing_kwargs)
+    except Exception as e :
+        processing_retval = e
+    tb = None
+    if isinstance(processing_retval,Exception) :
+        tb = ''.join(traceback.format_exception(type(processing_retval),processing_retval,
+                                                processing_retval.__traceback__))
+    return processing_retval, tb
+
+class ProcessingResult :
+    """
+    The eventual results of processing a single data file with every processor in a FileProcessingPool
+    """
+
+    @property
+    def filepath(self) :
+        return self.__filepath #the path to the file that was processed (as given when it was submitted)
+    @property
+    def full_filepath(self) :
+        return self.__full_filepath #the full path to the data file that was processed
+    @property
+    def file_hash(self) :
+        return self.__file_hash #the hash of the file's contents (as given when it was submitted)
+    @property
+    def submit_time(self) :
+        return self.__submit_time #the time.perf_counter() value when the file was submitted
+    @property
+    def latency_trace(self) :
+        return self.__latency_trace #the data file's FileLatencyTrace (as given when it was submitted)
+
+    def __init__(self,filepath,full_filepath,file_hash,futures_by_name,shm,latency_trace=None) :
+        self.__filepath = filepath
+        self.__full_filepath = full_filepath
+        self.__file_hash = file_hash
+        self.__futures_by_name = futures_by_name
+        self.__shm = shm
+        self.__submit_time = time.perf_counter()
+        self.__latency_trace = latency_trace
+
+    def get(self) :
+        """
+        Free the block of shared memory that held the file's data and return a dictionary, keyed by processor name, 
+        of the return value of each processing function and a formatted traceback if it was an Exception 
+        (waits for processing to be done if it isn't yet)
+        Should only be called once
+        """
+        results = {}
+        try :
+            for name,future in self.__futures_by_name.items() :
+                try :
+                    results[name] = future.result()
+                except Exception as e :
+                    #the worker process died or the return value couldn't be sent back
+                    results[name] = (e,traceback.format_exc())
+        finally :
+            if self.__shm is not None :
+                self.__shm.close()
+                self.__shm.unlink()
+        return results
+
+class FileProcessingPool :
+    """
+    A bounded pool of worker processes that run one or more processing functions on fully-reconstructed data files,
+    so that the threads consuming messages don't have to stop and process files themselves
+    Data are handed to the workers in blocks of shared memory instead of as pickled copies, and every processing 
+    function for the same file reads from the same block (on Python 3.7, which doesn't have shared memory, 
+    the data are pickled instead)
+    """
+
+    def __init__(self,processors,n_workers,max_pending_files=None) :
+        """
+        processors        = a dictionary of the functions to call on each data file and the other keyword arguments 
+                            to pass to them, keyed by name (name -> (function, kwargs)); functions must be picklable, 
+                            like module-level functions or staticmethods, and return None if processing is successful
+        n_workers         = the number of worker processes to run
+        max_pending_files = the maximum number of files that can be waiting on/being processed at once; submitting
+                            more will wait until some are done (default is twice the number of workers)
+        """
+        self.__processors = processors
+        if max_pending_files is None :
+            max_pending_files = 2*n_workers
+        self.__slots = BoundedSemaphore(max_pending_files)
+        #use "spawn" so that the new processes don't inherit the parent's threads and locks
+        self.__executor = ProcessPoolExecutor(max_workers=n_workers,mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self,filepath,datafile,datafile_kwargs,callback,file_hash=None,processor_names=None) :
+        """
+        Move a complete DownloadDataFileToMemory's data into shared memory and submit it to be processed,
+        waiting first if there are already too many files pending
+
+        filepath        = the path to the file to report in the result
+        datafile        = the data file to process
+        datafile_kwargs = keyword arguments needed to create a copy of the data file in a worker process
+        callback        = a function to call with the ProcessingResult once every processor is done
+                          (called from a different thread)
+        file_hash       = the hash of the file's contents to report in the result (optional)
+        processor_names = the names of the processors to run on the file (default is all of them)
+        """
+        names = [name for name in self.__processors.keys() if processor_names is None or name in processor_names]
+        #if there's nothing to run, call back right away
+        if len(names)==0 :
+            callback(ProcessingResult(filepath,datafile.full_filepath,file_hash,{},None,datafile.latency_trace))
+            return
+        self.__slots.acquire()
+        n_bytes = len(datafile.bytestring)
+        if shared_memory is not None :
+            shm = datafile.move_to_shared_memory()
+            worker_function, data_args = process_data_file_in_shared_memory, (shm.name,n_bytes)
+        else :
+            shm = None
+            worker_function, data_args = process_data_file_from_bytes, (bytes(datafile.bytestring),)
+        futures_by_name = {}
+        try :
+            for name in names :
+                function, kwargs = self.__processors[name]
+                futures_by_name[name] = self.__executor.submit(worker_function,function,type(datafile),
+                                                               datafile.filepath,*data_args,datafile_kwargs,kwargs)
+        except Exception :
+            for future in futures_by_name.values() :
+                future.cancel()
+            self.__slots.release()
+            if shm is not None :
+                shm.close()
+                shm.unlink()
+            raise
+        result = ProcessingResult(filepath,datafile.full_filepath,file_hash,futures_by_name,shm,
+                                  datafile.latency_trace)
+        #call back once the last of the processors is done
+        n_remaining = [len(futures_by_name)]
+        lock = Lock()
+        def on_done(f) :
+            with lock :
+                n_remaining[0]-=1
+                if n_remaining[0]>0 :
+                    return
+            self.__slots.release()
+            callback(result)
+        for future in futures_by_name.values() :
+            future.add_done_callback(on_done)
+
+    def shutdown(self) :
+        """
+        Wait for every file that's been submitted to be processed and then stop the worker processes
+        """
+        self.__executor.shutdown(wait=True)
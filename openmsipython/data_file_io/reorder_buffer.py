@@ -0,0 +1,53 @@
+#imports
+import heapq
+
+class ReorderBuffer :
+    """
+    Keeps track of the byte ranges of a single file that have arrived (possibly out of order) to find when more data
+    become available contiguously from the beginning of the file
+    Only the offsets and lengths of ranges that arrived early are held here; the data themselves stay wherever
+    the file is being reconstructed
+    """
+
+    #################### PROPERTIES ####################
+
+    @property
+    def n_contiguous_bytes(self) :
+        return self.__n_contiguous_bytes #the number of bytes available contiguously from the start of the file
+    @property
+    def n_pending_ranges(self) :
+        return len(self.__pending_offsets) #the number of ranges that arrived ahead of the contiguous data
+
+    #################### SPECIAL FUNCTIONS ####################
+
+    def __init__(self) :
+        self.__n_contiguous_bytes = 0
+        #a heap of the offsets of ranges that arrived early, and their lengths
+        self.__pending_offsets = []
+        self.__pending_lengths = {}
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def add(self,offset,length) :
+        """
+        Add the range of length bytes starting at the given offset
+        Returns the (start,end) offsets of the range of data that just became available contiguously
+        (start==end if adding this range didn't make any more data available in order)
+        """
+        start = self.__n_contiguous_bytes
+        if length<=0 or offset+length<=start :
+            return start, start
+        if offset>start :
+            if offset not in self.__pending_lengths :
+                heapq.heappush(self.__pending_offsets,offset)
+                self.__pending_lengths[offset] = length
+            else :
+                self.__pending_lengths[offset] = max(length,self.__pending_lengths[offset])
+            return start, start
+        #extend the contiguous data with this range and any ranges that arrived early and now follow on from it
+        end = offset+length
+        while len(self.__pending_offsets)>0 and self.__pending_offsets[0]<=end :
+            pending_offset = heapq.heappop(self.__pending_offsets)
+            end = max(end,pending_offset+self.__pending_lengths.pop(pending_offset))
+        self.__n_contiguous_bytes = end
+        return start, end
@@ -0,0 +1,61 @@
+#imports
+import sqlite3
+from threading import Lock
+
+class SQLiteIndex :
+    """
+    Base class for indices stored in an SQLite database, which can be shared safely between threads and processes
+    Child classes give the statement that creates their table and use the functions below to read and write it
+    (every statement is run holding a lock, so the same object can be used from several threads)
+    """
+
+    #################### SPECIAL FUNCTIONS ####################
+
+    def __init__(self,filepath,create_table_statement) :
+        """
+        filepath               = the path to the database file holding the index (created if it doesn't exist)
+        create_table_statement = the statement creating the index's table if it doesn't exist yet
+        """
+        self.__filepath = filepath
+        self.__lock = Lock()
+        self.__connection = sqlite3.connect(str(self.__filepath),timeout=30,check_same_thread=False)
+        self._write(create_table_statement)
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def close(self) :
+        """
+        Close the connection to the database
+        """
+        with self.__lock :
+            self.__connection.close()
+
+    #################### PRIVATE HELPER FUNCTIONS ####################
+
+    def _fetchone(self,query,parameters=()) :
+        """
+        Return the first row returned by a query (or None if there aren't any)
+        """
+        with self.__lock :
+            return self.__connection.execute(query,parameters).fetchone()
+
+    def _fetchall(self,query,parameters=()) :
+        """
+        Return a list of every row returned by a query
+        """
+        with self.__lock :
+            return self.__connection.execute(query,parameters).fetchall()
+
+    def _write(self,statement,parameters=()) :
+        """
+        Run a statement that changes the database and commit it
+        """
+        with self.__lock, self.__connection :
+            self.__connection.execute(statement,parameters)
+
+    def _write_many(self,statement,parameter_rows) :
+        """
+        Run a statement that changes the database once for each of the given rows of parameters and commit them
+        """
+        with self.__lock, self.__connection :
+            self.__connection.executemany(statement,parameter_rows)
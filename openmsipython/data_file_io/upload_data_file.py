@@ -1,16 +1,24 @@
 #imports
-import traceback
+import traceback, time
 from threading import Thread
 from queue import Queue
 from hashlib import sha512
 from .data_file import DataFile
 from ..utilities.runnable import Runnable
 from ..utilities.misc import populated_kwargs
+from ..utilities.metrics import METRICS
+from ..utilities.profiling import ThreadProfiler
 from ..my_kafka.my_producers import MySerializingProducer
 from .config import RUN_OPT_CONST
 from .utilities import produce_from_queue_of_file_chunks
 from .data_file_chunk import DataFileChunk
 
+#metrics
+N_BYTES_HASHED = METRICS.counter('openmsi_bytes_hashed_total',
+                                 'Bytes of files read and hashed to break them into chunks')
+FILE_CHUNKING_SECS = METRICS.histogram('openmsi_file_chunking_seconds',
+                                       'Time taken to read and hash each file to break it into chunks')
+
 class UploadDataFile(DataFile,Runnable) :
     """
     Class to represent a data file whose messages will be uploaded to a topic
@@ -26,6 +34,9 @@ class UploadDataFile(DataFile,Runnable) :
     def rootdir(self) :
         return self.__rootdir
     @property
+    def detected_at(self) :
+        return self.__detected_at #the time this file was found to be uploaded (when this object was created)
+    @property
     def chunks_to_upload(self) :
         return self.__chunks_to_upload
     @property
@@ -49,6 +60,13 @@ class UploadDataFile(DataFile,Runnable) :
             return False
         return True
     @property
+    def upload_progress(self) : #the fraction of this file's chunks that have been added to an upload queue
+        if self.__fully_enqueued :
+            return 1.
+        if self.__n_total_chunks==0 :
+            return 0.
+        return 1.-len(self.__chunks_to_upload)/self.__n_total_chunks
+    @property
     def upload_status_msg(self): #a message stating the file's name and status w.r.t. being enqueued to be uploaded 
         if self.__rootdir is None :
             msg = f'{self.filepath} '
@@ -77,6 +95,7 @@ class UploadDataFile(DataFile,Runnable) :
                           that's produced from its original file on disk
         """
         super().__init__(*args,**kwargs)
+        self.__detected_at = time.time()
         self.__to_upload = to_upload
         if rootdir is None :
             self.__rootdir = self.filepath.parent
@@ -85,6 +104,7 @@ class UploadDataFile(DataFile,Runnable) :
         self.__filename_append = filename_append
         self.__fully_enqueued = False
         self.__chunks_to_upload = []
+        self.__n_total_chunks = 0
 
     def add_chunks_to_upload_queue(self,queue,**kwargs) :
         """
@@ -139,6 +159,7 @@ class UploadDataFile(DataFile,Runnable) :
         Possible keyword arguments:
         n_threads  = the number of threads to run at once during uploading
         chunk_size = the size of each file chunk in bytes
+        profiler   = a ThreadProfiler to profile the uploading threads with (optional)
         """
         #set the important variables
         kwargs = populated_kwargs(kwargs,
@@ -157,12 +178,15 @@ class UploadDataFile(DataFile,Runnable) :
         for ti in range(kwargs['n_threads']) :
             upload_queue.put(None)
         #produce all the messages in the queue using multiple threads
+        target = produce_from_queue_of_file_chunks
+        if kwargs.get('profiler') is not None :
+            target = kwargs['profiler'].wrap(target)
         upload_threads = []
         for ti in range(kwargs['n_threads']) :
-            t = Thread(target=produce_from_queue_of_file_chunks, args=(upload_queue,
-                                                                       producer,
-                                                                       topic_name,
-                                                                       self.logger))
+            t = Thread(target=target, args=(upload_queue,
+                                            producer,
+                                            topic_name,
+                                            self.logger))
             t.start()
             upload_threads.append(t)
         #join the threads
@@ -192,6 +216,7 @@ class UploadDataFile(DataFile,Runnable) :
                     self.logger.error(errmsg,ValueError)
             sorted_select_bytes = sorted(self.select_bytes,key=lambda x: x[0])
         #start a hash for the file and the lists of chunks
+        start_time = time.perf_counter()
         file_hash = sha512()
         chunks = []
         isb = 0 #index for the current sorted_select_bytes entry if necessary
@@ -223,12 +248,18 @@ class UploadDataFile(DataFile,Runnable) :
                 fp.seek(file_offset)
                 chunk = fp.read(n_bytes_to_read)
         file_hash = file_hash.digest()
+        N_BYTES_HASHED.inc(chunk_offset)
+        FILE_CHUNKING_SECS.observe(time.perf_counter()-start_time)
+        chunked_at = time.time()
         self.logger.info(f'File {self.filepath} has a total of {len(chunks)} chunks')
+        self.__n_total_chunks = len(chunks)
         #add all the chunks to the final list as DataFileChunk objects
         for ic,c in enumerate(chunks,start=1) :
             self.__chunks_to_upload.append(DataFileChunk(self.filepath,self.filename,file_hash,
                                                          c[0],c[1],c[2],c[3],ic,len(chunks),
-                                                         rootdir=self.__rootdir,filename_append=self.__filename_append))
+                                                         rootdir=self.__rootdir,filename_append=self.__filename_append,
+                                                         file_size=chunk_offset,detected_at=self.__detected_at,
+                                                         chunked_at=chunked_at))
 
     #################### CLASS METHODS ####################
 
@@ -248,10 +279,17 @@ class UploadDataFile(DataFile,Runnable) :
         args = parser.parse_args(args=args)
         #make the DataFile for the single specified file
         upload_file = cls(args.filepath)
+        profiler = None
+        if args.profile :
+            profiler = ThreadProfiler(args.profile_output,upload_file.logger,args.tracemalloc_seconds)
+            profiler.start()
         #chunk and upload the file
         upload_file.upload_whole_file(args.config,args.topic_name,
                                       n_threads=args.n_threads,
-                                      chunk_size=args.chunk_size)
+                                      chunk_size=args.chunk_size,
+                                      profiler=profiler)
+        if profiler is not None :
+            profiler.stop()
         upload_file.logger.info(f'Done uploading {args.filepath}')
 
 
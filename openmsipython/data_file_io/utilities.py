@@ -1,4 +1,11 @@
 #Several utility functions
+from ..utilities.metrics import METRICS
+
+#metrics
+N_MSGS_ACKED = METRICS.counter('openmsi_messages_acked_total','Produced messages acknowledged by the broker')
+N_MSGS_FAILED = METRICS.counter('openmsi_messages_failed_total','Produced messages that failed to be delivered')
+DELIVERY_SECS = METRICS.histogram('openmsi_delivery_seconds',
+                                  'Time from producing each message until its delivery was acknowledged')
 
 def produce_from_queue_of_file_chunks(queue,producer,topic_name,logger) :
     """
@@ -29,7 +36,13 @@ PRODUCER_CALLBACK_LOGGER = ProducerCallbackLogger()
 #a callback function to use for testing whether a message has been successfully produced to the topic
 def producer_callback(err,msg) :
     global PRODUCER_CALLBACK_LOGGER
-    if err is not None: #raise an error if the message wasn't sent successfully
+    if err is None :
+        N_MSGS_ACKED.inc()
+        latency = msg.latency()
+        if latency is not None :
+            DELIVERY_SECS.observe(latency)
+    else : #raise an error if the message wasn't sent successfully
+        N_MSGS_FAILED.inc()
         if err.fatal() :
             logmsg=f'ERROR: fatally failed to deliver message with key {msg.key()}. Error reason: {err.str()}'
             if PRODUCER_CALLBACK_LOGGER.logger is not None :
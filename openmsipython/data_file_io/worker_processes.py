@@ -0,0 +1,140 @@
+#imports
+import multiprocessing, traceback, functools, operator
+from queue import Empty
+from threading import Thread, Event
+
+class WorkerProcessGroupMember :
+    """
+    The queues and events a single worker process uses to communicate with the others in its group
+    and with the parent process that started it
+    """
+
+    def __init__(self,index,inbound_queues,finished_events,control_queue,status_queue) :
+        """
+        index           = the index of this process in the group
+        inbound_queues  = one queue per process, through which chunks, checkpoint requests, and replies 
+                          (and notices that other processes have died) are sent to it
+        finished_events = one event per process, set when every thread in the process has stopped consuming
+        control_queue   = the queue through which the parent process sends control commands to this process
+        status_queue    = the queue through which this process sends snapshots of its progress to the parent
+        """
+        self.index = index
+        self.inbound_queues = inbound_queues
+        self.finished_events = finished_events
+        self.control_queue = control_queue
+        self.status_queue = status_queue
+
+def get_progress_snapshot(obj,names) :
+    """
+    Return a dictionary of the values of some properties of the given object (the progress of a worker process)
+    """
+    return {name:getattr(obj,name) for name in names}
+
+def run_worker_process(cls,args,kwargs,run_function_name,snapshot_defaults,member) :
+    """
+    The function run by each worker process: creates an instance of the given class that's part of the process group,
+    calls the given function to start it running, and passes control commands from the parent process to it
+    (and snapshots of its progress back to the parent) until it's shut down
+    """
+    obj = cls(*args,process_group_member=member,**kwargs)
+    done = Event()
+    def relay_commands_and_progress() :
+        while not done.is_set() :
+            try :
+                obj.control_command_queue.put(member.control_queue.get(timeout=1))
+            except Empty :
+                pass
+            member.status_queue.put((False,get_progress_snapshot(obj,snapshot_defaults)))
+    relay_thread = Thread(target=relay_commands_and_progress)
+    relay_thread.daemon = True
+    relay_thread.start()
+    try :
+        getattr(obj,run_function_name)()
+    except Exception :
+        obj.logger.error(f'ERROR: worker process {member.index} failed!\n{traceback.format_exc()}')
+    finally :
+        done.set()
+        relay_thread.join()
+        member.status_queue.put((True,get_progress_snapshot(obj,snapshot_defaults)))
+
+class WorkerProcessGroup :
+    """
+    Runs copies of a class in several worker processes that split up the work of consuming from a topic between them
+    (each with its own consumers in the same consumer group), passes control commands along to them,
+    and keeps track of the progress they report back
+    """
+
+    def __init__(self,cls,args,kwargs,n_processes,run_function_name,snapshot_defaults,logger) :
+        """
+        cls               = the class to create an instance of in each process
+        args              = positional arguments to the class's constructor
+        kwargs            = keyword arguments to the class's constructor (shouldn't include a logger)
+        n_processes       = the number of worker processes to run
+        run_function_name = the name of the function to call to start each instance running
+        snapshot_defaults = a dictionary of the names of the properties whose values each process reports back 
+                            and their values before anything has been reported (numbers are summed 
+                            and lists are combined over processes)
+        logger            = the logger to use in the parent process
+        """
+        self.__cls = cls
+        self.__args = args
+        #only the parent process listens on the control socket and serves metrics (if it does)
+        self.__kwargs = {k:v for k,v in kwargs.items() if k not in ('control_socket','metrics_port')}
+        self.__run_function_name = run_function_name
+        self.__snapshot_defaults = snapshot_defaults
+        self.__logger = logger
+        #use "spawn" so that the new processes don't inherit the parent's threads and locks
+        self.__context = multiprocessing.get_context('spawn')
+        inbound_queues = [self.__context.Queue() for _ in range(n_processes)]
+        finished_events = [self.__context.Event() for _ in range(n_processes)]
+        self.__members = []
+        for i in range(n_processes) :
+            self.__members.append(WorkerProcessGroupMember(i,inbound_queues,finished_events,
+                                                           self.__context.Queue(),self.__context.Queue()))
+        self.__snapshots = [None for _ in range(n_processes)]
+
+    def get_combined(self,name) :
+        """
+        Return the value of a reported property combined over every worker process
+        """
+        values = [snapshot[name] for snapshot in self.__snapshots if snapshot is not None]
+        return functools.reduce(operator.add,values,self.__snapshot_defaults[name])
+
+    def send_command(self,cmd) :
+        """
+        Pass a control command along to every worker process
+        """
+        for member in self.__members :
+            member.control_queue.put(cmd)
+
+    def supervise(self,owner,process_index) :
+        """
+        Start the worker process with the given index and keep track of its progress while the given owner
+        (a ControlledProcess) is alive, then tell it to shut down and wait for it to finish
+        Meant to be run in a separate thread for each process
+        """
+        member = self.__members[process_index]
+        process = self.__context.Process(target=run_worker_process,
+                                         args=(self.__cls,self.__args,self.__kwargs,self.__run_function_name,
+                                               self.__snapshot_defaults,member))
+        process.start()
+        quit_sent = False
+        final = False
+        while not final :
+            if (not owner.alive) and (not quit_sent) :
+                member.control_queue.put('q')
+                quit_sent = True
+            try :
+                final, self.__snapshots[process_index] = member.status_queue.get(timeout=1)
+            except Empty :
+                if not process.is_alive() :
+                    errmsg = f'ERROR: worker process {process_index} exited unexpectedly '
+                    errmsg+= f'with exit code {process.exitcode}!'
+                    self.__logger.error(errmsg)
+                    #don't leave the other processes waiting on this one to finish or to answer checkpoint requests
+                    member.finished_events[process_index].set()
+                    for i,inbound_queue in enumerate(member.inbound_queues) :
+                        if i!=process_index :
+                            inbound_queue.put(('dead',process_index))
+                    break
+        process.join()
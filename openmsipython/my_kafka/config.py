@@ -0,0 +1,39 @@
+class MessageHeaderConstants :
+    """
+    Names and values of the headers attached to messages holding chunks of data files
+    """
+    @property
+    def FILE_ID(self) :
+        return 'file_id'      # header holding an ID for the chunk's file (the start of the hash of its contents)
+    @property
+    def CHUNK_I(self) :
+        return 'chunk_i'      # header holding the (1-based) index of the chunk within its file
+    @property
+    def N_TOTAL_CHUNKS(self) :
+        return 'n_chunks'     # header holding the total number of chunks in the chunk's file
+    @property
+    def RELPATH(self) :
+        return 'relpath'      # header holding the path of the chunk's file relative to the directory it came from
+    @property
+    def FILE_SIZE(self) :
+        return 'file_size'    # header holding the total size (in bytes) of the chunk's file
+    @property
+    def HASH_ALGORITHM(self) :
+        return 'hash_alg'     # header holding the name of the algorithm used to hash the file and chunk data
+    @property
+    def PRODUCED_AT(self) :
+        return 'produced_at'  # header holding the time (in seconds since the epoch) the chunk was produced
+    @property
+    def DETECTED_AT(self) :
+        return 'detected_at'  # header holding the time the chunk's file was found to be uploaded
+    @property
+    def CHUNKED_AT(self) :
+        return 'chunked_at'   # header holding the time the chunk's file was done being read and broken into chunks
+    @property
+    def HASH_ALGORITHM_NAME(self) :
+        return 'sha512'       # the name of the hash algorithm used for file and chunk data
+    @property
+    def FILE_ID_N_BYTES(self) :
+        return 16             # the number of bytes from the start of a file's hash used as its ID
+
+MSG_HEADER_CONST = MessageHeaderConstants()
@@ -1,7 +1,9 @@
 #imports
 import uuid
 from ..utilities.config import UTIL_CONST
+from .loopback import is_in_memory_loopback_config
 from .my_consumers import MyDeserializingConsumer
+from .message_filter import MessageFilter
 
 class ConsumerGroup :
     """
@@ -15,9 +17,17 @@ class ConsumerGroup :
     @property
     def topic_name(self) :
         return self.__topic_name
+    @property
+    def n_msgs_filtered(self) :
+        return sum([consumer.n_msgs_filtered for consumer in self.__consumers])
+    @property
+    def uses_in_memory_loopback(self) :
+        return is_in_memory_loopback_config(self.__config_dict) #True if the consumers use a loopback broker 
+                                                                #that can't be shared between processes
 
     def __init__(self,config_path,topic_name,*args,
-                 consumer_group_ID=str(uuid.uuid1()),n_consumers=UTIL_CONST.DEFAULT_N_THREADS,**other_kwargs) :
+                 consumer_group_ID=str(uuid.uuid1()),n_consumers=UTIL_CONST.DEFAULT_N_THREADS,
+                 include_globs=None,exclude_globs=None,**other_kwargs) :
         """
         arguments:
         config_path = path to the config file that should be used to define the consumer group
@@ -26,13 +36,32 @@ class ConsumerGroup :
         keyword arguments:
         consumer_group_ID = ID to use for all consumers in the group (a new & unique ID is created by default)
         n_consumers = the number of Consumers to create in the group
+        include_globs = glob patterns on relative file paths; only messages for files matching one of them are 
+                        consumed (messages for every file are consumed by default)
+        exclude_globs = glob patterns on relative file paths; messages for files matching any of them are skipped
+        (messages are filtered based on their keys, without deserializing their values)
         """
         self.__topic_name = topic_name
         #create a Consumer for each thread and subscribe it to the topic
-        config_dict = self._consumer_type.get_config_dict(config_path,group_id=consumer_group_ID,**other_kwargs)
+        self.__config_dict = self._consumer_type.get_config_dict(config_path,group_id=consumer_group_ID,
+                                                                 **other_kwargs)
+        self.__message_filter = None
+        if include_globs or exclude_globs :
+            self.__message_filter = MessageFilter(include_globs,exclude_globs)
         self.__consumers = []
-        for i in range(n_consumers) :
-            consumer = MyDeserializingConsumer(config_dict)
+        self.set_n_consumers(n_consumers)
+
+    def set_n_consumers(self,n_consumers) :
+        """
+        Change the number of Consumers in the group, creating and subscribing new ones or closing the extra ones
+        (extra Consumers should have committed their offsets and shouldn't be in use anymore)
+        """
+        new_consumers = []
+        while len(self.__consumers)<n_consumers :
+            consumer = self._consumer_type.from_config_dict(self.__config_dict,message_filter=self.__message_filter)
             self.__consumers.append(consumer)
-        for consumer in self.__consumers :
+            new_consumers.append(consumer)
+        while len(self.__consumers)>n_consumers :
+            self.__consumers.pop().close()
+        for consumer in new_consumers :
             consumer.subscribe([self.__topic_name])        
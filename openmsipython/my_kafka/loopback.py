@@ -0,0 +1,814 @@
+#imports
+import os, time, uuid, zlib, struct, pathlib, itertools
+from threading import Lock, Condition
+from confluent_kafka import KafkaError, KafkaException, TopicPartition, TIMESTAMP_CREATE_TIME
+from confluent_kafka.serialization import SerializationContext, MessageField
+from confluent_kafka.error import KeySerializationError, ValueSerializationError
+from ..utilities.config import UTIL_CONST
+try :
+    import fcntl
+except ImportError : #(on Windows segment files can still be used, but only by one process at a time)
+    fcntl = None
+
+#################### SELECTING THE TRANSPORT ####################
+
+def is_loopback_config(configs) :
+    """
+    Return True if the "bootstrap.servers" in a configuration dictionary select the loopback transport
+    """
+    servers = configs.get('bootstrap.servers')
+    return isinstance(servers,str) and servers.strip().lower().startswith(UTIL_CONST.LOOPBACK_PREFIX)
+
+def is_in_memory_loopback_config(configs) :
+    """
+    Return True if the "bootstrap.servers" in a configuration dictionary select a loopback broker that keeps 
+    its logs in memory (which can't be shared between processes)
+    """
+    return is_loopback_config(configs) and not get_loopback_address(configs)[1]
+
+def get_loopback_address(configs) :
+    """
+    Return the address of the loopback broker selected by the "bootstrap.servers" in a configuration dictionary, 
+    and whether it's a directory of segment files (any address containing a slash) instead of a name
+    """
+    address = configs['bootstrap.servers'].strip()[len(UTIL_CONST.LOOPBACK_PREFIX):]
+    is_dir = '/' in address or os.sep in address
+    if is_dir :
+        address = str(pathlib.Path(address).expanduser().resolve())
+    return address, is_dir
+
+#the brokers that have been used in this process, by their addresses
+BROKERS = {}
+BROKERS_LOCK = Lock()
+
+def get_loopback_broker(configs) :
+    """
+    Return the broker named by the "bootstrap.servers" in a configuration dictionary, creating it if necessary
+    "loopback://name" is a broker that keeps its logs in memory, shared by everything in this process using that name
+    (but not by other processes, which each get their own empty broker)
+    "loopback://path/to/dir" (any address containing a slash) keeps its logs in segment files in that directory,
+    which can be shared between processes
+    "num.partitions" in the configs sets the number of partitions new topics are created with
+    """
+    address, is_dir = get_loopback_address(configs)
+    n_partitions = int(configs.get('num.partitions',UTIL_CONST.LOOPBACK_DEFAULT_N_PARTITIONS))
+    with BROKERS_LOCK :
+        if address not in BROKERS.keys() :
+            if is_dir :
+                BROKERS[address] = LoopbackSegmentFileBroker(address,n_partitions)
+            else :
+                BROKERS[address] = LoopbackBroker(address,n_partitions)
+        return BROKERS[address]
+
+#################### MESSAGES ####################
+
+class LoopbackMessage :
+    """
+    A message produced to or consumed from a loopback broker, with the same accessors as a confluent_kafka Message
+    """
+
+    def __init__(self,topic,partition,offset,key,value,headers,timestamp,latency=None) :
+        self.__topic = topic
+        self.__partition = partition
+        self.__offset = offset
+        self.__key = key
+        self.__value = value
+        self.__headers = headers
+        self.__timestamp = timestamp
+        self.__latency = latency
+
+    def __len__(self) :
+        return len(self.__value) if isinstance(self.__value,(bytes,bytearray)) else 0
+
+    def topic(self) :
+        return self.__topic
+    def partition(self) :
+        return self.__partition
+    def offset(self) :
+        return self.__offset
+    def key(self) :
+        return self.__key
+    def value(self) :
+        return self.__value
+    def headers(self) :
+        return self.__headers #a list of (name, value) tuples (None if the message has no headers)
+    def timestamp(self) :
+        return (TIMESTAMP_CREATE_TIME,self.__timestamp)
+    def latency(self) :
+        return self.__latency #seconds from producing the message to it being delivered (None if consumed)
+    def error(self) :
+        return None #(messages are never delivered with errors)
+
+    def set_key(self,key) :
+        self.__key = key
+    def set_value(self,value) :
+        self.__value = value
+    def set_headers(self,headers) :
+        self.__headers = headers
+
+#################### BROKERS ####################
+
+class LoopbackBroker :
+    """
+    An in-process stand-in for a Kafka cluster, holding each topic as a list of partitions that are each
+    an append-only log of messages in memory, along with the offsets committed by each consumer group
+    and which consumers are members of each group. Topics are created the first time they're used.
+    Messages are stored as (key, value, headers, timestamp) tuples of the bytes they were produced with.
+    Group members send heartbeats while they're polling, and a member is dropped from its group if it hasn't 
+    sent one within the session timeout.
+    """
+
+    @property
+    def name(self) :
+        return self.__name #the address the broker was created for
+
+    def __init__(self,name,n_partitions) :
+        """
+        name         = the address the broker was created for
+        n_partitions = the number of partitions to create new topics with
+        """
+        self.__name = name
+        self._n_partitions = n_partitions
+        self._lock = Lock()
+        #notified whenever messages are appended in this process
+        self.__new_messages = Condition(self._lock)
+        self.__version = 0
+        self.__logs = {}
+        self.__committed = {}
+        #the topics each member of each group is subscribed to and the time of its last heartbeat, 
+        #by group ID and then member ID
+        self.__members = {}
+
+    def get_n_partitions(self,topic) :
+        """
+        Return the number of partitions in a topic, creating the topic if it doesn't exist yet
+        """
+        with self._lock :
+            if topic not in self.__logs.keys() :
+                self.__logs[topic] = [[] for _ in range(self._n_partitions)]
+            return len(self.__logs[topic])
+
+    def append(self,topic,partition,records) :
+        """
+        Append a list of records to a partition and return the offset of the first one
+        """
+        self.get_n_partitions(topic)
+        with self._lock :
+            log = self.__logs[topic][partition]
+            base_offset = len(log)
+            log.extend(records)
+            self._notify()
+        return base_offset
+
+    def read(self,topic,partition,offset,max_n) :
+        """
+        Return a list of up to max_n records from a partition, starting at the given offset
+        """
+        with self._lock :
+            return self.__logs[topic][partition][offset:offset+max_n]
+
+    def get_end_offset(self,topic,partition) :
+        """
+        Return the offset the next record appended to a partition will have
+        """
+        with self._lock :
+            return len(self.__logs[topic][partition])
+
+    def commit(self,group_id,topic,partition,offset) :
+        with self._lock :
+            self.__committed[(group_id,topic,partition)] = offset
+
+    def get_committed(self,group_id,topic,partition) :
+        """
+        Return the offset committed for a partition by a group (None if the group hasn't committed one)
+        """
+        with self._lock :
+            return self.__committed.get((group_id,topic,partition))
+
+    def join_group(self,group_id,member_id,topics) :
+        with self._lock :
+            self.__members.setdefault(group_id,{})[member_id] = (list(topics),time.monotonic())
+
+    def leave_group(self,group_id,member_id) :
+        with self._lock :
+            self.__members.get(group_id,{}).pop(member_id,None)
+
+    def heartbeat(self,group_id,member_id) :
+        """
+        Record that a member of a group is still alive
+        """
+        with self._lock :
+            members = self.__members.get(group_id,{})
+            if member_id in members.keys() :
+                members[member_id] = (members[member_id][0],time.monotonic())
+
+    def get_members(self,group_id,topic,session_timeout=None) :
+        """
+        Return the sorted IDs of the members of a group that are subscribed to a topic, not counting members
+        that haven't sent a heartbeat within session_timeout seconds (if it's given)
+        """
+        now = time.monotonic()
+        with self._lock :
+            return sorted([m for m,(topics,last_heartbeat) in self.__members.get(group_id,{}).items() 
+                           if topic in topics and (session_timeout is None or now-last_heartbeat<=session_timeout)])
+
+    def get_version(self) :
+        """
+        Return a number that changes whenever messages are appended in this process
+        """
+        with self._lock :
+            return self.__version
+
+    def wait_for_messages(self,version,timeout) :
+        """
+        Wait for up to timeout seconds for messages to be appended, unless they already have been since
+        get_version returned the given version
+        """
+        with self._lock :
+            self.__new_messages.wait_for(lambda : self.__version!=version,timeout)
+
+    def _notify(self) :
+        """
+        Wake up any consumers waiting for new messages (must be called holding the lock)
+        """
+        self.__version+=1
+        self.__new_messages.notify_all()
+
+class LoopbackSegmentFileBroker(LoopbackBroker) :
+    """
+    A loopback broker that keeps its logs and committed offsets in files in a directory instead of in memory,
+    so that they persist and can be shared by several processes (file locks keep appends from different processes
+    apart). Each partition is a directory of segment files named for the offset of their first record;
+    a new segment is started when the last one gets bigger than UTIL_CONST.LOOPBACK_SEGMENT_BYTES.
+    The end offset of each partition is stored along with the size of its last segment after the last complete 
+    append, so that anything left at the end of the segment by an append that was interrupted is dropped.
+    Group members register themselves with files that they touch while they're polling, and a member
+    is dropped from its group if its file hasn't been touched within the session timeout.
+    """
+
+    #the length of the rest of the record, timestamp, key length, value length, and number of headers
+    #(lengths of -1 stand for None)
+    RECORD_HEADER = struct.Struct('>Iqiih')
+    #the lengths of the name and value of each header
+    HEADER_HEADER = struct.Struct('>hi')
+
+    @property
+    def dirpath(self) :
+        return self.__dirpath #the directory the logs are kept in
+
+    def __init__(self,dirpath,n_partitions) :
+        """
+        dirpath      = the directory to keep the logs and committed offsets in (created if necessary)
+        n_partitions = the number of partitions to create new topics with
+        """
+        super().__init__(dirpath,n_partitions)
+        self.__dirpath = pathlib.Path(dirpath)
+        self.__dirpath.mkdir(parents=True,exist_ok=True)
+        self.__n_partitions_by_topic = {}
+        #where the most recent reads from each partition left off, so the next read doesn't have to scan for its
+        #starting point: (offset, segment file path, position in the file) by topic and partition
+        self.__cursors = {}
+
+    def get_n_partitions(self,topic) :
+        if topic not in self.__n_partitions_by_topic.keys() :
+            topic_dir = self.__dirpath/topic
+            topic_dir.mkdir(parents=True,exist_ok=True)
+            filepath = topic_dir/'n_partitions'
+            if not filepath.is_file() :
+                #write the number of partitions to a temporary file and then link it into place so that
+                #it's never seen half-written and only the first process to create the topic sets it
+                temp_filepath = topic_dir/f'n_partitions.{uuid.uuid4().hex}'
+                temp_filepath.write_text(str(self._n_partitions))
+                try :
+                    os.link(temp_filepath,filepath)
+                except FileExistsError :
+                    pass
+                finally :
+                    temp_filepath.unlink()
+            self.__n_partitions_by_topic[topic] = int(filepath.read_text())
+        return self.__n_partitions_by_topic[topic]
+
+    def append(self,topic,partition,records) :
+        self.get_n_partitions(topic)
+        partition_dir = self.__dirpath/topic/str(partition)
+        partition_dir.mkdir(exist_ok=True)
+        data = b''.join([self.__encode_record(record) for record in records])
+        with self._lock :
+            with open(partition_dir/'lock','a') as lock_fp :
+                if fcntl is not None :
+                    fcntl.flock(lock_fp,fcntl.LOCK_EX)
+                base_offset, end_position = self.__read_end(partition_dir)
+                segments = self.__get_segment_filepaths(partition_dir)
+                #drop any torn records left after the end offset by an append that didn't finish
+                if len(segments)>0 :
+                    if int(segments[-1].stem)==base_offset :
+                        end_position = 0
+                    if end_position is not None and segments[-1].stat().st_size>end_position :
+                        os.truncate(segments[-1],end_position)
+                if len(segments)==0 or segments[-1].stat().st_size>=UTIL_CONST.LOOPBACK_SEGMENT_BYTES :
+                    segments.append(partition_dir/f'{base_offset:020d}.log')
+                with open(segments[-1],'ab') as fp :
+                    fp.write(data)
+                    fp.flush()
+                    end_position = fp.tell()
+                #the end offset is only moved once the records are completely written, so readers never see them
+                #before then
+                self.__write_file_atomically(partition_dir/'end_offset',f'{base_offset+len(records)} {end_position}')
+            self._notify()
+        return base_offset
+
+    def read(self,topic,partition,offset,max_n) :
+        partition_dir = self.__dirpath/topic/str(partition)
+        end_offset = self.__read_end_offset(partition_dir)
+        if offset>=end_offset :
+            return []
+        #start from where the last read left off if it was at this offset, otherwise scan from the start of the
+        #segment holding the offset
+        cursor = self.__cursors.get((topic,partition))
+        if cursor is not None and cursor[0]==offset :
+            segment, position = cursor[1], cursor[2]
+        else :
+            segment = [fp for fp in self.__get_segment_filepaths(partition_dir) if int(fp.stem)<=offset][-1]
+            position = self.__skip_records(segment,offset-int(segment.stem))
+        records = []
+        while len(records)<max_n and offset<end_offset :
+            with open(segment,'rb') as fp :
+                fp.seek(position)
+                while len(records)<max_n and offset<end_offset :
+                    record = self.__read_record(fp)
+                    if record is None :
+                        break
+                    records.append(record)
+                    offset+=1
+                position = fp.tell()
+            if len(records)<max_n and offset<end_offset :
+                #the rest of the records are in the next segment
+                segment = partition_dir/f'{offset:020d}.log'
+                position = 0
+        self.__cursors[(topic,partition)] = (offset,segment,position)
+        return records
+
+    def get_end_offset(self,topic,partition) :
+        self.get_n_partitions(topic)
+        return self.__read_end_offset(self.__dirpath/topic/str(partition))
+
+    def commit(self,group_id,topic,partition,offset) :
+        offsets_dir = self.__dirpath/'__consumer_offsets'/group_id/topic
+        offsets_dir.mkdir(parents=True,exist_ok=True)
+        self.__write_file_atomically(offsets_dir/str(partition),str(offset))
+
+    def get_committed(self,group_id,topic,partition) :
+        filepath = self.__dirpath/'__consumer_offsets'/group_id/topic/str(partition)
+        if not filepath.is_file() :
+            return None
+        return int(filepath.read_text())
+
+    def join_group(self,group_id,member_id,topics) :
+        members_dir = self.__dirpath/'__consumer_groups'/group_id
+        members_dir.mkdir(parents=True,exist_ok=True)
+        self.__write_file_atomically(members_dir/member_id,'\n'.join(topics))
+
+    def leave_group(self,group_id,member_id) :
+        filepath = self.__dirpath/'__consumer_groups'/group_id/member_id
+        if filepath.is_file() :
+            filepath.unlink()
+
+    def heartbeat(self,group_id,member_id) :
+        """
+        Record that a member of a group is still alive
+        """
+        filepath = self.__dirpath/'__consumer_groups'/group_id/member_id
+        if filepath.is_file() :
+            os.utime(filepath)
+
+    def get_members(self,group_id,topic,session_timeout=None) :
+        """
+        Return the sorted IDs of the members of a group that are subscribed to a topic, not counting members
+        that haven't sent a heartbeat within session_timeout seconds (if it's given)
+        """
+        members_dir = self.__dirpath/'__consumer_groups'/group_id
+        if not members_dir.is_dir() :
+            return []
+        members = []
+        for filepath in members_dir.iterdir() :
+            try :
+                if session_timeout is not None and time.time()-filepath.stat().st_mtime>session_timeout :
+                    continue
+                if topic in filepath.read_text().split('\n') :
+                    members.append(filepath.name)
+            except FileNotFoundError : #(the member left while the directory was being read)
+                continue
+        return sorted(members)
+
+    def wait_for_messages(self,version,timeout) :
+        #messages appended by other processes can't be waited for, so wake up periodically to check for them
+        super().wait_for_messages(version,min(timeout,UTIL_CONST.LOOPBACK_WAIT_SECONDS))
+
+    def __encode_record(self,record) :
+        key, value, headers, timestamp = record
+        parts = [key or b'',value or b'']
+        for name,header_value in (headers or []) :
+            name = name.encode()
+            parts.append(self.HEADER_HEADER.pack(len(name),-1 if header_value is None else len(header_value)))
+            parts+=[name,header_value or b'']
+        n_headers = -1 if headers is None else len(headers)
+        rest = b''.join(parts)
+        return self.RECORD_HEADER.pack(self.RECORD_HEADER.size-4+len(rest),timestamp,
+                                       -1 if key is None else len(key),-1 if value is None else len(value),
+                                       n_headers)+rest
+
+    def __read_record(self,fp) :
+        """
+        Read the next record from an open segment file (returns None at the end of the file)
+        """
+        record_header = fp.read(self.RECORD_HEADER.size)
+        if len(record_header)<self.RECORD_HEADER.size :
+            return None
+        length, timestamp, key_length, value_length, n_headers = self.RECORD_HEADER.unpack(record_header)
+        data = fp.read(length-(self.RECORD_HEADER.size-4))
+        position = 0
+        key = None if key_length<0 else data[position:position+key_length]
+        position+=max(key_length,0)
+        value = None if value_length<0 else data[position:position+value_length]
+        position+=max(value_length,0)
+        headers = None if n_headers<0 else []
+        for _ in range(max(n_headers,0)) :
+            name_length, header_value_length = self.HEADER_HEADER.unpack_from(data,position)
+            position+=self.HEADER_HEADER.size
+            name = data[position:position+name_length].decode()
+            position+=name_length
+            header_value = None if header_value_length<0 else data[position:position+header_value_length]
+            position+=max(header_value_length,0)
+            headers.append((name,header_value))
+        return (key,value,headers,timestamp)
+
+    def __skip_records(self,segment,n_records) :
+        """
+        Return the position in a segment file after its first n_records records
+        """
+        with open(segment,'rb') as fp :
+            for _ in range(n_records) :
+                fp.seek(self.RECORD_HEADER.unpack(fp.read(self.RECORD_HEADER.size))[0]-(self.RECORD_HEADER.size-4),1)
+            return fp.tell()
+
+    @staticmethod
+    def __get_segment_filepaths(partition_dir) :
+        return sorted(partition_dir.glob('*.log'),key=lambda fp : int(fp.stem))
+
+    @staticmethod
+    def __read_end_offset(partition_dir) :
+        return LoopbackSegmentFileBroker.__read_end(partition_dir)[0]
+
+    @staticmethod
+    def __read_end(partition_dir) :
+        """
+        Return the end offset of a partition and the size of its last segment after the last complete append
+        (None if it wasn't recorded)
+        """
+        filepath = partition_dir/'end_offset'
+        if not filepath.is_file() :
+            return 0, None
+        values = filepath.read_text().split()
+        return int(values[0]), (int(values[1]) if len(values)>1 else None)
+
+    @staticmethod
+    def __write_file_atomically(filepath,text) :
+        temp_filepath = filepath.with_name(f'{filepath.name}.{uuid.uuid4().hex}.tmp')
+        temp_filepath.write_text(text)
+        os.replace(temp_filepath,filepath)
+
+#################### PRODUCERS ####################
+
+class LoopbackProducer :
+    """
+    A stand-in for a confluent_kafka Producer that produces to a loopback broker
+    Produced messages are held until the next call to poll or flush, which appends them to the broker and then
+    calls their delivery callbacks, just like a Producer only calls delivery callbacks from poll and flush.
+    Messages without a partition go to a partition picked from the CRC32 of their key (like librdkafka's default
+    partitioner), or to each partition in turn if they don't have a key.
+    """
+
+    def __init__(self,config_dict) :
+        """
+        config_dict = dictionary of configuration parameters ("bootstrap.servers" selects the broker)
+        """
+        self.__broker = get_loopback_broker(config_dict)
+        #the messages that haven't been delivered yet: (topic, partition, record, callback, time produced)
+        self.__pending = []
+        self.__lock = Lock()
+        #held while delivering messages so that batches are appended in the order they were produced
+        self.__delivery_lock = Lock()
+        self.__round_robin = itertools.count()
+
+    def __len__(self) :
+        return len(self.__pending)
+
+    def produce(self,topic,value=None,key=None,partition=-1,on_delivery=None,callback=None,timestamp=0,
+                headers=None) :
+        """
+        Hold a message to be appended to the broker on the next call to poll or flush
+        Raises BufferError if there are already UTIL_CONST.LOOPBACK_MAX_BUFFERED_MESSAGES messages being held
+        """
+        if not isinstance(topic,str) :
+            raise TypeError(f'ERROR: topic must be a str, not {type(topic).__name__}')
+        key = self.__get_bytes(key,'key')
+        value = self.__get_bytes(value,'value')
+        if headers is not None :
+            headers = [(name,self.__get_bytes(v,'header')) for name,v in
+                       (headers.items() if isinstance(headers,dict) else headers)]
+        if partition is None or partition<0 :
+            n_partitions = self.__broker.get_n_partitions(topic)
+            if key is None :
+                partition = next(self.__round_robin)%n_partitions
+            else :
+                partition = zlib.crc32(key)%n_partitions
+        if timestamp==0 :
+            timestamp = int(1000*time.time())
+        with self.__lock :
+            if len(self.__pending)>=UTIL_CONST.LOOPBACK_MAX_BUFFERED_MESSAGES :
+                raise BufferError('ERROR: loopback producer queue is full')
+            self.__pending.append((topic,partition,(key,value,headers,timestamp),on_delivery or callback,
+                                   time.perf_counter()))
+
+    def poll(self,timeout=None) :
+        """
+        Deliver any messages being held and return the number of delivery callbacks that were called
+        (there is never anything else to wait for, so the timeout is ignored)
+        """
+        return self.__deliver()
+
+    def flush(self,timeout=None) :
+        """
+        Deliver any messages being held and return the number left (always zero)
+        """
+        self.__deliver()
+        return 0
+
+    def __deliver(self) :
+        """
+        Append every message being held to the broker, in batches by partition, and then call their callbacks
+        """
+        with self.__delivery_lock :
+            with self.__lock :
+                pending = self.__pending
+                self.__pending = []
+            if len(pending)==0 :
+                return 0
+            batches = {}
+            for msg_tuple in pending :
+                batches.setdefault((msg_tuple[0],msg_tuple[1]),[]).append(msg_tuple)
+            delivered = []
+            for (topic,partition),batch in batches.items() :
+                base_offset = self.__broker.append(topic,partition,[msg_tuple[2] for msg_tuple in batch])
+                delivered_at = time.perf_counter()
+                for i,(_,_,(key,value,headers,timestamp),callback,produced_at) in enumerate(batch) :
+                    msg = LoopbackMessage(topic,partition,base_offset+i,key,value,headers,timestamp,
+                                          latency=delivered_at-produced_at)
+                    delivered.append((callback,msg))
+        n_callbacks = 0
+        for callback,msg in delivered :
+            if callback is not None :
+                callback(None,msg)
+                n_callbacks+=1
+        return n_callbacks
+
+    @staticmethod
+    def __get_bytes(obj,name) :
+        if obj is None or isinstance(obj,bytes) :
+            return obj
+        if isinstance(obj,str) :
+            return obj.encode()
+        if isinstance(obj,(bytearray,memoryview)) :
+            return bytes(obj)
+        raise TypeError(f'ERROR: a message {name} must be bytes or str, not {type(obj).__name__}')
+
+class LoopbackSerializingProducer(LoopbackProducer) :
+    """
+    A stand-in for a confluent_kafka SerializingProducer that produces to a loopback broker
+    """
+
+    def __init__(self,config_dict) :
+        """
+        config_dict = dictionary of configuration parameters, including the (instantiated) key and value serializers
+        """
+        self._key_serializer = config_dict.get('key.serializer')
+        self._value_serializer = config_dict.get('value.serializer')
+        super().__init__(config_dict)
+
+    def produce(self,topic,key=None,value=None,partition=-1,on_delivery=None,timestamp=0,headers=None) :
+        """
+        Serialize a message's key and value and hold it to be appended on the next call to poll or flush
+        """
+        ctx = SerializationContext(topic,MessageField.KEY,headers)
+        if self._key_serializer is not None :
+            try :
+                key = self._key_serializer(key,ctx)
+            except Exception as e :
+                raise KeySerializationError(e)
+        ctx.field = MessageField.VALUE
+        if self._value_serializer is not None :
+            try :
+                value = self._value_serializer(value,ctx)
+            except Exception as e :
+                raise ValueSerializationError(e)
+        super().produce(topic,value,key,partition=partition,on_delivery=on_delivery,timestamp=timestamp,
+                        headers=headers)
+
+#################### CONSUMERS ####################
+
+class LoopbackConsumer :
+    """
+    A stand-in for a confluent_kafka Consumer that consumes from a loopback broker
+    The partitions of each subscribed topic are split between the members of the consumer's group that are
+    subscribed to it (partition i goes to the (i % n_members)th member, sorted by ID), and recomputed as members
+    come and go. A consumer starts each partition it's assigned from its group's committed offset, or from the
+    beginning or end of the partition according to "auto.offset.reset" if nothing has been committed yet.
+    Offsets are committed automatically unless "enable.auto.commit" is false.
+    """
+
+    def __init__(self,config_dict) :
+        """
+        config_dict = dictionary of configuration parameters ("bootstrap.servers" selects the broker)
+        """
+        if config_dict.get('group.id') is None :
+            raise KafkaException(KafkaError(KafkaError._INVALID_ARG,'Failed to create consumer: group.id must be set'))
+        self.__broker = get_loopback_broker(config_dict)
+        self.__group_id = str(config_dict['group.id'])
+        self.__member_id = str(uuid.uuid4())
+        reset = str(config_dict.get('auto.offset.reset','latest')).lower()
+        self.__reset_to_earliest = reset in ('smallest','earliest','beginning')
+        self.__auto_commit = str(config_dict.get('enable.auto.commit',True)).lower() not in ('false','0','no')
+        self.__auto_commit_secs = float(config_dict.get('auto.commit.interval.ms',5000))/1000.
+        self.__session_timeout = float(config_dict.get('session.timeout.ms',45000))/1000.
+        self.__topics = []
+        #the offset of the next message to read from each assigned partition, by (topic, partition)
+        self.__positions = {}
+        #the last offset committed for each assigned partition
+        self.__committed = {}
+        self.__next_partition_i = 0
+        self.__last_auto_commit = time.monotonic()
+        self.__last_heartbeat = 0
+        self.__lock = Lock()
+        self.__closed = False
+
+    def subscribe(self,topics,on_assign=None,on_revoke=None,on_lost=None) :
+        """
+        Join the group as a consumer of the given topics (replacing any earlier subscription)
+        """
+        self.__check_open()
+        with self.__lock :
+            self.__topics = list(topics)
+            self.__positions = {}
+            self.__committed = {}
+            self.__broker.join_group(self.__group_id,self.__member_id,self.__topics)
+
+    def unsubscribe(self) :
+        self.__check_open()
+        with self.__lock :
+            self.__topics = []
+            self.__positions = {}
+            self.__committed = {}
+            self.__broker.leave_group(self.__group_id,self.__member_id)
+
+    def assignment(self) :
+        """
+        Return a list of TopicPartitions for the partitions currently assigned to this consumer
+        """
+        with self.__lock :
+            return [TopicPartition(topic,partition) for topic,partition in self.__positions.keys()]
+
+    def poll(self,timeout=None) :
+        """
+        Return the next message, waiting for up to timeout seconds for one (forever if timeout is None or negative)
+        Returns None if no message arrives in time
+        """
+        msgs = self.__consume(1,timeout)
+        return msgs[0] if len(msgs)>0 else None
+
+    def consume(self,num_messages=1,timeout=-1) :
+        """
+        Return a list of up to num_messages messages, waiting for up to timeout seconds for at least one
+        (forever if timeout is None or negative)
+        """
+        return self.__consume(num_messages,timeout)
+
+    def commit(self,message=None,offsets=None,asynchronous=True) :
+        """
+        Commit the offsets of the messages that have been consumed (or of the given message or list of
+        TopicPartitions) for the consumer's group
+        Raises a KafkaException with code _NO_OFFSET if there's nothing new to commit
+        """
+        self.__check_open()
+        with self.__lock :
+            committed = self.__commit(message,offsets)
+        if len(committed)==0 :
+            raise KafkaException(KafkaError(KafkaError._NO_OFFSET))
+        return None if asynchronous else committed
+
+    def close(self) :
+        """
+        Commit offsets (if they're being committed automatically) and leave the group
+        """
+        if self.__closed :
+            return
+        with self.__lock :
+            if self.__auto_commit :
+                self.__commit()
+            self.__broker.leave_group(self.__group_id,self.__member_id)
+            self.__positions = {}
+            self.__closed = True
+
+    def __consume(self,num_messages,timeout) :
+        self.__check_open()
+        deadline = None if (timeout is None or timeout<0) else time.monotonic()+timeout
+        while True :
+            version = self.__broker.get_version()
+            with self.__lock :
+                self.__update_assignment()
+                msgs = self.__fetch(num_messages)
+                if self.__auto_commit and time.monotonic()-self.__last_auto_commit>=self.__auto_commit_secs :
+                    self.__commit()
+                    self.__last_auto_commit = time.monotonic()
+            wait_secs = 1. if deadline is None else deadline-time.monotonic()
+            if len(msgs)>0 or wait_secs<=0 :
+                return msgs
+            self.__broker.wait_for_messages(version,wait_secs)
+
+    def __update_assignment(self) :
+        """
+        Recompute which partitions are assigned to this consumer, dropping the positions in partitions that
+        have been revoked and starting the ones in partitions that have been newly assigned
+        (must be called holding the lock)
+        """
+        if time.monotonic()-self.__last_heartbeat>=min(1.,self.__session_timeout/3.) :
+            self.__broker.heartbeat(self.__group_id,self.__member_id)
+            self.__last_heartbeat = time.monotonic()
+        assigned = set()
+        for topic in self.__topics :
+            members = self.__broker.get_members(self.__group_id,topic,self.__session_timeout)
+            if self.__member_id not in members :
+                continue
+            for partition in range(self.__broker.get_n_partitions(topic)) :
+                if members[partition%len(members)]==self.__member_id :
+                    assigned.add((topic,partition))
+        for tp in list(self.__positions.keys()) :
+            if tp not in assigned :
+                self.__positions.pop(tp)
+                self.__committed.pop(tp,None)
+        for topic,partition in sorted(assigned) :
+            if (topic,partition) in self.__positions.keys() :
+                continue
+            committed = self.__broker.get_committed(self.__group_id,topic,partition)
+            if committed is not None :
+                position = committed
+            elif self.__reset_to_earliest :
+                position = 0
+            else :
+                position = self.__broker.get_end_offset(topic,partition)
+            self.__positions[(topic,partition)] = position
+            self.__committed[(topic,partition)] = committed
+
+    def __fetch(self,num_messages) :
+        """
+        Read up to num_messages new messages from the assigned partitions, starting from a different partition
+        each time so that none of them are starved (must be called holding the lock)
+        """
+        msgs = []
+        tps = sorted(self.__positions.keys())
+        if len(tps)==0 :
+            return msgs
+        self.__next_partition_i = (self.__next_partition_i+1)%len(tps)
+        for tp in tps[self.__next_partition_i:]+tps[:self.__next_partition_i] :
+            if len(msgs)>=num_messages :
+                break
+            topic, partition = tp
+            offset = self.__positions[tp]
+            for key,value,headers,timestamp in self.__broker.read(topic,partition,offset,num_messages-len(msgs)) :
+                msgs.append(LoopbackMessage(topic,partition,offset,key,value,headers,timestamp))
+                offset+=1
+            self.__positions[tp] = offset
+        return msgs
+
+    def __commit(self,message=None,offsets=None) :
+        """
+        Commit offsets to the broker and return a list of TopicPartitions for those that were new
+        (must be called holding the lock)
+        """
+        if message is not None :
+            to_commit = {(message.topic(),message.partition()):message.offset()+1}
+        elif offsets is not None :
+            to_commit = {(tp.topic,tp.partition):tp.offset for tp in offsets}
+        else :
+            to_commit = dict(self.__positions)
+        committed = []
+        for (topic,partition),offset in sorted(to_commit.items()) :
+            if offset<0 or self.__committed.get((topic,partition))==offset :
+                continue
+            self.__broker.commit(self.__group_id,topic,partition,offset)
+            self.__committed[(topic,partition)] = offset
+            committed.append(TopicPartition(topic,partition,offset))
+        return committed
+
+    def __check_open(self) :
+        if self.__closed :
+            raise RuntimeError('ERROR: loopback consumer is closed')
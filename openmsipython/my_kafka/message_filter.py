@@ -0,0 +1,80 @@
+#imports
+import re, fnmatch
+from .config import MSG_HEADER_CONST
+
+class MessageFilter :
+    """
+    Include/exclude filters, as glob patterns on relative file paths, for consumed DataFileChunk messages
+    Filters are applied to the headers or raw keys of messages before their values are deserialized, so messages 
+    for files that aren't wanted cost almost nothing to skip
+    Messages with a header holding their file's relative path are matched exactly. Otherwise the message key is used:
+    keys encode each file's subdirectory and name with slashes replaced by underscores (see DataFileChunk.message_key),
+    so slashes in the patterns are matched against underscores in the keys
+    """
+
+    #the end of a message key that identifies which chunk of its file the message holds
+    CHUNK_KEY_SUFFIX_REGEX = re.compile(r'_chunk_\d+_of_\d+$')
+
+    @property
+    def include_globs(self) :
+        return self.__include_globs #the patterns that paths must match one of to be kept (None to keep everything)
+    @property
+    def exclude_globs(self) :
+        return self.__exclude_globs #the patterns that paths must not match any of to be kept
+
+    def __init__(self,include_globs=None,exclude_globs=None) :
+        """
+        include_globs = a list of glob patterns on relative file paths; only messages for files matching
+                        at least one of them are kept (None or empty to keep messages for every file)
+        exclude_globs = a list of glob patterns on relative file paths; messages for files matching any of them
+                        are skipped (applied after the include patterns)
+        """
+        self.__include_globs = list(include_globs) if include_globs else None
+        self.__exclude_globs = list(exclude_globs) if exclude_globs else []
+        self.__include_key_globs = None
+        if self.__include_globs is not None :
+            self.__include_key_globs = [self.__class__.__get_key_glob(g) for g in self.__include_globs]
+        self.__exclude_key_globs = [self.__class__.__get_key_glob(g) for g in self.__exclude_globs]
+
+    def accepts(self,msg) :
+        """
+        Return True if the given (not yet deserialized) consumed message should be kept
+        Messages whose headers and keys can't be read are always kept, so that they go on to be handled like any others
+        """
+        for name,value in (msg.headers() or []) :
+            if name==MSG_HEADER_CONST.RELPATH :
+                try :
+                    return self.accepts_path(value.decode())
+                except (AttributeError,UnicodeDecodeError) :
+                    break
+        key = msg.key()
+        if isinstance(key,(bytes,bytearray)) :
+            try :
+                key = key.decode()
+            except UnicodeDecodeError :
+                return True
+        if not isinstance(key,str) :
+            return True
+        return self.accepts_path(self.__class__.CHUNK_KEY_SUFFIX_REGEX.sub('',key),key_globs=True)
+
+    def accepts_path(self,path,key_globs=False) :
+        """
+        Return True if the given relative file path passes the filters
+        (with key_globs=True, the path is given as it appears in a message key, with slashes replaced by underscores)
+        """
+        if isinstance(path,str) and not key_globs :
+            path = path.replace('\\','/')
+        elif not isinstance(path,str) :
+            path = path.as_posix()
+        include_globs = self.__include_key_globs if key_globs else self.__include_globs
+        exclude_globs = self.__exclude_key_globs if key_globs else self.__exclude_globs
+        if include_globs is not None and not any([fnmatch.fnmatchcase(path,g) for g in include_globs]) :
+            return False
+        return not any([fnmatch.fnmatchcase(path,g) for g in exclude_globs])
+
+    @staticmethod
+    def __get_key_glob(glob) :
+        """
+        Return the version of a glob pattern on relative file paths that matches the paths as encoded in message keys
+        """
+        return glob.replace('\\','/').lstrip('/').replace('/','_')
@@ -1,9 +1,18 @@
 #imports
-from .utilities import get_replaced_configs, get_next_message
+from .utilities import get_replaced_configs, get_message_headers, get_next_message, get_next_messages, commit_offsets
 from ..utilities.config_file_parser import ConfigFileParser
+from .loopback import is_loopback_config, LoopbackConsumer
 from confluent_kafka import Consumer, DeserializingConsumer
+from confluent_kafka.serialization import SerializationContext, MessageField
+from confluent_kafka.error import ConsumeError
+from ..utilities.metrics import METRICS
 import uuid
 
+#metrics
+N_MSGS_FILTERED = METRICS.counter('openmsi_messages_filtered_total',
+                                  'Consumed messages skipped without being deserialized because of '
+                                  'include/exclude filters')
+
 class MyConsumer(Consumer) :
     """
     Class to extend Kafka Consumers for specific scenarios
@@ -35,31 +44,161 @@ class MyConsumer(Consumer) :
         #if the auto.offset.reset was given as "none" then remove it from the configs
         if 'auto.offset.reset' in configs.keys() and configs['auto.offset.reset']=='none' :
             del configs['auto.offset.reset']
+        #if the bootstrap.servers start with "loopback://" consume from an in-process loopback broker instead
+        if is_loopback_config(configs) :
+            return MyLoopbackConsumer(configs)
         return cls(configs)
     
     def get_next_message(self,logger,*poll_args,**poll_kwargs) :
         return get_next_message(self,logger,*poll_args,**poll_kwargs)
 
-class MyDeserializingConsumer(DeserializingConsumer) :
+    def get_next_messages(self,logger,num_messages,timeout) :
+        return get_next_messages(self,logger,num_messages,timeout)
+
+    def commit_offsets(self,logger,*commit_args,**commit_kwargs) :
+        return commit_offsets(self,logger,*commit_args,**commit_kwargs)
+
+class MyLoopbackConsumer(LoopbackConsumer) :
     """
-    Class to extend Kafka Consumers for specific scenarios
+    A MyConsumer that consumes from an in-process loopback broker instead of a Kafka cluster
+    (returned by MyConsumer.from_file when the config file's bootstrap.servers start with "loopback://")
     """
 
-    def __init__(self,config_dict) :
+    def get_next_message(self,logger,*poll_args,**poll_kwargs) :
+        return get_next_message(self,logger,*poll_args,**poll_kwargs)
+
+    def get_next_messages(self,logger,num_messages,timeout) :
+        return get_next_messages(self,logger,num_messages,timeout)
+
+    def commit_offsets(self,logger,*commit_args,**commit_kwargs) :
+        return commit_offsets(self,logger,*commit_args,**commit_kwargs)
+
+class DeserializingConsumerMixin :
+    """
+    The parts of MyDeserializingConsumer that don't depend on where messages come from: messages can be filtered 
+    based on their keys or headers before their values are deserialized, and the headers of consumed 
+    DataFileChunk messages are decoded and attached to the chunks
+    Classes using it need to set _key_deserializer and _value_deserializer, and to implement _poll_raw and 
+    _consume_raw to get messages that haven't been deserialized yet
+    """
+
+    @property
+    def message_filter(self) :
+        return self.__message_filter #the MessageFilter applied to consumed messages (None if there isn't one)
+    @property
+    def n_msgs_filtered(self) :
+        return self.__n_msgs_filtered #the number of messages skipped so far because they didn't pass the filter
+
+    def __init__(self,config_dict,message_filter=None) :
         """
-        config_dict = dictionary of configuration parameters to set up the DeserializingConsumer
+        config_dict    = dictionary of configuration parameters to set up the consumer
+        message_filter = a MessageFilter to apply to messages before deserializing them (optional)
         """
         super().__init__(config_dict)
+        self.__message_filter = message_filter
+        self.__n_msgs_filtered = 0
+
+    def poll(self,timeout=-1) :
+        """
+        Overloaded from the base class to skip messages that don't pass the filter without deserializing them,
+        and to attach headers to deserialized values that hold them (like DataFileChunks)
+        (None is returned for a skipped message, just like when no message arrives before the timeout)
+        """
+        msg = self._poll_raw(timeout)
+        if msg is None :
+            return None
+        if msg.error() is not None :
+            raise ConsumeError(msg.error(),kafka_message=msg)
+        if self.__message_filter is not None and not self.__message_filter.accepts(msg) :
+            self.__n_msgs_filtered+=1
+            N_MSGS_FILTERED.inc()
+            return None
+        self.__deserialize(msg)
+        return msg
+
+    def consume(self,num_messages=1,timeout=-1) :
+        """
+        Overloaded from the base class (where it isn't implemented): consume a batch of up to num_messages messages, 
+        blocking for up to timeout seconds, and deserialize their keys and values in place
+        Messages that don't pass the filter are dropped from the batch without being deserialized
+        Messages that fail to deserialize are returned with the exception that was raised as their value 
+        instead of raising it, so that the rest of the batch isn't lost
+        """
+        msgs = self._consume_raw(num_messages,timeout)
+        if self.__message_filter is not None :
+            n_msgs = len(msgs)
+            msgs = [msg for msg in msgs if msg.error() is not None or self.__message_filter.accepts(msg)]
+            self.__n_msgs_filtered+=n_msgs-len(msgs)
+            N_MSGS_FILTERED.inc(n_msgs-len(msgs))
+        for msg in msgs :
+            if msg.error() is not None :
+                continue
+            try :
+                self.__deserialize(msg)
+            except Exception as e :
+                msg.set_value(e)
+        return msgs
+
+    def get_next_message(self,logger,*poll_args,**poll_kwargs) :
+        return get_next_message(self,logger,*poll_args,**poll_kwargs) 
+
+    def get_next_messages(self,logger,num_messages,timeout) :
+        return get_next_messages(self,logger,num_messages,timeout)
+
+    def commit_offsets(self,logger,*commit_args,**commit_kwargs) :
+        return commit_offsets(self,logger,*commit_args,**commit_kwargs)
+
+    def __deserialize(self,msg) :
+        """
+        Deserialize a consumed message's key and value in place (raises any exception from the deserializers,
+        in which case the message is left unchanged), attaching the message's decoded headers to values 
+        that have a "headers" attribute (like DataFileChunks)
+        """
+        key = msg.key()
+        if self._key_deserializer is not None :
+            key = self._key_deserializer(key,SerializationContext(msg.topic(),MessageField.KEY))
+        value = msg.value()
+        if self._value_deserializer is not None :
+            value = self._value_deserializer(value,SerializationContext(msg.topic(),MessageField.VALUE))
+        if hasattr(value,'headers') :
+            value.headers = get_message_headers(msg)
+        msg.set_key(key)
+        msg.set_value(value)
+
+class MyDeserializingConsumer(DeserializingConsumerMixin,DeserializingConsumer) :
+    """
+    Class to extend Kafka Consumers for specific scenarios
+    Messages can be filtered based on their keys or headers before their values are deserialized, and the headers
+    of consumed DataFileChunk messages are decoded and attached to the chunks
+    """
+
+    def __init__(self,config_dict,message_filter=None) :
+        """
+        config_dict    = dictionary of configuration parameters to set up the DeserializingConsumer
+        message_filter = a MessageFilter to apply to messages before deserializing them (optional)
+        """
+        super().__init__(config_dict,message_filter=message_filter)
 
     @classmethod
-    def from_file(cls,config_file_path,**kwargs) :
+    def from_config_dict(cls,config_dict,message_filter=None) :
+        """
+        Return a new consumer using the given configuration dictionary, which is a MyLoopbackDeserializingConsumer
+        if its bootstrap.servers start with "loopback://"
+        """
+        if is_loopback_config(config_dict) :
+            return MyLoopbackDeserializingConsumer(config_dict,message_filter=message_filter)
+        return cls(config_dict,message_filter=message_filter)
+
+    @classmethod
+    def from_file(cls,config_file_path,message_filter=None,**kwargs) :
         """
         config_file_path = path to the config file to use in defining this consumer
+        message_filter   = a MessageFilter to apply to messages before deserializing them (optional)
 
-        !!!!! any keyword arguments (that aren't 'logger') will be added to the configuration !!!!!
+        !!!!! any other keyword arguments (that aren't 'logger') will be added to the configuration !!!!!
         (with underscores replaced with dots)
         """
-        return cls(cls.get_config_dict(config_file_path,**kwargs))
+        return cls.from_config_dict(cls.get_config_dict(config_file_path,**kwargs),message_filter=message_filter)
 
     @staticmethod
     def get_config_dict(config_file_path,**kwargs) :
@@ -84,5 +223,30 @@ class MyDeserializingConsumer(DeserializingConsumer) :
         configs = get_replaced_configs(configs,'deserialization')
         return configs
 
-    def get_next_message(self,logger,*poll_args,**poll_kwargs) :
-        return get_next_message(self,logger,*poll_args,**poll_kwargs) 
+    def _poll_raw(self,timeout) :
+        return super(DeserializingConsumer,self).poll(timeout)
+
+    def _consume_raw(self,num_messages,timeout) :
+        return super(DeserializingConsumer,self).consume(num_messages,timeout)
+
+class MyLoopbackDeserializingConsumer(DeserializingConsumerMixin,LoopbackConsumer) :
+    """
+    A MyDeserializingConsumer that consumes from an in-process loopback broker instead of a Kafka cluster
+    (returned by MyDeserializingConsumer.from_file/from_config_dict when bootstrap.servers start with "loopback://")
+    """
+
+    def __init__(self,config_dict,message_filter=None) :
+        """
+        config_dict    = dictionary of configuration parameters, including the (instantiated) key and value 
+                         deserializers
+        message_filter = a MessageFilter to apply to messages before deserializing them (optional)
+        """
+        self._key_deserializer = config_dict.get('key.deserializer')
+        self._value_deserializer = config_dict.get('value.deserializer')
+        super().__init__(config_dict,message_filter=message_filter)
+
+    def _poll_raw(self,timeout) :
+        return LoopbackConsumer.poll(self,timeout)
+
+    def _consume_raw(self,num_messages,timeout) :
+        return LoopbackConsumer.consume(self,num_messages,timeout)
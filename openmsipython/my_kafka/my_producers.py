@@ -1,6 +1,7 @@
 #imports
 from .utilities import get_replaced_configs
 from ..utilities.config_file_parser import ConfigFileParser
+from .loopback import is_loopback_config, LoopbackProducer, LoopbackSerializingProducer
 from confluent_kafka import Producer, SerializingProducer
 
 class MyProducer(Producer) :
@@ -25,6 +26,9 @@ class MyProducer(Producer) :
             if argname=='logger' :
                 continue
             configs[argname.replace('_','.')]=arg
+        #if the bootstrap.servers start with "loopback://" produce to an in-process loopback broker instead
+        if is_loopback_config(configs) :
+            return LoopbackProducer(configs)
         return cls(configs)
 
 class MySerializingProducer(SerializingProducer) :
@@ -52,4 +56,7 @@ class MySerializingProducer(SerializingProducer) :
         #if one of several recognized serializers have been given as config paramenters for the key/value serializer, 
         #replace them with the actual class
         configs = get_replaced_configs(configs,'serialization')
+        #if the bootstrap.servers start with "loopback://" produce to an in-process loopback broker instead
+        if is_loopback_config(configs) :
+            return LoopbackSerializingProducer(configs)
         return cls(configs)
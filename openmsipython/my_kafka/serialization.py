@@ -26,6 +26,7 @@ class DataFileChunkSerializer(Serializer) :
             ordered_properties.append(file_chunk_obj.subdir_str)
             ordered_properties.append(file_chunk_obj.filename_append)
             ordered_properties.append(file_chunk_obj.data)
+            ordered_properties.append(file_chunk_obj.file_size)
             return msgpack.packb(ordered_properties,use_bin_type=True)
         except Exception as e :
             raise SerializationError(f'ERROR: failed to serialize a DataFileChunk! Exception: {e}')
@@ -38,8 +39,9 @@ class DataFileChunkDeserializer(Deserializer) :
         try :
             #unpack the byte array
             ordered_properties = msgpack.unpackb(byte_array,raw=True)
-            if len(ordered_properties)!=9 :
-                errmsg = 'ERROR: unrecognized token passed to DataFileChunkDeserializer. Expected 9 properties'
+            #(messages produced before the file size was added have only 9 properties)
+            if len(ordered_properties) not in (9,10) :
+                errmsg = 'ERROR: unrecognized token passed to DataFileChunkDeserializer. Expected 9 or 10 properties'
                 errmsg+= f' but found {len(ordered_properties)}'
                 raise ValueError(errmsg)
             try :
@@ -53,6 +55,9 @@ class DataFileChunkDeserializer(Deserializer) :
                 subdir_str = str(ordered_properties[6].decode())
                 filename_append = str(ordered_properties[7].decode())
                 data = ordered_properties[8]
+                file_size = None
+                if len(ordered_properties)>9 and ordered_properties[9] is not None :
+                    file_size = int(ordered_properties[9])
             except Exception as e :
                 errmsg = f'ERROR: unrecognized value(s) when deserializing a DataFileChunk from token. Exception: {e}'
                 raise ValueError(errmsg)
@@ -70,7 +75,8 @@ class DataFileChunkDeserializer(Deserializer) :
             subdir_path = pathlib.PurePosixPath(subdir_str)
             filepath = pathlib.Path('').joinpath(*(subdir_path.parts),filename)
             return DataFileChunk(filepath,filename,file_hash,chunk_hash,chunk_offset_read,chunk_offset_write,
-                                 len(data),chunk_i,n_total_chunks,data=data,filename_append=filename_append)
+                                 len(data),chunk_i,n_total_chunks,data=data,filename_append=filename_append,
+                                 file_size=file_size)
         except Exception as e :
             raise SerializationError(f'ERROR: failed to deserialize a DataFileChunk! Exception: {e}')
 
@@ -1,7 +1,20 @@
 #imports
 from .serialization import DataFileChunkSerializer, DataFileChunkDeserializer
+from confluent_kafka import KafkaError, KafkaException
 from confluent_kafka.serialization import DoubleSerializer, IntegerSerializer, StringSerializer
 from confluent_kafka.serialization import DoubleDeserializer, IntegerDeserializer, StringDeserializer
+from ..utilities.metrics import METRICS
+from ..utilities.logging import RateLimitedWarnings
+
+#metrics
+N_MSGS_CONSUMED = METRICS.counter('openmsi_messages_consumed_total','Messages consumed successfully')
+N_MSGS_SKIPPED = METRICS.counter('openmsi_messages_invalid_total',
+                                 'Consumed messages skipped because of errors or values that could not be deserialized')
+
+#rate-limited warnings for problems consuming messages
+CONSUME_ERROR_WARNINGS = RateLimitedWarnings('consume_error','errors raised by calls to poll or consume')
+UNEXPECTED_MESSAGE_WARNINGS = RateLimitedWarnings('unexpected_message','consumed messages with errors or no values')
+DESERIALIZATION_WARNINGS = RateLimitedWarnings('deserialization','consumed messages that could not be deserialized')
 
 def get_transformed_configs(configs,names_to_classes) :
     """
@@ -41,6 +54,29 @@ def get_replaced_configs(configs,replacement_type) :
         raise ValueError(f'ERROR: unrecognized replacement_type "{replacement_type}" in get_replaced_configs!')
     return get_transformed_configs(configs,names_classes)
 
+def get_message_headers(msg) :
+    """
+    Return a dictionary of the headers of a consumed message, with their values decoded to strings
+    (headers whose values aren't valid text are left as bytes)
+    """
+    headers = {}
+    for name,value in (msg.headers() or []) :
+        if isinstance(value,(bytes,bytearray)) :
+            try :
+                value = value.decode()
+            except UnicodeDecodeError :
+                pass
+        headers[name] = value
+    return headers
+
+def get_unexpected_message_warning(consumed_msg) :
+    """
+    Return the warning to log about a consumed message that has an error or no value
+    """
+    warnmsg = f'WARNING: unexpected consumed message, consumed_msg = {consumed_msg}'
+    warnmsg+= f', consumed_msg.error() = {consumed_msg.error()}, consumed_msg.value() = {consumed_msg.value()}'
+    return warnmsg
+
 def get_next_message(consumer,logger,*poll_args,**poll_kwargs) :
     """
     Call "poll" for the given consumer and return any successfully consumed message
@@ -52,13 +88,59 @@ def get_next_message(consumer,logger,*poll_args,**poll_kwargs) :
     except Exception as e :
         warnmsg = 'WARNING: encountered an error in a call to consumer.poll() and will skip the offending message. '
         warnmsg+= f'Error: {e}'
-        logger.warning(warnmsg)
+        CONSUME_ERROR_WARNINGS.warning(logger,warnmsg)
         return
     if consumed_msg is not None :
         if consumed_msg.error() is not None or consumed_msg.value() is None :
-            warnmsg = f'WARNING: unexpected consumed message, consumed_msg = {consumed_msg}'
-            warnmsg+= f', consumed_msg.error() = {consumed_msg.error()}, consumed_msg.value() = {consumed_msg.value()}'
-            logger.warning(warnmsg)
+            UNEXPECTED_MESSAGE_WARNINGS.warning(logger,lambda : get_unexpected_message_warning(consumed_msg))
+            N_MSGS_SKIPPED.inc()
+        else :
+            N_MSGS_CONSUMED.inc()
         return consumed_msg.value()
     else :
         return
+
+def get_next_messages(consumer,logger,num_messages,timeout) :
+    """
+    Call "consume" for the given consumer to get a batch of up to num_messages messages, blocking for up to 
+    timeout seconds, and return a list of the values of all the messages that were successfully consumed
+    Logs a warning for any message that has an error, no value, or a value that couldn't be deserialized 
+    (a consumer's "consume" function may return the exception raised in deserializing a message as its value)
+    """
+    try :
+        consumed_msgs = consumer.consume(num_messages=num_messages,timeout=timeout)
+    except Exception as e :
+        warnmsg = 'WARNING: encountered an error in a call to consumer.consume() and will skip the batch of messages. '
+        warnmsg+= f'Error: {e}'
+        CONSUME_ERROR_WARNINGS.warning(logger,warnmsg)
+        return []
+    values = []
+    for consumed_msg in consumed_msgs :
+        if consumed_msg.error() is not None or consumed_msg.value() is None :
+            UNEXPECTED_MESSAGE_WARNINGS.warning(logger,lambda : get_unexpected_message_warning(consumed_msg))
+            N_MSGS_SKIPPED.inc()
+            continue
+        if isinstance(consumed_msg.value(),Exception) :
+            warnmsg = 'WARNING: failed to deserialize a consumed message and will skip it. '
+            warnmsg+= f'Error: {consumed_msg.value()}'
+            DESERIALIZATION_WARNINGS.warning(logger,warnmsg)
+            N_MSGS_SKIPPED.inc()
+            continue
+        values.append(consumed_msg.value())
+    N_MSGS_CONSUMED.inc(len(values))
+    return values
+
+def commit_offsets(consumer,logger,*commit_args,**commit_kwargs) :
+    """
+    Call "commit" for the given consumer (synchronously by default) and return True if offsets were committed
+    Returns False and logs a warning if the commit fails, or just returns False if there was nothing to commit
+    """
+    commit_kwargs['asynchronous'] = commit_kwargs.get('asynchronous',False)
+    try :
+        consumer.commit(*commit_args,**commit_kwargs)
+    except KafkaException as e :
+        if len(e.args)>0 and isinstance(e.args[0],KafkaError) and e.args[0].code()==KafkaError._NO_OFFSET :
+            return False
+        logger.warning(f'WARNING: failed to commit offsets for a consumer. Error: {e}')
+        return False
+    return True
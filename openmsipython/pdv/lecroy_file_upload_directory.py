@@ -37,7 +37,8 @@ class LecroyFileUploadDirectory(DataFileUploadDirectory) :
 
     @classmethod
     def get_command_line_arguments(cls) :
-        args = ['upload_dir','chunk_size','queue_max_size','update_seconds']
+        args = ['upload_dir','chunk_size','queue_max_size','update_seconds','control_socket',
+                'metrics_port']
         kwargs = {'config':RUN_OPT_CONST.PRODUCTION_CONFIG_FILE,
                   'topic_name':LECROY_CONST.TOPIC_NAME,
                   'n_threads':1}
@@ -51,7 +52,8 @@ class LecroyFileUploadDirectory(DataFileUploadDirectory) :
         parser = cls.get_argument_parser()
         args = parser.parse_args(args=args)
         #make the LecroyFileUploadDirectory for the specified directory
-        upload_file_directory = cls(args.upload_dir,update_secs=args.update_seconds)
+        upload_file_directory = cls(args.upload_dir,update_secs=args.update_seconds,control_socket=args.control_socket,
+                                    metrics_port=args.metrics_port,**cls.get_profiling_kwargs(args))
         #listen for new files in the directory and run uploads as they come in until the process is shut down
         run_start = datetime.datetime.now()
         upload_file_directory.logger.info(f'Listening for Lecroy files to be added to {args.upload_dir}...')
@@ -4,9 +4,9 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import pandas as pd
-from io import BytesIO
-from ..data_file_io.config import RUN_OPT_CONST
+from ..data_file_io.config import RUN_OPT_CONST, DATA_FILE_HANDLING_CONST
 from ..utilities.runnable import Runnable
+from ..utilities.misc import get_filepaths_message
 from ..data_file_io.data_file_stream_processor import DataFileStreamProcessor
 from .pdv_analysis import PDVSpallAnalysis, PDVVelocityAnalysis
 from .lecroy_data_file import DownloadLecroyDataFile
@@ -15,7 +15,8 @@ from .config import LECROY_CONST
 class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
     """
     Class to consume DataFileChunk messages from UploadLecroyDataFiles into memory
-    and create spall/velocity plots from them when all of their data are available
+    and create spall and/or velocity plots from them when all of their data are available
+    (each file is only consumed once no matter how many types of plots are made from it)
     """
 
     @property
@@ -24,17 +25,26 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
 
     def __init__(self,output_dir,pdv_plot_type,config_path,topic_name,
                  header_rows=LECROY_CONST.HEADER_ROWS,**otherkwargs) :
+        """
+        pdv_plot_type = the type of plots to make ("spall" or "velocity"), or a list of several types
+        """
         self.__output_dir = output_dir
         if not self.__output_dir.is_dir() :
             self.__output_dir.mkdir(parents=True)
         super().__init__(config_path,topic_name,datafile_type=DownloadLecroyDataFile,**otherkwargs)
-        self.__pdv_analysis_type = None
-        if pdv_plot_type=='spall' :
-            self.__pdv_analysis_type = PDVSpallAnalysis
-        elif pdv_plot_type=='velocity' :
-            self.__pdv_analysis_type = PDVVelocityAnalysis
-        else :
-            self.logger.error(f'ERROR: unrecognized pdv_plot_type {pdv_plot_type}',ValueError)
+        pdv_plot_types = [pdv_plot_type] if isinstance(pdv_plot_type,str) else pdv_plot_type
+        self.__pdv_analysis_types = []
+        for plot_type in pdv_plot_types :
+            if plot_type=='spall' :
+                pdv_analysis_type = PDVSpallAnalysis
+            elif plot_type=='velocity' :
+                pdv_analysis_type = PDVVelocityAnalysis
+            else :
+                self.logger.error(f'ERROR: unrecognized pdv_plot_type {plot_type}',ValueError)
+            self.__pdv_analysis_types.append(pdv_analysis_type)
+            #make every type of plot from each file as it's read
+            self.add_processor(PDVPlotMaker.make_pdv_plot,name=f'{plot_type} plots',
+                               output_dir=self.__output_dir,pdv_analysis_type=pdv_analysis_type)
         self.__header_rows = header_rows
 
     def make_plots_as_available(self) :
@@ -44,35 +54,40 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         _,processed_data_filepaths = self.process_files_as_read()
         created_plot_paths = []
         for pdfp in processed_data_filepaths :
-            fn = self.__pdv_analysis_type.plot_file_name_from_input_file_name(pdfp.name,
-                                                                              LECROY_CONST.SKIMMED_FILENAME_APPEND)
-            created_plot_paths.append(self.__output_dir/fn)
+            for pdv_analysis_type in self.__pdv_analysis_types :
+                fn = pdv_analysis_type.plot_file_name_from_input_file_name(pdfp.name,
+                                                                           LECROY_CONST.SKIMMED_FILENAME_APPEND)
+                created_plot_paths.append(self.__output_dir/fn)
         return self.n_msgs_read, created_plot_paths
 
-    def _process_downloaded_data_file(self,datafile) :
+    @staticmethod
+    def make_pdv_plot(datafile,output_dir,pdv_analysis_type) :
         """
-        Make plots for the data in the given file
+        Make plots for the data in the given file using the given type of analysis and save them in output_dir
+        Returns None if the plots were made successfully and an Exception otherwise
+        (a staticmethod so that it can be registered as a processor and run in a pool of separate processes)
         """
         try :
-            #get the raw data from the file's bytestring
-            data = pd.read_csv(BytesIO(datafile.bytestring),skiprows=datafile.header_rows)
+            #get the raw data from the file's bytestring (read in place, without copying it)
+            with datafile.data_reader as reader :
+                data = pd.read_csv(reader,skiprows=datafile.header_rows)
             data.columns = ['Time','Ampl']
             time = data['Time'].to_numpy()
             voltage = data['Ampl'].to_numpy()
             #run the analysis using the data
             fig = plt.figure(figsize=(10,6),dpi=300)
-            analysis = self.__pdv_analysis_type(file=datafile.filepath,
-                                                time=time,
-                                                voltage=voltage,
-                                                output_dir=self.__output_dir,
-                                                N=512,
-                                                overlap_frac=0.85,
-                                                pyplot_figure=fig)#self.__figure)
+            analysis = pdv_analysis_type(file=datafile.filepath,
+                                         time=time,
+                                         voltage=voltage,
+                                         output_dir=output_dir,
+                                         N=512,
+                                         overlap_frac=0.85,
+                                         pyplot_figure=fig)#self.__figure)
             analysis.run()
             #save the plot and close the figure
-            fn = self.__pdv_analysis_type.plot_file_name_from_input_file_name(datafile.filepath.name,
-                                                                              LECROY_CONST.SKIMMED_FILENAME_APPEND)
-            fig.savefig(self.__output_dir/fn,bbox_inches='tight')
+            fn = pdv_analysis_type.plot_file_name_from_input_file_name(datafile.filepath.name,
+                                                                       LECROY_CONST.SKIMMED_FILENAME_APPEND)
+            fig.savefig(output_dir/fn,bbox_inches='tight')
             plt.close()
         except Exception as e :
             return e
@@ -80,7 +95,8 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
 
     @classmethod
     def get_command_line_arguments(cls) :
-        args = ['output_dir','pdv_plot_type','update_seconds']
+        args = ['output_dir','pdv_plot_type','update_seconds','n_processes','n_processing_workers',
+                'include','exclude','control_socket','metrics_port']
         kwargs = {'config':RUN_OPT_CONST.PRODUCTION_CONFIG_FILE,
                   'topic_name':LECROY_CONST.TOPIC_NAME,
                   'n_threads':RUN_OPT_CONST.N_DEFAULT_DOWNLOAD_THREADS,
@@ -98,13 +114,21 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         #make the plot maker
         plot_maker = cls(args.output_dir,args.pdv_plot_type,args.config,args.topic_name,
                          n_threads=args.n_threads,
+                         n_processes=args.n_processes,
+                         n_processing_workers=args.n_processing_workers,
                          update_secs=args.update_seconds,
+                         control_socket=args.control_socket,
+                         metrics_port=args.metrics_port,
                          consumer_group_ID=args.consumer_group_ID,
-                         logger_file=args.output_dir)
+                         include_globs=args.include,
+                         exclude_globs=args.exclude,
+                         processed_file_index=args.output_dir/DATA_FILE_HANDLING_CONST.PROCESSED_FILE_INDEX_NAME,
+                         logger_file=args.output_dir,
+                         **cls.get_profiling_kwargs(args))
         #start the plot maker running (returns total number of messages read and names of plot files created)
         run_start = datetime.datetime.now()
         msg = f'Listening to the {args.topic_name} topic to find Lecroy data files and create '
-        msg+= f'{args.pdv_plot_type} plots'
+        msg+= f'{" and ".join(args.pdv_plot_type)} plots'
         plot_maker.logger.info(msg)
         n_msgs,plot_filepaths = plot_maker.make_plots_as_available()
         run_stop = datetime.datetime.now()
@@ -123,6 +147,10 @@ class PDVPlotMaker(DataFileStreamProcessor,Runnable) :
         for fn in plot_filepaths :
             msg+=f'\n\t{fn}'
         plot_maker.logger.info(msg)
+        if plot_maker.n_files_skipped>0 :
+            msg = get_filepaths_message(plot_maker.skipped_filepaths,'skipped because they had already been processed',
+                                        plot_maker.n_files_skipped)
+            plot_maker.logger.info(msg)
 
 #################### MAIN METHOD TO RUN FROM COMMAND LINE ####################
 
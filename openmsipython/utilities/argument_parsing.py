@@ -61,6 +61,26 @@ def positive_int(argval) :
         raise ValueError(f'ERROR: invalid argument: {argval} must be a positive integer!')
     return argval
 
+#make sure a given value is a non-negative integer
+def non_negative_int(argval) :
+    try :
+        argval = int(argval)
+    except Exception as e :
+        raise ValueError(f'ERROR: could not convert {argval} to an integer in non_negative_int! Exception: {e}')
+    if (not isinstance(argval,int)) or (argval<0) :
+        raise ValueError(f'ERROR: invalid argument: {argval} must be a non-negative integer!')
+    return argval
+
+#make sure a given value is a non-negative number
+def non_negative_float(argval) :
+    try :
+        argval = float(argval)
+    except Exception as e :
+        raise ValueError(f'ERROR: could not convert {argval} to a float in non_negative_float! Exception: {e}')
+    if argval<0 :
+        raise ValueError(f'ERROR: invalid argument: {argval} must be a non-negative number!')
+    return argval
+
 #################### MYARGUMENTPARSER CLASS ####################
 
 class MyArgumentParser(ArgumentParser) :
@@ -85,6 +105,16 @@ class MyArgumentParser(ArgumentParser) :
         'n_threads':
             ['optional',{'default':UTIL_CONST.DEFAULT_N_THREADS,'type':positive_int,
                          'help':'Maximum number of threads to use'}],
+        'n_processes':
+            ['optional',{'default':RUN_OPT_CONST.N_DEFAULT_WORKER_PROCESSES,'type':positive_int,
+                         'help':'Number of worker processes to split the work between (each using n_threads threads)'}],
+        'n_processing_workers':
+            ['optional',{'default':RUN_OPT_CONST.N_DEFAULT_PROCESSING_WORKERS,'type':non_negative_int,
+                         'help':'Number of processes in a pool to process fully-read files in (0 = no pool)'}],
+        'stale_file_timeout':
+            ['optional',{'default':RUN_OPT_CONST.DEFAULT_STALE_FILE_TIMEOUT,'type':non_negative_float,
+                         'help':'''Number of seconds a file being reconstructed can go without receiving new data 
+                                   before its partial data are quarantined and it's forgotten about (0 = never)'''}],
         'chunk_size':
             ['optional',{'default':RUN_OPT_CONST.DEFAULT_CHUNK_SIZE,'type':int_power_of_two,
                          'help':'''Max size (in bytes) of chunks into which files should be broken 
@@ -105,9 +135,37 @@ class MyArgumentParser(ArgumentParser) :
         'consumer_group_ID':
             ['optional',{'default':str(uuid.uuid1()),
                          'help':'ID to use for all consumers in the group'}],
+        'control_socket':
+            ['optional',{'default':None,'type':pathlib.Path,
+                         'help':'''Path to a Unix socket to create and listen on for control commands 
+                                   (one per line), for example when running without a console'''}],
+        'metrics_port':
+            ['optional',{'default':None,'type':int,
+                         'help':'''Local port to serve metrics on over HTTP (in the Prometheus text format, 
+                                   at /metrics) while running'''}],
+        'profile':
+            ['optional',{'action':'store_true',
+                         'help':'''Add this flag to profile every thread with cProfile and write out the statistics 
+                                   when the program shuts down (or when the "profile" command is given)'''}],
+        'profile_output':
+            ['optional',{'default':None,'type':create_dir,
+                         'help':'''Path to the directory to write profiling statistics (and memory snapshots) to 
+                                   (default is a new "openmsi_profiles" directory in the current directory)'''}],
+        'tracemalloc_seconds':
+            ['optional',{'default':None,'type':float,
+                         'help':'''While profiling, also trace memory allocations and take a snapshot 
+                                   every this many seconds'''}],
+        'include':
+            ['optional',{'default':None,'nargs':'+','metavar':'GLOB',
+                         'help':'''Only consume messages for files whose paths (relative to the uploaded directory) 
+                                   match one of these glob patterns'''}],
+        'exclude':
+            ['optional',{'default':None,'nargs':'+','metavar':'GLOB',
+                         'help':'''Skip messages for files whose paths (relative to the uploaded directory) 
+                                   match any of these glob patterns'''}],
         'pdv_plot_type':
-            ['optional',{'choices':['spall','velocity'],'default':'spall',
-                         'help':'Type of analysis to perform ("spall" or "velocity")'}],
+            ['optional',{'choices':['spall','velocity'],'default':['spall'],'nargs':'+',
+                         'help':'Type(s) of analysis to perform ("spall" and/or "velocity")'}],
         'optional_output_dir':
             ['optional',{'type':create_dir,
                          'help':'Optional path to directory to put output in'}],
@@ -18,5 +18,45 @@ class UtilityConstants :
     def DEFAULT_UPDATE_SECONDS(self) :
         return 30     # how many seconds to wait by default between printing the "still alive" character/message 
                       #for a running process
+    @property
+    def CONTROL_WAIT_SECONDS(self) :
+        return 0.5    # max number of seconds a running process waits for a control command at a time 
+                      #(before checking whether it's received a signal or been shut down from elsewhere)
+    @property
+    def DEFAULT_LATENCY_BUCKETS(self) :
+        return (0.0001,0.0005,0.001,0.005,0.01,0.05,0.1,0.5,1.,5.,10.,60.,300.) # upper bounds (in seconds) of the 
+                                                                              #buckets in latency histograms
+    @property
+    def METRICS_HOST(self) :
+        return '127.0.0.1' # the address the metrics HTTP endpoint listens on (only local connections by default)
+    @property
+    def DEFAULT_PROFILE_DIR_NAME(self) :
+        return 'openmsi_profiles' # name of the directory profiling statistics are written to by default
+    @property
+    def N_TRACEMALLOC_LINES_TO_LOG(self) :
+        return 10 # how many lines of each tracemalloc snapshot comparison to log
+    @property
+    def N_WARNINGS_BEFORE_SUPPRESSING(self) :
+        return 5      # how many times a rate-limited warning is logged in each period before similar ones are 
+                      #suppressed
+    @property
+    def WARNING_SUMMARY_SECONDS(self) :
+        return 60.    # the length of each period (in seconds) after which a summary of the suppressed warnings 
+                      #from a rate-limited call site is logged
+    @property
+    def LOOPBACK_PREFIX(self) :
+        return 'loopback://' # bootstrap.servers values starting with this use the in-process loopback transport
+    @property
+    def LOOPBACK_DEFAULT_N_PARTITIONS(self) :
+        return 8      # number of partitions new loopback topics are created with (unless num.partitions is given)
+    @property
+    def LOOPBACK_SEGMENT_BYTES(self) :
+        return 64*1024*1024 # size after which a new segment file is started in each partition of a loopback log
+    @property
+    def LOOPBACK_MAX_BUFFERED_MESSAGES(self) :
+        return 100000 # max number of messages a loopback producer holds before produce raises BufferError
+    @property
+    def LOOPBACK_WAIT_SECONDS(self) :
+        return 0.02   # how often loopback consumers check segment files written by other processes for new messages
 
 UTIL_CONST = UtilityConstants()
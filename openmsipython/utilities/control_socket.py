@@ -0,0 +1,75 @@
+#imports
+import os, socket, socketserver, pathlib
+from threading import Thread
+
+class ControlSocketRequestHandler(socketserver.StreamRequestHandler) :
+    """
+    Reads control commands (one per line) from a connection to a ControlSocket and adds them to its queue
+    """
+
+    def handle(self) :
+        for line in self.rfile :
+            cmd = line.decode(errors='replace').strip()
+            if cmd=='' :
+                continue
+            self.server.command_queue.put(cmd)
+            try :
+                self.wfile.write(f'received {cmd}\n'.encode())
+            except (BrokenPipeError,ConnectionResetError) :
+                return #the client doesn't need to read the acknowledgement
+
+class ControlSocketServer(socketserver.ThreadingMixIn,getattr(socketserver,'UnixStreamServer',object)) :
+    """
+    The server listening on a ControlSocket (with a thread for each connection)
+    """
+    daemon_threads = True
+
+    def __init__(self,path,command_queue) :
+        self.command_queue = command_queue
+        super().__init__(str(path),ControlSocketRequestHandler)
+
+class ControlSocket :
+    """
+    A local Unix socket through which control commands can be sent to a running ControlledProcess
+    (for example when it's run as a service without any console input), one command per line
+    Each command that's received is acknowledged with a line reading "received [command]"
+    """
+
+    @property
+    def path(self) :
+        return self.__path #the path to the socket file
+
+    def __init__(self,path,command_queue,logger) :
+        """
+        path          = the path to the socket file to create (replaced if it already exists)
+        command_queue = the queue to add the commands that are received to
+        logger        = the logger to use
+        """
+        self.__path = pathlib.Path(path)
+        self.__logger = logger
+        if not hasattr(socket,'AF_UNIX') :
+            self.__logger.error('ERROR: control sockets require Unix domain sockets, which are not available here!',
+                                RuntimeError)
+        if self.__path.exists() :
+            if not self.__path.is_socket() :
+                errmsg = f'ERROR: cannot create a control socket at {self.__path} because a file that is not '
+                errmsg+= 'a socket already exists there!'
+                self.__logger.error(errmsg,FileExistsError)
+            self.__path.unlink()
+        self.__server = ControlSocketServer(self.__path,command_queue)
+        self.__thread = Thread(target=self.__server.serve_forever,kwargs={'poll_interval':0.5})
+        self.__thread.daemon = True
+        self.__thread.start()
+        self.__logger.info(f'Listening for control commands on socket {self.__path}')
+
+    def close(self) :
+        """
+        Stop listening for commands and remove the socket file
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        try :
+            os.unlink(self.__path)
+        except FileNotFoundError :
+            pass
@@ -1,17 +1,33 @@
 #imports
-import time
-from queue import Queue
-from threading import Thread
+import sys, time, signal, traceback, tracemalloc
+from queue import Queue, Empty
+from threading import Thread, current_thread, main_thread, enumerate as enumerate_threads
 from abc import ABC, abstractmethod
 from .config import UTIL_CONST
 from .misc import add_user_input
 from .logging import LogOwner
+from .control_socket import ControlSocket
+from .metrics import METRICS, MetricsServer, Counter, Gauge
+from .profiling import ThreadProfiler
 
 class ControlledProcess(LogOwner,ABC) :
     """
     A class to use when running processes that should remain active until they are explicitly shut down
+    Control commands can be typed into the console, put in the control command queue, sent through a local
+    Unix socket, or (to shut down) given as SIGTERM/SIGINT signals
+    Commands are "quit"/"q" to shut down, "check"/"c" to run _on_check (and log a summary of the metrics recorded 
+    so far), "scale N" to change the number of worker threads to N (for processes that support it), 
+    and "profile" to write out the profiling statistics collected so far (if the process is being profiled)
+    Diagnostic commands log what the process is doing without interrupting it: "stats" (rates of the counted metrics 
+    and values like queue depths), "mem" (the sizes of the state kept for each file and the largest memory 
+    allocations), "threads" (the stack of every running thread), and "files" (the progress of files in flight)
+    Metrics can also be served over HTTP in the Prometheus text format while the process is running
+    The thread running the process waits on the control command queue instead of polling it
     """
 
+    #commands that are passed to _on_diagnostic_command
+    DIAGNOSTIC_COMMANDS = ('profile','stats','mem','threads','files')
+
     #################### PROPERTIES ####################
 
     @property
@@ -20,15 +36,36 @@ class ControlledProcess(LogOwner,ABC) :
     @property
     def control_command_queue(self) :
         return self.__control_command_queue
+    @property
+    def profiler(self) :
+        return self.__profiler #the ThreadProfiler to wrap the targets of new threads with (None if not profiling)
 
     #################### PUBLIC FUNCTIONS ####################
 
-    def __init__(self,*args,update_secs=UTIL_CONST.DEFAULT_UPDATE_SECONDS,**other_kwargs) :
+    def __init__(self,*args,update_secs=UTIL_CONST.DEFAULT_UPDATE_SECONDS,handle_signals=True,control_socket=None,
+                 metrics_port=None,profile=False,profile_output=None,tracemalloc_secs=None,**other_kwargs) :
         """
-        update_secs = number of seconds to wait between printing a progress character to the console 
-                      to indicate the program is alive
+        update_secs      = number of seconds to wait between printing a progress character to the console 
+                           to indicate the program is alive
+        handle_signals   = if True, SIGTERM and SIGINT shut the process down cleanly 
+                           (only if it's run from the main thread)
+        control_socket   = the path to a Unix socket to create and listen on for control commands (optional)
+        metrics_port     = the local port to serve metrics on over HTTP while running (optional, 0 for any free port)
+        profile          = if True, profile every thread the process runs in with cProfile and write out 
+                           the statistics when it's shut down
+        profile_output   = the directory to write profiling statistics to (optional)
+        tracemalloc_secs = if given while profiling, also take a tracemalloc snapshot every this many seconds
         """
         self.__update_secs = update_secs
+        self.__handle_signals = handle_signals
+        self.__control_socket_path = control_socket
+        self.__control_socket = None
+        self.__metrics_port = metrics_port
+        self.__metrics_server = None
+        self.__previous_signal_handlers = {}
+        self.__signal_received = None
+        self.__last_stats = (time.time(),{}) #the time and counter values of the last "stats" command
+        self.__tracing_memory = False
         #start up a Queue that will hold the control commands
         self.__control_command_queue = Queue()
         #use a daemon thread to allow a user to input control commands from the command line 
@@ -39,14 +76,30 @@ class ControlledProcess(LogOwner,ABC) :
         #a variable to indicate if the process has been shut down yet
         self.__alive = False
         super().__init__(*args,**other_kwargs)
+        #the profiler is set up once the logger exists
+        self.__profiler = None
+        if profile :
+            self.__profiler = ThreadProfiler(profile_output,self.logger,tracemalloc_secs)
 
     def shutdown(self) :
         """
         Stop the process running
         """
-        self.__control_command_queue.task_done()
         self.__alive = False
+        #stop handling signals so that a second one can interrupt a slow shutdown
+        self.__restore_signal_handlers()
+        if self.__control_socket is not None :
+            self.__control_socket.close()
+            self.__control_socket = None
         self._on_shutdown()
+        if self.__metrics_server is not None :
+            self.__metrics_server.close()
+            self.__metrics_server = None
+        if self.__profiler is not None :
+            self.__profiler.stop()
+        if self.__tracing_memory :
+            tracemalloc.stop()
+            self.__tracing_memory = False
 
     #################### PRIVATE HELPER FUNCTIONS ####################
 
@@ -56,14 +109,191 @@ class ControlledProcess(LogOwner,ABC) :
             self.logger.debug('.')
             self.__last_update = time.time()
 
-    def _check_control_command_queue(self) :
-        #if anything exists in the control command queue
-        if not self.__control_command_queue.empty() :
-            cmd = self.__control_command_queue.get()
-            if cmd.lower() in ('q','quit') : # shut down the process
-                self.shutdown()
-            elif cmd.lower() in ('c','check') : # run the on_check function
-                self._on_check()
+    def _get_control_wait_time(self) :
+        """
+        Return the number of seconds to wait for a control command before the "still alive" character 
+        is due to be printed (at most UTIL_CONST.CONTROL_WAIT_SECONDS, to notice signals and external shutdowns)
+        """
+        if self.__update_secs==-1 :
+            return UTIL_CONST.CONTROL_WAIT_SECONDS
+        time_to_update = self.__last_update+self.__update_secs-time.time()
+        return max(0.,min(time_to_update,UTIL_CONST.CONTROL_WAIT_SECONDS))
+
+    def _check_control_command_queue(self,timeout=None) :
+        """
+        Handle the next command in the control command queue, if there is one, or shut down if a signal was received
+        timeout = the number of seconds to wait for a command to arrive (don't wait at all if None)
+        """
+        if self.__signal_received is not None :
+            self.logger.info(f'Received {signal.Signals(self.__signal_received).name}, shutting down')
+            self.__signal_received = None
+            self.shutdown()
+            return
+        try :
+            if timeout is None :
+                cmd = self.__control_command_queue.get_nowait()
+            else :
+                cmd = self.__control_command_queue.get(timeout=timeout)
+        except Empty :
+            return
+        self.__control_command_queue.task_done()
+        cmd = cmd.strip().lower()
+        if cmd in ('q','quit') : # shut down the process
+            self.shutdown()
+        elif cmd in ('c','check') : # run the on_check function and summarize the metrics
+            self._on_check()
+            metrics_summary = METRICS.get_summary()
+            if metrics_summary is not None :
+                self.logger.debug(metrics_summary)
+        elif cmd.split()[:1]==['scale'] : # change the number of worker threads
+            try :
+                n_threads = int(cmd.split()[1])
+                if n_threads<1 or len(cmd.split())!=2 :
+                    raise ValueError
+            except (IndexError,ValueError) :
+                self.logger.warning(f'WARNING: invalid command "{cmd}" (expected "scale N" with N a positive integer)')
+                return
+            self._on_scale(n_threads)
+        elif cmd in self.DIAGNOSTIC_COMMANDS : # write out profiling statistics or log diagnostic information
+            #a diagnostic command failing shouldn't take the process down with it
+            try :
+                self._on_diagnostic_command(cmd)
+            except Exception :
+                self.logger.error(f'ERROR: failed to run the "{cmd}" command!\n{traceback.format_exc()}')
+
+    def _on_scale(self,n_threads) :
+        """
+        This function is run when a "scale N" command is found in the control queue
+        Can be overridden in subclasses that can change their number of worker threads while running
+        """
+        self.logger.warning(f'WARNING: {self.__class__.__name__} does not support changing its number of threads')
+
+    def _on_diagnostic_command(self,cmd) :
+        """
+        This function is run when one of the DIAGNOSTIC_COMMANDS is found in the control queue
+        Can be overridden in subclasses that have other processes to pass the command along to
+        """
+        if cmd=='profile' :
+            if self.__profiler is None :
+                self.logger.warning('WARNING: not profiling (run with --profile to collect profiling statistics)')
+                return
+            self.__profiler.dump()
+        elif cmd=='stats' :
+            self.__log_stats()
+        elif cmd=='mem' :
+            self.__log_memory()
+        elif cmd=='threads' :
+            self.__log_thread_stacks()
+        elif cmd=='files' :
+            self.__log_file_progress()
+
+    def _get_state_sizes(self) :
+        """
+        Return a dictionary of descriptions of the state kept for files in progress and their current sizes
+        (logged by the "mem" command). Not implemented in the base class.
+        """
+        return {}
+
+    def _get_file_progress(self) :
+        """
+        Return a list of (filepath, fraction done) for every file in flight (logged by the "files" command), 
+        or None if the process doesn't work with files. Not implemented in the base class.
+        """
+        return None
+
+    def __log_stats(self) :
+        """
+        Log the value of every counter that's been incremented (and how quickly it's increased since the last 
+        "stats" command or since the process started), and the current value of every gauge
+        """
+        now = time.time()
+        last_time, last_values = self.__last_stats
+        values = {}
+        msg = f'Stats over the last {now-last_time:.1f} seconds:'
+        for metric in METRICS.get_all() :
+            if isinstance(metric,Counter) :
+                values[metric.name] = metric.value
+                if values[metric.name]==0 :
+                    continue
+                rate = (values[metric.name]-last_values.get(metric.name,0))/max(now-last_time,1e-6)
+                msg+=f'\n\t{metric.name} = {values[metric.name]} ({rate:.4g}/s)'
+            elif isinstance(metric,Gauge) :
+                msg+=f'\n\t{metric.name} = {metric.value}'
+        self.__last_stats = (now,values)
+        self.logger.info(msg)
+
+    def __log_memory(self) :
+        """
+        Log the sizes of the state kept for files in progress and the lines of code that allocated the most memory
+        (memory allocations are only traced from the first time this is called, unless they already were)
+        """
+        msg = 'Memory use:'
+        for name,size in self._get_state_sizes().items() :
+            msg+=f'\n\t{name}: {size}'
+        if not tracemalloc.is_tracing() :
+            tracemalloc.start()
+            self.__tracing_memory = True
+            msg+='\n\t(memory allocations are being traced from now on; give the "mem" command again to see them)'
+        else :
+            current, peak = tracemalloc.get_traced_memory()
+            msg+=f'\n\ttraced memory: {current/1e6:.1f} MB now, {peak/1e6:.1f} MB peak; largest allocations:'
+            snapshot = tracemalloc.take_snapshot()
+            snapshot = snapshot.filter_traces((tracemalloc.Filter(False,tracemalloc.__file__),))
+            for stat in snapshot.statistics('lineno')[:UTIL_CONST.N_TRACEMALLOC_LINES_TO_LOG] :
+                msg+=f'\n\t\t{stat}'
+        self.logger.info(msg)
+
+    def __log_thread_stacks(self) :
+        """
+        Log the current stack of every running thread
+        """
+        frames = sys._current_frames()
+        threads = enumerate_threads()
+        msg = f'{len(threads)} threads running:'
+        for thread in threads :
+            msg+=f'\n{thread.name}{" (daemon)" if thread.daemon else ""}:\n'
+            frame = frames.get(thread.ident)
+            if frame is None :
+                msg+='\t(no stack available)\n'
+            else :
+                msg+=''.join(traceback.format_stack(frame))
+        self.logger.info(msg)
+
+    def __log_file_progress(self) :
+        """
+        Log how far along every file in flight is
+        """
+        file_progress = self._get_file_progress()
+        if file_progress is None :
+            self.logger.warning(f'WARNING: {self.__class__.__name__} does not keep track of files in flight')
+            return
+        if len(file_progress)==0 :
+            self.logger.info('No files in flight')
+            return
+        msg = f'{len(file_progress)} file{"s" if len(file_progress)!=1 else ""} in flight:'
+        for filepath,fraction in file_progress :
+            msg+=f'\n\t{filepath}: {100.*fraction:.1f}%'
+        self.logger.info(msg)
+
+    def __on_signal(self,signum,frame) :
+        #only remember the signal here: the process is shut down from the thread that's running it
+        self.__signal_received = signum
+
+    def __install_signal_handlers(self) :
+        """
+        Handle SIGTERM and SIGINT by shutting down cleanly (signal handlers can only be set in the main thread)
+        """
+        if (not self.__handle_signals) or current_thread() is not main_thread() :
+            return
+        for signum in (signal.SIGTERM,signal.SIGINT) :
+            self.__previous_signal_handlers[signum] = signal.signal(signum,self.__on_signal)
+
+    def __restore_signal_handlers(self) :
+        if current_thread() is not main_thread() :
+            return
+        for signum,handler in self.__previous_signal_handlers.items() :
+            signal.signal(signum,handler)
+        self.__previous_signal_handlers = {}
 
     #################### ABSTRACT METHODS ####################
 
@@ -76,6 +306,15 @@ class ControlledProcess(LogOwner,ABC) :
         """
         self.__alive = True
         self.__last_update = time.time()
+        self.__last_stats = (time.time(),{})
+        self.__install_signal_handlers()
+        if self.__control_socket_path is not None :
+            self.__control_socket = ControlSocket(self.__control_socket_path,self.__control_command_queue,
+                                                  self.logger)
+        if self.__metrics_port is not None :
+            self.__metrics_server = MetricsServer(self.__metrics_port,self.logger)
+        if self.__profiler is not None :
+            self.__profiler.start()
 
     @abstractmethod
     def _on_check(self) :
@@ -101,12 +340,14 @@ class ControlledProcessSingleThread(ControlledProcess,ABC) :
     def run(self) :
         """
         Start the process and call run_iteration until the process is shut down
+        If an iteration returns False (there was nothing to do), wait for a control command for a short time 
+        before running the next one instead of running them back-to-back
         """
         super().run()
         while self.alive :
-            self._run_iteration()
+            did_work = self._run_iteration()
             self._print_still_alive()
-            self._check_control_command_queue()
+            self._check_control_command_queue(self._get_control_wait_time() if did_work is False else None)
 
     @abstractmethod
     def _run_iteration(self) :
@@ -114,14 +355,20 @@ class ControlledProcessSingleThread(ControlledProcess,ABC) :
         The function that is run in an infinite loop while the process is alive
         Not implemented in the base class, except to print the "still alive" character 
         and check the control command queue
+        Can return False to indicate that there was nothing to do in the iteration
         """
         pass
 
 class ControlledProcessMultiThreaded(ControlledProcess,ABC) :
     """
     A class for running a group of processes in multiple threads until they're explicitly shut down
+    The number of threads can be changed while running with the "scale N" command: every worker thread is stopped 
+    cleanly (alive reads False to them while they drain), then the new set of threads is started
     """
 
+    @property
+    def alive(self) :
+        return super().alive and not self.__draining #False to worker threads while they're being rescaled
     @property
     def n_threads(self):
         return self.__n_threads
@@ -131,6 +378,8 @@ class ControlledProcessMultiThreaded(ControlledProcess,ABC) :
         n_threads = number of threads to use
         """
         self.__n_threads = n_threads
+        self.__draining = False
+        self.__threads = []
         super().__init__(*args,**kwargs)
 
     def run(self,args_per_thread) :
@@ -148,15 +397,14 @@ class ControlledProcessMultiThreaded(ControlledProcess,ABC) :
                 self.logger.error(errmsg,ValueError)
             else :
                 args_per_thread = self.__n_threads*args_per_thread
+        self.__args_per_thread = args_per_thread
+        METRICS.gauge('openmsi_worker_threads','Worker threads running',function=lambda : self.__n_threads)
         #create and start the independent threads
-        self.__threads = []
-        for i in range(self.__n_threads) :
-            self.__threads.append(Thread(target=self._run_worker,args=args_per_thread[i]))
-            self.__threads[-1].start()
-        #loop while the process is alive, checking the control command queue and printing the "still alive" character
+        self.__start_threads(args_per_thread)
+        #loop while the process is alive, waiting on the control command queue and printing the "still alive" character
         while self.alive :
             self._print_still_alive()
-            self._check_control_command_queue()
+            self._check_control_command_queue(self._get_control_wait_time())
 
     def _on_shutdown(self) :
         """
@@ -165,6 +413,42 @@ class ControlledProcessMultiThreaded(ControlledProcess,ABC) :
         for t in self.__threads :
             t.join()
 
+    def _on_scale(self,n_threads) :
+        """
+        Stop every worker thread cleanly (waiting for them to finish) and start n_threads new ones, 
+        with the arguments returned by _get_args_per_thread_after_scaling
+        Can override this method further in subclasses to check whether the number of threads can be changed first
+        """
+        if n_threads==self.__n_threads :
+            self.logger.info(f'Already running with {n_threads} threads')
+            return
+        self.logger.info(f'Stopping {self.__n_threads} threads to restart with {n_threads}')
+        self.__draining = True
+        for t in self.__threads :
+            t.join()
+        self.__draining = False
+        if not super().alive :
+            return
+        args_per_thread = self._get_args_per_thread_after_scaling(n_threads)
+        self.__n_threads = n_threads
+        self.__start_threads(args_per_thread)
+        self.logger.info(f'Running with {n_threads} threads')
+
+    def _get_args_per_thread_after_scaling(self,n_threads) :
+        """
+        Return the list of arguments to give to each of n_threads new worker threads after a "scale N" command
+        Called while no worker threads are running; the default reuses the arguments the process was started with
+        Can override this method in subclasses whose threads each own something that needs to be rebuilt
+        """
+        return [self.__args_per_thread[i%len(self.__args_per_thread)] for i in range(n_threads)]
+
+    def __start_threads(self,args_per_thread) :
+        self.__threads = []
+        for i in range(self.__n_threads) :
+            target = self._run_worker if self.profiler is None else self.profiler.wrap(self._run_worker)
+            self.__threads.append(Thread(target=target,args=args_per_thread[i]))
+            self.__threads[-1].start()
+
     @abstractmethod
     def _run_worker(self,*args) :
         """
@@ -1,5 +1,10 @@
 #imports
-import logging
+import atexit, logging, time
+from queue import Queue
+from threading import Lock, Timer
+from logging.handlers import QueueHandler, QueueListener
+from .config import UTIL_CONST
+from .metrics import METRICS
 
 class MyFormatter(logging.Formatter) :
     """
@@ -20,9 +25,124 @@ class MyFormatter(logging.Formatter) :
         formatted+=super().format(record)
         return formatted
 
+class LogQueueHandler(QueueHandler) :
+    """
+    The only handler added to each named logging.Logger: puts its records on the AsyncLogWriter's queue, along with 
+    the handlers that should write them out (chosen when they're logged, so that changing a handler's level 
+    afterward doesn't affect records that are already queued)
+    """
+
+    def __init__(self,writer) :
+        super().__init__(writer.queue)
+        self.writer = writer
+
+    def emit(self,record) :
+        target_handlers = [h for h in self.writer.get_handlers(record.name) if record.levelno>=h.level]
+        if len(target_handlers)==0 :
+            return
+        try :
+            record = self.prepare(record)
+            record.target_handlers = target_handlers
+            self.enqueue(record)
+        except Exception :
+            self.handleError(record)
+
+class AsyncLogWriter :
+    """
+    Writes the records from every Logger in the process out to their streams and files from a single background
+    thread, so that logging from hot worker threads only ever puts records on a queue and never blocks on I/O
+    Handlers are registered once per logger name (and stream or file), so creating several Loggers with the same 
+    name shares the same handlers instead of writing every line several times and opening files again
+    """
+
+    @property
+    def queue(self) :
+        return self.__queue
+
+    def __init__(self) :
+        self.__queue = Queue()
+        self.__handlers_by_logger_name = {}
+        self.__lock = Lock()
+        self.__listener = None
+        self.__flush_callbacks = []
+
+    def add_flush_callback(self,callback) :
+        """
+        Add a function (with no arguments) to call whenever the log is flushed and before the writer is stopped, 
+        to log anything that's being held back
+        """
+        with self.__lock :
+            self.__flush_callbacks.append(callback)
+
+    def add_queue_handler(self,logger_obj) :
+        """
+        Make the given logging.Logger put its records on the queue (if it doesn't already), 
+        starting the thread that writes them out if it isn't running yet
+        """
+        with self.__lock :
+            if not any([isinstance(h,LogQueueHandler) for h in logger_obj.handlers]) :
+                logger_obj.addHandler(LogQueueHandler(self))
+            if self.__listener is None :
+                self.__listener = QueueListener(self.__queue,self)
+                self.__listener.start()
+
+    def get_or_add_handler(self,logger_name,key,create_handler,level) :
+        """
+        Return the handler registered with the given key for the logger with the given name, 
+        creating it with the given function if there isn't one yet
+        If the handler already exists its level is lowered to the given level if necessary, 
+        so that no Logger sharing it stops seeing messages it asked for
+        """
+        with self.__lock :
+            handlers = self.__handlers_by_logger_name.setdefault(logger_name,{})
+            if key not in handlers.keys() :
+                handlers[key] = create_handler()
+                handlers[key].setLevel(level)
+            elif level<handlers[key].level :
+                handlers[key].setLevel(level)
+            return handlers[key]
+
+    def get_handlers(self,logger_name) :
+        return list(self.__handlers_by_logger_name.get(logger_name,{}).values())
+
+    def handle(self,record) :
+        """
+        Write out a record taken off the queue (called from the QueueListener's thread)
+        """
+        for handler in record.target_handlers :
+            handler.handle(record)
+
+    def flush(self) :
+        """
+        Wait until every record that's been logged so far has been written out
+        """
+        self.__run_flush_callbacks()
+        if self.__listener is not None :
+            self.__queue.join()
+
+    def stop(self) :
+        """
+        Write out everything still in the queue and stop the writing thread
+        """
+        self.__run_flush_callbacks()
+        with self.__lock :
+            if self.__listener is not None :
+                self.__listener.stop()
+                self.__listener = None
+
+    def __run_flush_callbacks(self) :
+        with self.__lock :
+            callbacks = list(self.__flush_callbacks)
+        for callback in callbacks :
+            callback()
+
+#the writer used by every Logger in this process (which writes out anything still queued when the program exits)
+LOG_WRITER = AsyncLogWriter()
+atexit.register(LOG_WRITER.stop)
+
 class Logger :
     """
-    Class for a general logger. Logs messages and raises exceptions
+    Class for a general logger. Logs messages (written out in the background by LOG_WRITER) and raises exceptions
     """
 
     @property
@@ -38,10 +158,9 @@ class Logger :
             self._name = self.__name__
         self._logger_obj = logging.getLogger(self._name)
         self._logger_obj.setLevel(logging.DEBUG)
-        self._streamhandler = logging.StreamHandler()
-        self._streamhandler.setLevel(streamlevel)
-        self._streamhandler.setFormatter(self.formatter)
-        self._logger_obj.addHandler(self._streamhandler)
+        LOG_WRITER.add_queue_handler(self._logger_obj)
+        self._streamhandler = LOG_WRITER.get_or_add_handler(self._name,'stream',self.__make_stream_handler,
+                                                            streamlevel)
         self._filehandler = None
         if logger_filepath is not None :
             self.add_file_handler(logger_filepath)
@@ -65,10 +184,16 @@ class Logger :
             if not filepath.parent.is_dir() :
                 filepath.parent.mkdir(parents=True)
             filepath.touch()
-        self._filehandler = logging.FileHandler(filepath)
-        self._filehandler.setLevel(level)
-        self._filehandler.setFormatter(self.formatter)
-        self._logger_obj.addHandler(self._filehandler)
+        def make_file_handler() :
+            filehandler = logging.FileHandler(filepath)
+            filehandler.setFormatter(self.formatter)
+            return filehandler
+        self._filehandler = LOG_WRITER.get_or_add_handler(self._name,('file',str(filepath.resolve())),
+                                                          make_file_handler,level)
+
+    #wait until everything logged so far (by any Logger) has been written out
+    def flush(self) :
+        LOG_WRITER.flush()
 
     #methods for logging different levels of messages
 
@@ -91,6 +216,128 @@ class Logger :
         if exception_type is not None :
             raise exception_type(msg)
 
+    def __make_stream_handler(self) :
+        streamhandler = logging.StreamHandler()
+        streamhandler.setFormatter(self.formatter)
+        return streamhandler
+
+class RateLimitedWarnings :
+    """
+    Limits how many warnings are logged from a single call site on a hot path (like skipping bad messages 
+    or dropping file chunks), which can otherwise happen thousands of times per second while a broker has trouble
+    In each period, the first few warnings are logged and the rest are suppressed, then a single message summarizing 
+    how many were suppressed is logged when the period ends (or sooner, if the log is flushed or the program exits)
+    Every warning (logged or not) is counted in a metric, as is every suppressed warning
+    """
+
+    def __init__(self,name,description,n_per_period=UTIL_CONST.N_WARNINGS_BEFORE_SUPPRESSING,
+                 period_secs=UTIL_CONST.WARNING_SUMMARY_SECONDS) :
+        """
+        name         = the name of the call site (used to name its metrics)
+        description  = a description of what the warnings are about (used to describe its metrics)
+        n_per_period = the number of warnings to log in each period before suppressing them
+        period_secs  = the length of each period in seconds
+        """
+        self.__n_per_period = n_per_period
+        self.__period_secs = period_secs
+        self.__n_warnings = METRICS.counter(f'openmsi_{name}_warnings_total',f'Warnings about {description}')
+        self.__n_suppressed = METRICS.counter(f'openmsi_{name}_warnings_suppressed_total',
+                                              f'Warnings about {description} that were not logged')
+        self.__lock = Lock()
+        self.__period_start = time.monotonic()
+        self.__summary_start = self.__period_start
+        self.__n_logged_in_period = 0
+        self.__n_suppressed_in_period = 0
+        self.__summary_logger = None
+        self.__timer = None
+        LOG_WRITER.add_flush_callback(self.log_summary)
+
+    def warning(self,logger,msg) :
+        """
+        Log a warning with the given logger unless too many have been logged already in the current period
+        msg can also be a function (with no arguments) returning the message, so that messages that are 
+        suppressed never need to be formatted
+        """
+        self.__n_warnings.inc()
+        summary = None
+        with self.__lock :
+            now = time.monotonic()
+            if now-self.__period_start>=self.__period_secs :
+                summary = self.__pop_summary(now)
+                self.__start_period(now)
+            if self.__n_logged_in_period<self.__n_per_period :
+                self.__n_logged_in_period+=1
+                last_before_suppressing = self.__n_logged_in_period==self.__n_per_period
+            else :
+                self.__n_suppressed_in_period+=1
+                self.__n_suppressed.inc()
+                self.__summary_logger = logger
+                #log the summary when the period ends even if no more warnings come in
+                if self.__timer is None :
+                    self.__timer = Timer(self.__period_start+self.__period_secs-now,self.__on_period_end,
+                                         args=(self.__period_start,))
+                    self.__timer.daemon = True
+                    self.__timer.start()
+                return
+        if summary is not None :
+            summary[0].warning(summary[1])
+        msg = msg() if callable(msg) else msg
+        if last_before_suppressing :
+            msg+=' (further similar warnings will be summarized periodically)'
+        logger.warning(msg)
+
+    def log_summary(self) :
+        """
+        Log a summary of the warnings suppressed since the last summary right away (if there were any) without
+        starting a new period (called whenever the log is flushed and before the program exits)
+        """
+        with self.__lock :
+            summary = self.__pop_summary(time.monotonic())
+        if summary is not None :
+            summary[0].warning(summary[1])
+
+    def __on_period_end(self,period_start) :
+        """
+        Log the summary of the period that started at the given time and start a new one (called by the timer 
+        started when the first warning in the period was suppressed, unless a new warning started a new period first)
+        """
+        with self.__lock :
+            if self.__period_start!=period_start :
+                return
+            now = time.monotonic()
+            summary = self.__pop_summary(now)
+            self.__start_period(now)
+        if summary is not None :
+            summary[0].warning(summary[1])
+
+    def __pop_summary(self,now) :
+        """
+        Return the logger to use and the message summarizing the warnings suppressed since the last summary 
+        (or None if none were), and reset the count of suppressed warnings
+        Must be called holding the lock
+        """
+        if self.__n_suppressed_in_period==0 :
+            return None
+        summary = f'WARNING: suppressed {self.__n_suppressed_in_period} similar warning'
+        summary+= f'{"s" if self.__n_suppressed_in_period!=1 else ""} in the last '
+        summary+= f'{now-self.__summary_start:.0f} seconds'
+        self.__summary_start = now
+        self.__n_suppressed_in_period = 0
+        return self.__summary_logger, summary
+
+    def __start_period(self,now) :
+        """
+        Start a new period at the given time, cancelling the timer for the last one
+        Must be called holding the lock
+        """
+        if self.__timer is not None :
+            self.__timer.cancel()
+            self.__timer = None
+        self.__period_start = now
+        self.__summary_start = now
+        self.__n_logged_in_period = 0
+        self.__n_suppressed_in_period = 0
+
 class LogOwner :
     """
     Any subclasses extending this one will have access to a Logger defined by the first class in the MRO to extend it
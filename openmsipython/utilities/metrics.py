@@ -0,0 +1,300 @@
+#imports
+import bisect
+from threading import Thread, Lock, get_ident
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import UTIL_CONST
+
+#################### METRIC TYPES ####################
+
+class Metric :
+    """
+    Base class for the metrics in a MetricsRegistry
+    Values are recorded in a separate cell for each thread, so recording a value never waits on a lock
+    (each cell is only ever modified by the thread it belongs to). Cells are combined when the metric is read.
+    """
+
+    TYPE = None #the Prometheus type of the metric
+
+    @property
+    def name(self) :
+        return self.__name
+    @property
+    def description(self) :
+        return self.__description
+
+    def __init__(self,name,description) :
+        self.__name = name
+        self.__description = description
+        self.__cells = {}
+        self.__lock = Lock()
+
+    def _get_cell(self) :
+        """
+        Return the cell for the current thread, creating it if necessary
+        (the lock is only needed the first time each thread records a value)
+        """
+        cell = self.__cells.get(get_ident())
+        if cell is None :
+            with self.__lock :
+                cell = self.__cells.setdefault(get_ident(),self._new_cell())
+        return cell
+
+    def _get_cells(self) :
+        with self.__lock :
+            return list(self.__cells.values())
+
+    def _new_cell(self) :
+        return [0]
+
+class Counter(Metric) :
+    """
+    A count of something that only ever goes up (messages produced, bytes hashed, etc.)
+    """
+
+    TYPE = 'counter'
+
+    @property
+    def value(self) :
+        return sum([cell[0] for cell in self._get_cells()])
+
+    def inc(self,amount=1) :
+        self._get_cell()[0]+=amount
+
+    def get_prometheus_lines(self) :
+        return [f'{self.name} {self.value}']
+
+    def get_summary(self) :
+        value = self.value
+        return None if value==0 else f'{self.name} = {value}'
+
+class Gauge(Metric) :
+    """
+    A value that can go up and down (like the number of items in a queue), either set directly
+    or read from a function whenever the metric is read
+    """
+
+    TYPE = 'gauge'
+
+    @property
+    def value(self) :
+        if self.__function is not None :
+            try :
+                return self.__function()
+            except Exception :
+                return float('nan')
+        return self.__value
+
+    def __init__(self,*args,function=None,**kwargs) :
+        super().__init__(*args,**kwargs)
+        self.__value = 0
+        self.__function = function
+
+    def set(self,value) :
+        self.__value = value
+
+    def set_function(self,function) :
+        """
+        Read the value of the gauge by calling the given function (with no arguments) from now on
+        """
+        self.__function = function
+
+    def get_prometheus_lines(self) :
+        return [f'{self.name} {self.value}']
+
+    def get_summary(self) :
+        value = self.value
+        return None if value==0 else f'{self.name} = {value}'
+
+class Histogram(Metric) :
+    """
+    A distribution of observed values (like how long each chunk took to write),
+    counted in buckets with fixed upper bounds
+    """
+
+    TYPE = 'histogram'
+
+    @property
+    def buckets(self) :
+        return self.__buckets #the upper bounds of the buckets (not including +Inf)
+    @property
+    def count(self) :
+        return sum([cell[-1] for cell in self._get_cells()])
+    @property
+    def sum(self) :
+        return sum([cell[-2] for cell in self._get_cells()])
+
+    def __init__(self,*args,buckets=UTIL_CONST.DEFAULT_LATENCY_BUCKETS,**kwargs) :
+        self.__buckets = tuple(sorted(buckets))
+        super().__init__(*args,**kwargs)
+
+    def observe(self,value) :
+        cell = self._get_cell()
+        cell[bisect.bisect_left(self.__buckets,value)]+=1
+        cell[-2]+=value
+        cell[-1]+=1
+
+    def get_bucket_counts(self) :
+        """
+        Return the number of observations in each bucket (the last one being +Inf), not cumulative
+        """
+        counts = [0]*(len(self.__buckets)+1)
+        for cell in self._get_cells() :
+            for i in range(len(counts)) :
+                counts[i]+=cell[i]
+        return counts
+
+    def get_prometheus_lines(self) :
+        lines = []
+        cumulative_count = 0
+        for bound,count in zip(list(self.__buckets)+['+Inf'],self.get_bucket_counts()) :
+            cumulative_count+=count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative_count}')
+        lines.append(f'{self.name}_sum {self.sum}')
+        lines.append(f'{self.name}_count {cumulative_count}')
+        return lines
+
+    def get_summary(self) :
+        counts = self.get_bucket_counts()
+        n = sum(counts)
+        if n==0 :
+            return None
+        #the upper bound of the bucket holding the 95th percentile
+        cumulative_count = 0
+        for bound,count in zip(list(self.__buckets)+['+Inf'],counts) :
+            cumulative_count+=count
+            if cumulative_count>=0.95*n :
+                break
+        return f'{self.name}: n = {n}, mean = {self.sum/n:.4g}, 95% <= {bound}'
+
+    def _new_cell(self) :
+        #a count for each bucket, then the sum and count of the observations
+        return [0]*(len(self.__buckets)+1)+[0.,0]
+
+#################### REGISTRY ####################
+
+class MetricsRegistry :
+    """
+    A collection of named metrics that can be exported in the Prometheus text format or summarized in a log message
+    Getting a metric that already exists returns the existing one, so modules can each define the metrics they use
+    """
+
+    def __init__(self) :
+        self.__metrics = {}
+        self.__lock = Lock()
+
+    def counter(self,name,description) :
+        return self.__get_metric(Counter,name,description)
+
+    def gauge(self,name,description,function=None) :
+        gauge = self.__get_metric(Gauge,name,description)
+        if function is not None :
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self,name,description,buckets=UTIL_CONST.DEFAULT_LATENCY_BUCKETS) :
+        return self.__get_metric(Histogram,name,description,buckets=buckets)
+
+    def get(self,name) :
+        """
+        Return the metric with the given name (None if there isn't one)
+        """
+        return self.__metrics.get(name)
+
+    def get_all(self) :
+        """
+        Return a list of every metric in the registry
+        """
+        with self.__lock :
+            return list(self.__metrics.values())
+
+    def get_prometheus_text(self) :
+        """
+        Return the current values of every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self.__lock :
+            metrics = list(self.__metrics.values())
+        for metric in metrics :
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            lines+=metric.get_prometheus_lines()
+        return '\n'.join(lines)+'\n'
+
+    def get_summary(self) :
+        """
+        Return a message summarizing every metric that's been recorded so far (None if nothing has been)
+        """
+        with self.__lock :
+            metrics = list(self.__metrics.values())
+        summaries = [metric.get_summary() for metric in metrics]
+        summaries = [s for s in summaries if s is not None]
+        if len(summaries)==0 :
+            return None
+        return 'Metrics:\n\t'+'\n\t'.join(summaries)
+
+    def __get_metric(self,metric_type,name,description,**kwargs) :
+        with self.__lock :
+            if name in self.__metrics.keys() :
+                if not isinstance(self.__metrics[name],metric_type) :
+                    errmsg = f'ERROR: a {self.__metrics[name].TYPE} named {name} is already registered!'
+                    raise ValueError(errmsg)
+                return self.__metrics[name]
+            metric = metric_type(name,description,**kwargs)
+            self.__metrics[name] = metric
+            return metric
+
+#the registry holding the metrics for everything running in this process
+METRICS = MetricsRegistry()
+
+#################### HTTP ENDPOINT ####################
+
+class MetricsRequestHandler(BaseHTTPRequestHandler) :
+    """
+    Responds to GET requests for "/metrics" (or "/") with the server's registry in the Prometheus text format
+    """
+
+    def do_GET(self) :
+        if self.path.split('?')[0] not in ('/metrics','/') :
+            self.send_error(404)
+            return
+        body = self.server.registry.get_prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type','text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,format,*args) :
+        pass #don't print a line for every scrape
+
+class MetricsServer :
+    """
+    A local HTTP endpoint serving the metrics in a registry for a Prometheus server (or curl) to scrape
+    """
+
+    @property
+    def port(self) :
+        return self.__server.server_address[1] #the port the server is listening on
+
+    def __init__(self,port,logger,registry=METRICS,host=UTIL_CONST.METRICS_HOST) :
+        """
+        port     = the port to listen on (0 to pick any free port)
+        logger   = the logger to use
+        registry = the MetricsRegistry to serve
+        host     = the address to listen on
+        """
+        self.__server = ThreadingHTTPServer((host,port),MetricsRequestHandler)
+        self.__server.daemon_threads = True
+        self.__server.registry = registry
+        self.__thread = Thread(target=self.__server.serve_forever,kwargs={'poll_interval':0.5})
+        self.__thread.daemon = True
+        self.__thread.start()
+        logger.info(f'Serving metrics at http://{host}:{self.port}/metrics')
+
+    def close(self) :
+        """
+        Stop serving metrics
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
@@ -1,12 +1,32 @@
 #imports
-import sys, inspect, time
+import sys, inspect
 
-#listen for and add user input to a queue
+#listen for and add user input to a queue, one line at a time
 def add_user_input(input_queue) :
-    #listen for user input at one second intervals
+    #block reading lines from stdin until it's closed (or if there isn't any, like when running as a service)
     while True :
-        time.sleep(1)
-        input_queue.put(sys.stdin.read(1))
+        try :
+            line = sys.stdin.readline() if sys.stdin is not None else ''
+        except (OSError,ValueError) :
+            return
+        if line=='' :
+            return
+        line = line.strip()
+        if line!='' :
+            input_queue.put(line)
+
+#return a message saying that the given files had something happen to them (like "skipped because ..."), 
+#followed by their paths; if n_files is given and more than the number of paths, only the most recent were kept
+def get_filepaths_message(filepaths,description,n_files=None) :
+    n_files = len(filepaths) if n_files is None else n_files
+    msg = f'The following {n_files} file'
+    msg+= ' was' if n_files==1 else 's were'
+    msg+= f' {description}'
+    if n_files>len(filepaths) :
+        msg+= f' (only the last {len(filepaths)} are listed)'
+    for fp in filepaths :
+        msg+=f'\n\t{fp}'
+    return msg
 
 #return a kwargs dictionary where every possible entry from the defaults has a valid value
 #can use this to make sure certain entries are present in kwargs
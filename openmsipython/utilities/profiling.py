@@ -0,0 +1,158 @@
+#imports
+import os, re, pathlib, marshal, cProfile, pstats, tracemalloc
+from threading import Thread, Event, Lock, current_thread
+from .config import UTIL_CONST
+
+class ThreadProfiler :
+    """
+    Collects cProfile statistics separately in every thread it's asked to profile (a cProfile.Profile only sees
+    the thread it was enabled in) and writes them out as a .prof file for each thread, plus one combining them all
+    Files are named with the process ID so that several worker processes can share an output directory
+    Can also take tracemalloc snapshots periodically, logging where memory has grown the most since the last one
+    """
+
+    #################### PROPERTIES ####################
+
+    @property
+    def output_dir(self) :
+        return self.__output_dir #the directory the statistics and snapshots are written to
+
+    #################### PUBLIC FUNCTIONS ####################
+
+    def __init__(self,output_dir,logger,tracemalloc_secs=None) :
+        """
+        output_dir       = the directory to write the statistics to (created if necessary;
+                           default is a new directory in the current working directory)
+        logger           = the logger to use
+        tracemalloc_secs = if given, trace memory allocations and take a snapshot every this many seconds
+        """
+        if output_dir is None :
+            output_dir = pathlib.Path.cwd()/UTIL_CONST.DEFAULT_PROFILE_DIR_NAME
+        self.__output_dir = pathlib.Path(output_dir)
+        self.__logger = logger
+        self.__tracemalloc_secs = tracemalloc_secs
+        #the profile for each thread that's been profiled, by the name its statistics are written under
+        self.__profiles = {}
+        self.__lock = Lock()
+        self.__main_profile = None
+        self.__tracemalloc_thread = None
+        self.__tracemalloc_stop = Event()
+        self.__previous_snapshot = None
+        self.__n_snapshots = 0
+
+    def start(self) :
+        """
+        Start profiling the calling thread (and taking tracemalloc snapshots, if they were requested)
+        """
+        self.__main_profile = self.__enable_for_current_thread()
+        if self.__tracemalloc_secs is not None and self.__tracemalloc_thread is None :
+            tracemalloc.start()
+            self.__tracemalloc_stop.clear()
+            self.__tracemalloc_thread = Thread(target=self.__take_snapshots_periodically)
+            self.__tracemalloc_thread.daemon = True
+            self.__tracemalloc_thread.start()
+        self.__logger.info(f'Profiling; statistics will be written to {self.__output_dir}')
+
+    def wrap(self,target) :
+        """
+        Return a function that runs the given target function with a profile enabled in the thread that calls it
+        (use it as the target of a new Thread)
+        """
+        def profiled_target(*args,**kwargs) :
+            profile = self.__enable_for_current_thread()
+            try :
+                return target(*args,**kwargs)
+            finally :
+                if profile is not None :
+                    profile.disable()
+        return profiled_target
+
+    def dump(self) :
+        """
+        Write out the statistics collected so far in every thread (including threads that are still running)
+        and take a tracemalloc snapshot if they're being taken
+        """
+        self.__output_dir.mkdir(parents=True,exist_ok=True)
+        with self.__lock :
+            profiles = dict(self.__profiles)
+        filepaths = []
+        for name,profile in profiles.items() :
+            #snapshot_stats reads the statistics without disabling the profile (unlike dump_stats)
+            profile.snapshot_stats()
+            if len(profile.stats)==0 :
+                continue
+            filepath = self.__output_dir/f'{name}.prof'
+            with open(filepath,'wb') as fp :
+                marshal.dump(profile.stats,fp)
+            filepaths.append(filepath)
+        if len(filepaths)>0 :
+            combined = pstats.Stats(*[str(fp) for fp in filepaths])
+            combined.dump_stats(self.__output_dir/f'{os.getpid()}_all_threads.prof')
+            msg = f'Wrote profiling statistics for {len(filepaths)} thread(s) to {self.__output_dir} '
+            msg+= f'(view them with "python -m pstats {self.__output_dir/f"{os.getpid()}_all_threads.prof"}")'
+            self.__logger.info(msg)
+        if self.__tracemalloc_thread is not None :
+            self.__take_snapshot()
+
+    def stop(self) :
+        """
+        Stop profiling the thread that called start and taking tracemalloc snapshots, then write everything out
+        """
+        if self.__main_profile is not None :
+            self.__main_profile.disable()
+        if self.__tracemalloc_thread is not None :
+            self.__tracemalloc_stop.set()
+            self.__tracemalloc_thread.join()
+        self.dump()
+        if self.__tracemalloc_thread is not None :
+            self.__tracemalloc_thread = None
+            tracemalloc.stop()
+
+    #################### PRIVATE HELPER FUNCTIONS ####################
+
+    def __enable_for_current_thread(self) :
+        """
+        Create, register, and enable a new profile in the calling thread, returning it (or None if it couldn't be)
+        """
+        thread_name = re.sub(r'[^A-Za-z0-9_.-]+','_',current_thread().name).strip('_')
+        profile = cProfile.Profile()
+        try :
+            profile.enable()
+        except ValueError as e :
+            #newer versions of Python only allow one profiler to be active at once
+            self.__logger.warning(f'WARNING: could not profile thread {current_thread().name}: {e}')
+            return None
+        with self.__lock :
+            self.__profiles[f'{os.getpid()}_{thread_name}'] = profile
+        return profile
+
+    def __take_snapshots_periodically(self) :
+        while not self.__tracemalloc_stop.wait(self.__tracemalloc_secs) :
+            self.__take_snapshot()
+
+    def __take_snapshot(self) :
+        """
+        Write out a tracemalloc snapshot and log the lines whose allocations have grown the most since the last one
+        """
+        if not tracemalloc.is_tracing() :
+            return
+        snapshot = tracemalloc.take_snapshot()
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False,tracemalloc.__file__),))
+        with self.__lock :
+            self.__n_snapshots+=1
+            filepath = self.__output_dir/f'{os.getpid()}_tracemalloc_{self.__n_snapshots}.snapshot'
+            previous_snapshot = self.__previous_snapshot
+            self.__previous_snapshot = snapshot
+        self.__output_dir.mkdir(parents=True,exist_ok=True)
+        snapshot.dump(str(filepath))
+        if previous_snapshot is None :
+            stats = snapshot.statistics('lineno')
+            msg = f'Memory snapshot written to {filepath}; largest allocations:'
+        else :
+            stats = snapshot.compare_to(previous_snapshot,'lineno')
+            msg = f'Memory snapshot written to {filepath}; largest changes since the last one:'
+        current, peak = tracemalloc.get_traced_memory()
+        msg+= f' (traced memory: {current/1e6:.1f} MB now, {peak/1e6:.1f} MB peak)'
+        for stat in stats[:UTIL_CONST.N_TRACEMALLOC_LINES_TO_LOG] :
+            msg+=f'\n\t{stat}'
+        self.__logger.info(msg)
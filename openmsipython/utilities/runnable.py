@@ -7,6 +7,9 @@ class Runnable(ABC) :
     Class for any child classes that can be run on their own from the command line
     """
 
+    #arguments added to the parser of every Runnable
+    COMMON_ARGUMENTS = ['profile','profile_output','tracemalloc_seconds']
+
     @classmethod
     @abstractmethod
     def get_command_line_arguments(cls) :
@@ -23,9 +26,18 @@ class Runnable(ABC) :
         """
         parser = MyArgumentParser(*args,**kwargs)
         cl_args, cl_kwargs = cls.get_command_line_arguments()
-        parser.add_arguments(*cl_args,**cl_kwargs)
+        parser.add_arguments(*cl_args,*cls.COMMON_ARGUMENTS,**cl_kwargs)
         return parser
 
+    @staticmethod
+    def get_profiling_kwargs(args) :
+        """
+        Return the keyword arguments for a ControlledProcess's constructor that set up profiling 
+        based on the common command line arguments parsed into args
+        """
+        return {'profile':args.profile,'profile_output':args.profile_output,
+                'tracemalloc_secs':args.tracemalloc_seconds}
+
     @classmethod
     @abstractmethod
     def run_from_command_line(cls,args=None) :
@@ -21,6 +21,9 @@ class TestRoutineConstants :
     def TEST_CONFIG_FILE_PATH_NO_SERIALIZATION(self) : # Same as above except it's the config file that doesn't have the serialization stuff in it
         return (UTIL_CONST.CONFIG_FILE_DIR / 'test_no_serialization.config').resolve()
     @property
+    def LOOPBACK_CONFIG_FILE_PATH(self) : # The path to the config file that uses the in-process loopback transport instead of a cluster
+        return (UTIL_CONST.CONFIG_FILE_DIR / f'loopback{UTIL_CONST.CONFIG_FILE_EXT}').resolve()
+    @property
     def TEST_DATA_DIR_PATH(self) : #path to the test data directory
         return pathlib.Path(__file__).parent.parent / 'data'
     @property
@@ -1,7 +1,8 @@
 #imports
 from openmsipython.utilities.config import UTIL_CONST
 from openmsipython.utilities.argument_parsing import MyArgumentParser, existing_file, existing_dir, create_dir
-from openmsipython.utilities.argument_parsing import config_path, int_power_of_two, positive_int
+from openmsipython.utilities.argument_parsing import config_path, int_power_of_two, positive_int, non_negative_int
+from openmsipython.utilities.argument_parsing import non_negative_float
 from openmsipython.data_file_io.config import RUN_OPT_CONST
 from config import TEST_CONST
 import unittest, pathlib, shutil, os
@@ -139,3 +140,25 @@ class TestArgumentParsing(unittest.TestCase) :
             _ = positive_int(-5)
         with self.assertRaises(ValueError) :
             _ = positive_int(None)
+
+    #test the non_negative_int argument parser callback
+    def test_non_negative_int(self) :
+        self.assertEqual(non_negative_int(0),0)
+        self.assertEqual(non_negative_int('4'),4)
+        with self.assertRaises(ValueError) :
+            _ = non_negative_int('hello : )')
+        with self.assertRaises(ValueError) :
+            _ = non_negative_int('-1')
+        with self.assertRaises(ValueError) :
+            _ = non_negative_int(None)
+
+    #test the non_negative_float argument parser callback
+    def test_non_negative_float(self) :
+        self.assertEqual(non_negative_float(0),0.)
+        self.assertEqual(non_negative_float('2.5'),2.5)
+        with self.assertRaises(ValueError) :
+            _ = non_negative_float('hello : )')
+        with self.assertRaises(ValueError) :
+            _ = non_negative_float('-0.5')
+        with self.assertRaises(ValueError) :
+            _ = non_negative_float(None)
@@ -0,0 +1,42 @@
+#imports
+import unittest
+from openmsipython.data_file_io.chunk_bitmap import ChunkBitmap
+
+class TestChunkBitmap(unittest.TestCase) :
+    """
+    Class for testing ChunkBitmap functions
+    """
+
+    def test_add_and_contains(self) :
+        n_total_chunks = 21
+        bitmap = ChunkBitmap(n_total_chunks)
+        self.assertEqual(bitmap.n_total_chunks,n_total_chunks)
+        self.assertEqual(bitmap.n_chunks_set,0)
+        self.assertFalse(bitmap.complete)
+        for chunk_i in range(n_total_chunks,0,-1) :
+            self.assertFalse(chunk_i in bitmap)
+            self.assertTrue(bitmap.add(chunk_i))
+            self.assertTrue(chunk_i in bitmap)
+            self.assertFalse(bitmap.add(chunk_i))
+            self.assertEqual(bitmap.n_chunks_set,n_total_chunks-chunk_i+1)
+        self.assertTrue(bitmap.complete)
+        with self.assertRaises(IndexError) :
+            _ = 0 in bitmap
+        with self.assertRaises(IndexError) :
+            bitmap.add(n_total_chunks+1)
+        with self.assertRaises(ValueError) :
+            _ = ChunkBitmap(0)
+
+    def test_serialization(self) :
+        bitmap = ChunkBitmap(1000)
+        for chunk_i in range(1,1001,7) :
+            bitmap.add(chunk_i)
+        bitmap_2 = ChunkBitmap.from_bytes(bitmap.to_bytes())
+        self.assertEqual(bitmap_2.n_total_chunks,bitmap.n_total_chunks)
+        self.assertEqual(bitmap_2.n_chunks_set,bitmap.n_chunks_set)
+        for chunk_i in range(1,1001) :
+            self.assertEqual(chunk_i in bitmap_2,chunk_i in bitmap)
+        with self.assertRaises(ValueError) :
+            _ = ChunkBitmap.from_bytes(b'\x00')
+        with self.assertRaises(ValueError) :
+            _ = ChunkBitmap.from_bytes(bitmap.to_bytes()[:-1])
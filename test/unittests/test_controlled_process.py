@@ -1,6 +1,6 @@
 #imports
-import unittest, time
-from threading import Lock
+import unittest, time, os, signal, socket, tempfile, pathlib, shutil, tracemalloc
+from threading import Lock, Timer
 from openmsipython.utilities.controlled_process import ControlledProcessSingleThread, ControlledProcessMultiThreaded
 from utilities import MyThread
 
@@ -53,6 +53,51 @@ class ControlledProcessMultiThreadedForTesting(ControlledProcessMultiThreaded) :
                 with thread_lock :
                     self.counter+=1
 
+class ControlledProcessMultiThreadedSleepingForTesting(ControlledProcessMultiThreaded) :
+    """
+    Class to use in testing that ControlledProcessMultiThreaded doesn't use the CPU while its threads are idle
+    """
+
+    def _on_check(self) :
+        pass
+
+    def _run_worker(self) :
+        while self.alive :
+            time.sleep(0.05)
+
+class ControlledProcessMultiThreadedFailingDiagnosticsForTesting(ControlledProcessMultiThreadedSleepingForTesting) :
+    """
+    Class to use in testing that an error in a diagnostic command doesn't take down the process
+    """
+
+    def _get_file_progress(self) :
+        raise RuntimeError('dictionary changed size during iteration')
+
+class ControlledProcessMultiThreadedCountingForTesting(ControlledProcessMultiThreaded) :
+    """
+    Class to use in testing changing the number of threads in a ControlledProcessMultiThreaded
+    """
+
+    def __init__(self,*args,**kwargs) :
+        super().__init__(*args,**kwargs)
+        self.n_running = 0
+        self.max_n_running = 0
+        self.n_finished = 0
+        self.lock = Lock()
+
+    def _on_check(self) :
+        pass
+
+    def _run_worker(self) :
+        with self.lock :
+            self.n_running+=1
+            self.max_n_running = max(self.n_running,self.max_n_running)
+        while self.alive :
+            time.sleep(0.01)
+        with self.lock :
+            self.n_running-=1
+            self.n_finished+=1
+
 class TestControlledProcess(unittest.TestCase) :
     """
     Class for testing ControlledProcess utility classes
@@ -131,3 +176,168 @@ class TestControlledProcess(unittest.TestCase) :
                 except Exception as e :
                     raise e
 
+    def test_multi_threaded_control_loop_does_not_spin(self) :
+        #the thread running the process should wait on the control command queue instead of polling it
+        cpmt = ControlledProcessMultiThreadedSleepingForTesting(n_threads=N_THREADS,update_secs=-1)
+        run_thread = MyThread(target=cpmt.run,args=((),))
+        run_thread.start()
+        try :
+            time.sleep(0.2)
+            cpu_start = time.process_time()
+            time.sleep(1.0)
+            self.assertLess(time.process_time()-cpu_start,0.5)
+            cpmt.control_command_queue.put('q')
+            run_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(run_thread.is_alive())
+        finally :
+            if run_thread.is_alive() :
+                cpmt.shutdown()
+                run_thread.join(timeout=5)
+
+    def test_control_socket(self) :
+        socket_dir = pathlib.Path(tempfile.mkdtemp())
+        socket_path = socket_dir/'control.sock'
+        cpmt = ControlledProcessMultiThreadedForTesting(n_threads=N_THREADS,update_secs=-1,control_socket=socket_path)
+        run_thread = MyThread(target=cpmt.run,args=((Lock(),),))
+        run_thread.start()
+        try :
+            time.sleep(0.2)
+            self.assertTrue(socket_path.is_socket())
+            with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock :
+                sock.connect(str(socket_path))
+                sock.sendall(b'check\n')
+                self.assertEqual(sock.makefile().readline().strip(),'received check')
+                time.sleep(0.2)
+                self.assertTrue(cpmt.checked)
+                sock.sendall(b'quit\n')
+            run_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(run_thread.is_alive())
+            self.assertTrue(cpmt.on_shutdown_called)
+            #the socket file should be removed when the process shuts down
+            self.assertFalse(socket_path.exists())
+        finally :
+            if run_thread.is_alive() :
+                cpmt.shutdown()
+                run_thread.join(timeout=5)
+            shutil.rmtree(socket_dir)
+
+    def test_shutdown_on_signal(self) :
+        #signal handlers are only set when the process runs in the main thread
+        cpmt = ControlledProcessMultiThreadedForTesting(n_threads=N_THREADS,update_secs=-1)
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        timer = Timer(0.5,os.kill,args=(os.getpid(),signal.SIGTERM))
+        timer.start()
+        try :
+            cpmt.run((Lock(),))
+        finally :
+            timer.cancel()
+        self.assertTrue(cpmt.on_shutdown_called)
+        self.assertEqual(cpmt.counter,5)
+        #the previous signal handler should have been restored
+        self.assertEqual(signal.getsignal(signal.SIGTERM),previous_handler)
+
+    def test_scale_threads(self) :
+        cpmt = ControlledProcessMultiThreadedCountingForTesting(n_threads=N_THREADS,update_secs=-1)
+        run_thread = MyThread(target=cpmt.run,args=((),))
+        run_thread.start()
+        try :
+            time.sleep(0.2)
+            self.assertEqual(cpmt.n_running,N_THREADS)
+            #scaling up should stop every thread before starting the new set
+            cpmt.control_command_queue.put(f'scale {N_THREADS+2}')
+            time.sleep(0.5)
+            self.assertEqual(cpmt.n_threads,N_THREADS+2)
+            self.assertEqual(cpmt.n_running,N_THREADS+2)
+            self.assertEqual(cpmt.n_finished,N_THREADS)
+            self.assertEqual(cpmt.max_n_running,N_THREADS+2)
+            cpmt.control_command_queue.put('scale 1')
+            time.sleep(0.5)
+            self.assertEqual(cpmt.n_threads,1)
+            self.assertEqual(cpmt.n_running,1)
+            #invalid commands should be ignored
+            cpmt.control_command_queue.put('scale 0')
+            cpmt.control_command_queue.put('scale many')
+            time.sleep(0.2)
+            self.assertEqual(cpmt.n_running,1)
+            cpmt.control_command_queue.put('q')
+            run_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(run_thread.is_alive())
+            self.assertEqual(cpmt.n_running,0)
+        finally :
+            if run_thread.is_alive() :
+                cpmt.shutdown()
+                run_thread.join(timeout=5)
+
+    def test_profile(self) :
+        profile_dir = pathlib.Path(tempfile.mkdtemp())
+        cpmt = ControlledProcessMultiThreadedCountingForTesting(n_threads=N_THREADS,update_secs=-1,profile=True,
+                                                               profile_output=profile_dir)
+        run_thread = MyThread(target=cpmt.run,args=((),))
+        run_thread.start()
+        try :
+            time.sleep(0.2)
+            #the "profile" command should write out the statistics while the threads are still running
+            cpmt.control_command_queue.put('profile')
+            time.sleep(0.5)
+            self.assertEqual(len(list(profile_dir.glob('*_all_threads.prof'))),1)
+            self.assertEqual(cpmt.n_running,N_THREADS)
+            cpmt.control_command_queue.put('q')
+            run_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(run_thread.is_alive())
+            #there should be statistics for every worker thread and the thread running the process
+            self.assertEqual(len(list(profile_dir.glob('*.prof'))),N_THREADS+2)
+        finally :
+            if run_thread.is_alive() :
+                cpmt.shutdown()
+                run_thread.join(timeout=5)
+            shutil.rmtree(profile_dir)
+
+    def test_diagnostic_commands(self) :
+        cpmt = ControlledProcessMultiThreadedSleepingForTesting(n_threads=N_THREADS,update_secs=-1,
+                                                                logger_name='test_diagnostic_commands')
+        run_thread = MyThread(target=cpmt.run,args=((),))
+        with self.assertLogs('test_diagnostic_commands',level='INFO') as logs :
+            run_thread.start()
+            try :
+                for cmd in ('stats','mem','mem','threads','files') :
+                    cpmt.control_command_queue.put(cmd)
+                time.sleep(0.5)
+                cpmt.control_command_queue.put('q')
+                run_thread.join(timeout=TIMEOUT_SECS)
+                self.assertFalse(run_thread.is_alive())
+            finally :
+                if run_thread.is_alive() :
+                    cpmt.shutdown()
+                    run_thread.join(timeout=5)
+        output = '\n'.join(logs.output)
+        self.assertIn('Stats over the last',output)
+        self.assertIn('largest allocations',output)
+        #the stack of every worker thread should be logged
+        self.assertEqual(output.count('in _run_worker'),N_THREADS)
+        self.assertIn('does not keep track of files in flight',output)
+        #memory allocations traced because of the "mem" command should stop being traced on shutdown
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_failing_diagnostic_command(self) :
+        cpmt = ControlledProcessMultiThreadedFailingDiagnosticsForTesting(n_threads=N_THREADS,update_secs=-1,
+                                                                         logger_name='test_failing_diagnostic_command')
+        run_thread = MyThread(target=cpmt.run,args=((),))
+        with self.assertLogs('test_failing_diagnostic_command',level='INFO') as logs :
+            run_thread.start()
+            try :
+                cpmt.control_command_queue.put('files')
+                cpmt.control_command_queue.put('stats')
+                time.sleep(0.5)
+                self.assertTrue(run_thread.is_alive())
+                cpmt.control_command_queue.put('q')
+                run_thread.join(timeout=TIMEOUT_SECS)
+                self.assertFalse(run_thread.is_alive())
+            finally :
+                if run_thread.is_alive() :
+                    cpmt.shutdown()
+                    run_thread.join(timeout=5)
+        output = '\n'.join(logs.output)
+        #the error should be logged and the commands after it should still run
+        self.assertIn('failed to run the "files" command',output)
+        self.assertIn('dictionary changed size during iteration',output)
+        self.assertIn('Stats over the last',output)
@@ -4,8 +4,10 @@ from openmsipython.data_file_io.upload_data_file import UploadDataFile
 from openmsipython.data_file_io.data_file_chunk import DataFileChunk
 from openmsipython.my_kafka.my_producers import MySerializingProducer
 from openmsipython.data_file_io.config import RUN_OPT_CONST
+from openmsipython.my_kafka.config import MSG_HEADER_CONST
+from openmsipython.my_kafka.utilities import get_message_headers
 from openmsipython.utilities.logging import Logger
-import unittest, pathlib, logging
+import unittest, pathlib, logging, time
 
 #constants
 LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
@@ -72,14 +74,14 @@ class TestDataFileChunk(unittest.TestCase) :
                                             self.test_chunk_1.chunk_size,self.test_chunk_1.chunk_i,
                                             self.test_chunk_1.n_total_chunks,rootdir=self.test_chunk_1.rootdir,
                                             filename_append=self.test_chunk_1.filename_append,
-                                            data=self.test_chunk_1.data)
+                                            data=self.test_chunk_1.data,file_size=self.test_chunk_1.file_size)
         test_chunk_2_copied = DataFileChunk(self.test_chunk_2.filepath,self.test_chunk_2.filename,
                                             self.test_chunk_2.file_hash,self.test_chunk_2.chunk_hash,
                                             self.test_chunk_2.chunk_offset_read,self.test_chunk_2.chunk_offset_write,
                                             self.test_chunk_2.chunk_size,self.test_chunk_2.chunk_i,
                                             self.test_chunk_2.n_total_chunks,rootdir=self.test_chunk_1.rootdir,
                                             filename_append=self.test_chunk_2.filename_append,
-                                            data=self.test_chunk_2.data)
+                                            data=self.test_chunk_2.data,file_size=self.test_chunk_2.file_size)
         self.assertEqual(self.test_chunk_1,test_chunk_1_copied)
         self.assertEqual(self.test_chunk_2,test_chunk_2_copied)
         self.assertFalse(self.test_chunk_1==2)
@@ -112,3 +114,25 @@ class TestDataFileChunk(unittest.TestCase) :
         copied_as_downloaded_2.rootdir = TEST_CONST.TEST_DATA_DIR_PATH/TEST_CONST.TEST_DATA_FILE_ROOT_DIR_NAME
         self.assertEqual(copied_as_downloaded_2.rootdir,self.test_chunk_2.rootdir)
         self.assertEqual(copied_as_downloaded_2.filepath,self.test_chunk_2.filepath)
+
+    def test_message_headers(self) :
+        class RawMessage :
+            def headers(_) :
+                return self.test_chunk_1.message_headers
+        before = time.time()
+        headers = get_message_headers(RawMessage())
+        after = time.time()
+        self.assertEqual(headers[MSG_HEADER_CONST.FILE_ID],self.test_chunk_1.file_hash[:16].hex())
+        self.assertEqual(int(headers[MSG_HEADER_CONST.CHUNK_I]),self.test_chunk_1.chunk_i)
+        self.assertEqual(int(headers[MSG_HEADER_CONST.N_TOTAL_CHUNKS]),self.test_chunk_1.n_total_chunks)
+        self.assertEqual(headers[MSG_HEADER_CONST.RELPATH],
+                         f'{TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME}/{TEST_CONST.TEST_DATA_FILE_NAME}')
+        self.assertEqual(int(headers[MSG_HEADER_CONST.FILE_SIZE]),self.test_chunk_1.file_size)
+        self.assertEqual(headers[MSG_HEADER_CONST.HASH_ALGORITHM],'sha512')
+        self.assertTrue(before<=float(headers[MSG_HEADER_CONST.PRODUCED_AT])<=after)
+        #the times the file was detected and chunked should be attached too
+        detected_at = float(headers[MSG_HEADER_CONST.DETECTED_AT])
+        self.assertAlmostEqual(detected_at,self.test_chunk_1.detected_at,places=5)
+        self.assertTrue(detected_at<=float(headers[MSG_HEADER_CONST.CHUNKED_AT])<=before)
+        #chunks that weren't consumed shouldn't have any headers
+        self.assertEqual(self.test_chunk_1.headers,{})
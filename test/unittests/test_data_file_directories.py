@@ -1,7 +1,9 @@
 #imports
-import unittest, pathlib, time, logging, shutil, filecmp
-from openmsipython.data_file_io.config import RUN_OPT_CONST
+import unittest, pathlib, time, logging, shutil, filecmp, tempfile, uuid
+from openmsipython.data_file_io.config import RUN_OPT_CONST, DATA_FILE_HANDLING_CONST
 from openmsipython.utilities.logging import Logger
+from openmsipython.my_kafka.my_producers import MySerializingProducer
+from openmsipython.data_file_io.upload_data_file import UploadDataFile
 from openmsipython.data_file_io.data_file_upload_directory import DataFileUploadDirectory
 from openmsipython.data_file_io.data_file_download_directory import DataFileDownloadDirectory
 from config import TEST_CONST
@@ -178,4 +180,102 @@ class TestDataFileDirectories(unittest.TestCase) :
         except Exception as e :
             raise e
         finally : 
-            shutil.rmtree(subdir_path)
\ No newline at end of file
+            shutil.rmtree(subdir_path)
+
+    #called by the offline test methods below
+    def get_chunks(self,dirpath,filename) :
+        """
+        Write a copy of the second test file to a directory and return the list of its DataFileChunks
+        """
+        filepath = dirpath/filename
+        filepath.write_bytes(TEST_CONST.TEST_DATA_FILE_2_PATH.read_bytes())
+        datafile = UploadDataFile(filepath,rootdir=dirpath,logger=LOGGER)
+        datafile._build_list_of_file_chunks(RUN_OPT_CONST.DEFAULT_CHUNK_SIZE)
+        return list(datafile.chunks_to_upload)
+
+    def produce_chunks(self,chunks,topic_name) :
+        """
+        Produce the given DataFileChunks to a topic in the loopback broker
+        """
+        producer = MySerializingProducer.from_file(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,logger=LOGGER)
+        for dfc in chunks :
+            dfc.produce_to_topic(producer,topic_name,LOGGER)
+        producer.flush()
+
+    def wait_for(self,condition) :
+        """
+        Wait until a given function returns True, raising an error if it takes too long
+        """
+        time_waited = 0
+        while not condition() :
+            if time_waited>=TIMEOUT_SECS :
+                raise TimeoutError(f'ERROR: condition not met after {TIMEOUT_SECS} seconds!')
+            time.sleep(0.1)
+            time_waited+=0.1
+
+    def test_quarantine_stale_files(self) :
+        tempdir = pathlib.Path(tempfile.mkdtemp())
+        try :
+            src_dir = tempdir/'src'
+            src_dir.mkdir()
+            stale_chunks = self.get_chunks(src_dir,'stale.dat')
+            fresh_chunks = self.get_chunks(src_dir,'fresh.dat')
+            topic_name = f'{TOPIC_NAME}_{uuid.uuid4().hex}'
+            reco_dir = tempdir/'reco'
+            reco_dir.mkdir()
+            dfdd = DataFileDownloadDirectory(reco_dir,TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,topic_name,
+                                             n_threads=1,stale_file_timeout=1.,
+                                             consumer_group_ID=f'{topic_name}_group',logger=LOGGER)
+            download_thread = MyThread(target=dfdd.reconstruct)
+            download_thread.start()
+            try :
+                #a file that only gets its first chunk should be quarantined once it's gone stale
+                self.produce_chunks(stale_chunks[:1],topic_name)
+                self.wait_for(lambda : 'stale.dat' in [fp.name for fp in dfdd.quarantined_filepaths])
+                #but a file that just got a chunk shouldn't be
+                self.produce_chunks(fresh_chunks[:1],topic_name)
+                self.wait_for(lambda : 'fresh.dat' in [fp.name for fp in dfdd.in_progress_filepaths])
+                self.assertEqual([fp.name for fp in dfdd.quarantined_filepaths],['stale.dat'])
+            finally :
+                dfdd.control_command_queue.put('q')
+                download_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(download_thread.is_alive())
+            #the stale file's partial data should have been moved to the quarantine directory
+            quarantine_dir = reco_dir/DATA_FILE_HANDLING_CONST.QUARANTINE_DIR_NAME
+            self.assertEqual([fp.name for fp in quarantine_dir.rglob('*') if fp.is_file()],
+                             [f'stale.dat{DATA_FILE_HANDLING_CONST.PARTIAL_FILE_EXT}'])
+        finally :
+            shutil.rmtree(tempdir)
+
+    def test_skip_existing_identical_file(self) :
+        tempdir = pathlib.Path(tempfile.mkdtemp())
+        try :
+            src_dir = tempdir/'src'
+            src_dir.mkdir()
+            chunks = self.get_chunks(src_dir,'identical.dat')+self.get_chunks(src_dir,'different.dat')
+            #put an identical copy of one file and a different version of the other in the output directory
+            reco_dir = tempdir/'reco'
+            reco_dir.mkdir()
+            shutil.copy(src_dir/'identical.dat',reco_dir/'identical.dat')
+            (reco_dir/'different.dat').write_bytes(b'not the same contents')
+            topic_name = f'{TOPIC_NAME}_{uuid.uuid4().hex}'
+            dfdd = DataFileDownloadDirectory(reco_dir,TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,topic_name,
+                                             n_threads=1,consumer_group_ID=f'{topic_name}_group',logger=LOGGER)
+            download_thread = MyThread(target=dfdd.reconstruct)
+            download_thread.start()
+            try :
+                self.produce_chunks(chunks,topic_name)
+                self.wait_for(lambda : 'different.dat' in [fp.name for fp in dfdd.completely_reconstructed_filepaths])
+                self.wait_for(lambda : dfdd.n_msgs_read==len(chunks))
+            finally :
+                dfdd.control_command_queue.put('q')
+                download_thread.join(timeout=TIMEOUT_SECS)
+            self.assertFalse(download_thread.is_alive())
+            #the identical file should have been skipped and the different one should have been overwritten
+            self.assertEqual([fp.name for fp in dfdd.skipped_filepaths],['identical.dat'])
+            self.assertEqual(dfdd.n_files_skipped,1)
+            self.assertEqual([fp.name for fp in dfdd.completely_reconstructed_filepaths],['different.dat'])
+            for filename in ('identical.dat','different.dat') :
+                self.assertTrue(filecmp.cmp(src_dir/filename,reco_dir/filename,shallow=False))
+        finally :
+            shutil.rmtree(tempdir)
@@ -1,6 +1,7 @@
 #imports
-import unittest, time, pathlib, logging
+import unittest, time, pathlib, logging, tempfile, shutil, uuid, random
 from openmsipython.utilities.logging import Logger
+from openmsipython.my_kafka.my_producers import MySerializingProducer
 from openmsipython.data_file_io.config import RUN_OPT_CONST
 from openmsipython.data_file_io.upload_data_file import UploadDataFile
 from openmsipython.data_file_io.data_file_stream_processor import DataFileStreamProcessor
@@ -21,20 +22,213 @@ class DataFileStreamProcessorForTesting(DataFileStreamProcessor) :
     def __init__(self,*args,**kwargs) :
         self.checked = False
         self.completed_bytestrings_by_filename = {}
+        self.spilled_when_processed_by_filename = {}
+        self.datafiles_by_filename = {}
         super().__init__(*args,**kwargs)
 
     def _process_downloaded_data_file(self,datafile) :
-        self.completed_bytestrings_by_filename[datafile.filename] = datafile.bytestring
+        #(copy the data, since a file spilled to disk is only memory-mapped until it's done being processed)
+        self.completed_bytestrings_by_filename[datafile.filename] = bytes(datafile.bytestring)
+        self.spilled_when_processed_by_filename[datafile.filename] = datafile.spilled
+        self.datafiles_by_filename[datafile.filename] = datafile
 
     def _on_check(self) :
         self.checked = True
         super()._on_check()
 
+class StreamingDataFileStreamProcessorForTesting(DataFileStreamProcessorForTesting) :
+    """
+    Class to use for testing that DataFileStreamProcessors pass files' data along in order as they arrive
+    """
+
+    @property
+    def streams_data_in_order(self) :
+        return True
+
+    def __init__(self,*args,**kwargs) :
+        self.streamed_data_by_filename = {}
+        self.streamed_while_spilled_filenames = set()
+        self.hashes_match_by_filename = {}
+        super().__init__(*args,**kwargs)
+
+    def _on_contiguous_data(self,datafile,offset,data) :
+        streamed_data = self.streamed_data_by_filename.setdefault(datafile.filename,bytearray())
+        if offset!=len(streamed_data) :
+            raise RuntimeError(f'ERROR: got data at offset {offset} after {len(streamed_data)} bytes were streamed!')
+        streamed_data.extend(data)
+        if datafile.spilled :
+            self.streamed_while_spilled_filenames.add(datafile.filename)
+
+    def _on_file_complete(self,datafile,hashes_match) :
+        self.hashes_match_by_filename[datafile.filename] = hashes_match
+
+def succeed(datafile) :
+    """
+    A processor for the tests below that always succeeds (module-level so that it can be pickled)
+    """
+    return None
+
 class TestDataFileStreamProcessor(unittest.TestCase) :
     """
     Class for testing behavior of a DataFileStreamProcessor
     """
 
+    def setUp(self) :
+        self.tempdir = pathlib.Path(tempfile.mkdtemp())
+        #a new topic in the in-process loopback broker for each test that doesn't need a cluster
+        self.topic_name = f'{TOPIC_NAME}_{uuid.uuid4().hex}'
+        self.stream_thread = None
+
+    def tearDown(self) :
+        if self.stream_thread is not None and self.stream_thread.is_alive() :
+            self.dfsp.control_command_queue.put('q')
+            self.stream_thread.join(timeout=TIMEOUT_SECS)
+        shutil.rmtree(self.tempdir)
+
+    def get_chunks(self,filename,data=None) :
+        """
+        Write a copy of the second test file (or the given data) to the temporary directory 
+        and return the list of its DataFileChunks
+        """
+        filepath = self.tempdir/filename
+        filepath.write_bytes(TEST_CONST.TEST_DATA_FILE_2_PATH.read_bytes() if data is None else data)
+        datafile = UploadDataFile(filepath,rootdir=self.tempdir,logger=LOGGER)
+        datafile._build_list_of_file_chunks(RUN_OPT_CONST.DEFAULT_CHUNK_SIZE)
+        return list(datafile.chunks_to_upload)
+
+    def produce_chunks(self,chunks) :
+        """
+        Produce the given DataFileChunks to the test's topic in the loopback broker, in the order given
+        """
+        producer = MySerializingProducer.from_file(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,logger=LOGGER)
+        for dfc in chunks :
+            dfc.produce_to_topic(producer,self.topic_name,LOGGER)
+        producer.flush()
+
+    def start_stream_processor(self,processor_type=DataFileStreamProcessorForTesting,processors=(),**kwargs) :
+        """
+        Create a stream processor reading from the test's topic in the loopback broker, register any given 
+        processor functions with it, and start it running in a separate thread
+        """
+        self.dfsp = processor_type(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,self.topic_name,
+                                   consumer_group_ID=f'{self.topic_name}_group',logger=LOGGER,**kwargs)
+        for processor in processors :
+            self.dfsp.add_processor(processor)
+        self.stream_thread = MyThread(target=self.dfsp.process_files_as_read)
+        self.stream_thread.start()
+
+    def wait_for(self,condition) :
+        """
+        Wait until a given function returns True, raising an error if it takes too long
+        """
+        time_waited = 0
+        while not condition() :
+            if time_waited>=TIMEOUT_SECS :
+                raise TimeoutError(f'ERROR: condition not met after {TIMEOUT_SECS} seconds!')
+            time.sleep(0.1)
+            time_waited+=0.1
+
+    def stop_stream_processor(self) :
+        self.dfsp.control_command_queue.put('q')
+        self.stream_thread.join(timeout=TIMEOUT_SECS)
+        self.assertFalse(self.stream_thread.is_alive())
+
+    def test_spill_to_disk_over_memory_budget(self) :
+        """
+        Once the files being read take up more memory than the budget allows, the least recently updated file 
+        should be spilled to disk, and still be reconstructed correctly
+        """
+        data = TEST_CONST.TEST_DATA_FILE_2_PATH.read_bytes()
+        chunks_a = self.get_chunks('a.dat')
+        chunks_b = self.get_chunks('b.dat',data[::-1])
+        #room for one file to be held in memory, but not two
+        self.start_stream_processor(n_threads=1,max_memory_bytes=int(1.5*len(data)),spill_dir=self.tempdir)
+        #(wait for the first file's chunk to be read so that it's the least recently updated one)
+        self.produce_chunks(chunks_a[:1])
+        self.wait_for(lambda : self.dfsp.n_bytes_in_memory==len(data))
+        self.produce_chunks(chunks_b[:1])
+        self.wait_for(lambda : self.dfsp.n_files_spilled==1)
+        self.assertEqual(self.dfsp.n_bytes_in_memory,len(data))
+        self.produce_chunks(chunks_a[1:]+chunks_b[1:])
+        self.wait_for(lambda : len(self.dfsp.processed_filepaths)==2)
+        self.stop_stream_processor()
+        #the oldest file should have been spilled and the other one kept in memory
+        self.assertEqual(self.dfsp.spilled_when_processed_by_filename,{'a.dat':True,'b.dat':False})
+        self.assertEqual(self.dfsp.completed_bytestrings_by_filename['a.dat'],data)
+        self.assertEqual(self.dfsp.completed_bytestrings_by_filename['b.dat'],data[::-1])
+        #and its temporary file should have been closed once it was done being processed
+        self.assertFalse(self.dfsp.datafiles_by_filename['a.dat'].spilled)
+
+    def test_stream_data_in_order(self) :
+        """
+        Data from chunks that arrive out of order should be passed to _on_contiguous_data in order 
+        (including after a file has been spilled to disk), and _on_file_complete should be called for each file
+        """
+        data = TEST_CONST.TEST_DATA_FILE_2_PATH.read_bytes()
+        chunks_a = self.get_chunks('a.dat')
+        chunks_b = self.get_chunks('b.dat',data[::-1])
+        for chunks in (chunks_a,chunks_b) :
+            random.Random(1234).shuffle(chunks)
+        self.start_stream_processor(StreamingDataFileStreamProcessorForTesting,n_threads=1,
+                                    max_memory_bytes=int(1.5*len(data)),spill_dir=self.tempdir)
+        half_a = len(chunks_a)//2; half_b = len(chunks_b)//2
+        #(wait for the first half of the first file to be read so that it's the file that gets spilled)
+        self.produce_chunks(chunks_a[:half_a])
+        self.wait_for(lambda : self.dfsp.n_msgs_read==half_a)
+        self.produce_chunks(chunks_b[:half_b])
+        self.wait_for(lambda : self.dfsp.n_files_spilled==1)
+        self.produce_chunks(chunks_a[half_a:]+chunks_b[half_b:])
+        self.wait_for(lambda : len(self.dfsp.processed_filepaths)==2)
+        self.stop_stream_processor()
+        self.assertEqual(self.dfsp.streamed_data_by_filename['a.dat'],data)
+        self.assertEqual(self.dfsp.streamed_data_by_filename['b.dat'],data[::-1])
+        self.assertEqual(self.dfsp.hashes_match_by_filename,{'a.dat':True,'b.dat':True})
+        self.assertIn('a.dat',self.dfsp.streamed_while_spilled_filenames)
+        self.assertEqual(self.dfsp.completed_bytestrings_by_filename['a.dat'],data)
+
+    def test_identical_files_in_flight(self) :
+        """
+        A file that finishes being read after another file with the same contents has been processed 
+        shouldn't be processed again, and shouldn't keep the stream processor from shutting down
+        """
+        chunks_a = self.get_chunks('a.dat')
+        chunks_b = self.get_chunks('b.dat')
+        self.start_stream_processor(n_threads=1,n_processing_workers=1,processors=(succeed,),
+                                    processed_file_index=self.tempdir/'processed_files.sqlite')
+        #start reading the second file, and then read and process all of the first one
+        self.produce_chunks(chunks_b[:1])
+        self.produce_chunks(chunks_a)
+        self.wait_for(lambda : 'a.dat' in [fp.name for fp in self.dfsp.processed_filepaths])
+        #then finish reading the second file, which should be skipped instead of processed
+        self.produce_chunks(chunks_b[1:])
+        self.wait_for(lambda : 'b.dat' in [fp.name for fp in self.dfsp.skipped_filepaths])
+        self.stop_stream_processor()
+        self.assertEqual([fp.name for fp in self.dfsp.processed_filepaths],['a.dat'])
+
+    def test_several_processors_without_pool(self) :
+        """
+        Every processor registered with add_processor should run once on each file that's fully read 
+        (instead of _process_downloaded_data_file) when files are processed in the consuming threads
+        """
+        data = TEST_CONST.TEST_DATA_FILE_2_PATH.read_bytes()
+        chunks = self.get_chunks('a.dat')+self.get_chunks('b.dat',data[::-1])
+        calls = []
+        def first_processor(datafile) :
+            calls.append(('first',datafile.filename,bytes(datafile.bytestring)))
+        def second_processor(datafile) :
+            calls.append(('second',datafile.filename,bytes(datafile.bytestring)))
+        self.start_stream_processor(n_threads=2,n_processing_workers=0,
+                                    processors=(first_processor,second_processor))
+        self.assertEqual(self.dfsp.processor_names,['first_processor','second_processor'])
+        self.produce_chunks(chunks)
+        self.wait_for(lambda : len(self.dfsp.processed_filepaths)==2)
+        self.stop_stream_processor()
+        self.assertEqual(sorted(calls),[('first','a.dat',data),('first','b.dat',data[::-1]),
+                                        ('second','a.dat',data),('second','b.dat',data[::-1])])
+        #the processors should have run in the order they were registered
+        self.assertEqual([name for name,filename,_ in calls if filename=='a.dat'],['first','second'])
+        self.assertEqual(self.dfsp.completed_bytestrings_by_filename,{})
+
     def test_data_file_stream_processor_kafka(self) :
         """
         Upload a data file and then use a DataFileStreamProcessor to read its data back
@@ -1,5 +1,5 @@
 #imports
-import unittest, pathlib, logging, filecmp, shutil
+import unittest, pathlib, logging, filecmp, shutil, os
 from hashlib import sha512
 from openmsipython.data_file_io.config import RUN_OPT_CONST, DATA_FILE_HANDLING_CONST
 from openmsipython.utilities.logging import Logger
@@ -67,7 +67,7 @@ class TestDownloadDataFile(unittest.TestCase) :
                 if not dl_datafile.bytestring==ref_data :
                     raise RuntimeError('ERROR: files are not the same after reconstruction!')
             #make sure the hashes are mismatched if some chunks are missing
-            dl_datafile._chunk_offsets_downloaded=[]
+            dl_datafile._chunks_downloaded=None
             hash_missing_some_chunks = sha512()
             for ic,dfc in enumerate(self.ul_datafile.chunks_to_upload) :
                 if ic%3==0 :
@@ -99,3 +99,114 @@ class TestDownloadDataFile(unittest.TestCase) :
 
     def test_download_chunks_to_memory(self) :
         self.run_download_chunks('memory')
+
+    def test_resume_download_to_disk_from_checkpoint(self) :
+        TEST_CONST.TEST_RECO_DIR_PATH.mkdir()
+        try :
+            subdir_as_path = pathlib.Path('').joinpath(*(pathlib.PurePosixPath(TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME).parts))
+            dfcs_as_dl = []
+            for dfc in self.ul_datafile.chunks_to_upload :
+                dfc._populate_with_file_data(logger=LOGGER)
+                dfc_as_dl = DataFileChunk(subdir_as_path/dfc.filename,dfc.filename,
+                                          dfc.file_hash,dfc.chunk_hash,
+                                          None,dfc.chunk_offset_write,
+                                          dfc.chunk_size,
+                                          dfc.chunk_i,dfc.n_total_chunks,data=dfc.data,file_size=dfc.file_size)
+                dfc_as_dl.rootdir = TEST_CONST.TEST_RECO_DIR_PATH
+                dfcs_as_dl.append(dfc_as_dl)
+            #add the first half of the chunks and checkpoint the file
+            n_first_half = len(dfcs_as_dl)//2
+            dl_datafile = DownloadDataFileToDisk(dfcs_as_dl[0].filepath,logger=LOGGER)
+            for dfc_as_dl in dfcs_as_dl[:n_first_half] :
+                self.assertEqual(dl_datafile.add_chunk(dfc_as_dl),DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS)
+            dl_datafile.write_checkpoint()
+            checkpoint_filepath = dl_datafile.checkpoint_filepath
+            self.assertTrue(checkpoint_filepath.is_file())
+            #the file should be preallocated under its temporary name and not yet exist under its final name
+            partial_filepath = dl_datafile.partial_filepath
+            self.assertEqual(partial_filepath.stat().st_size,TEST_CONST.TEST_DATA_FILE_PATH.stat().st_size)
+            self.assertFalse(dl_datafile.full_filepath.is_file())
+            #a new file picks up from the checkpoint, so all of the first half of the chunks are already written
+            dl_datafile = DownloadDataFileToDisk(dfcs_as_dl[0].filepath,logger=LOGGER)
+            for dfc_as_dl in dfcs_as_dl[:n_first_half] :
+                self.assertEqual(dl_datafile.add_chunk(dfc_as_dl),DATA_FILE_HANDLING_CONST.CHUNK_ALREADY_WRITTEN_CODE)
+            self.assertEqual(dl_datafile.n_chunks_downloaded,n_first_half)
+            for ic,dfc_as_dl in enumerate(dfcs_as_dl[n_first_half:],start=n_first_half) :
+                check = dl_datafile.add_chunk(dfc_as_dl)
+                expected_check_value = DATA_FILE_HANDLING_CONST.FILE_IN_PROGRESS
+                if ic==len(dfcs_as_dl)-1 :
+                    expected_check_value = DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE
+                self.assertEqual(check,expected_check_value)
+            #the checkpoint and temporary files should be removed and the file should be the same as the original
+            self.assertFalse(checkpoint_filepath.is_file())
+            self.assertFalse(partial_filepath.is_file())
+            fp = TEST_CONST.TEST_RECO_DIR_PATH/TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME/dl_datafile.filename
+            if not filecmp.cmp(TEST_CONST.TEST_DATA_FILE_PATH,fp,shallow=False) :
+                raise RuntimeError('ERROR: files are not the same after reconstruction!')
+        except Exception as e :
+            raise e
+        finally :
+            shutil.rmtree(TEST_CONST.TEST_RECO_DIR_PATH)
+
+    def test_download_chunks_to_memory_views(self) :
+        with open(TEST_CONST.TEST_DATA_FILE_PATH,'rb') as fp :
+            ref_data = fp.read()
+        subdir_as_path = pathlib.Path('').joinpath(*(pathlib.PurePosixPath(TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME).parts))
+        dl_datafile = None
+        #add the chunks in reverse order, with the file size given so the buffer is allocated all at once
+        for dfc in reversed(self.ul_datafile.chunks_to_upload) :
+            dfc._populate_with_file_data(logger=LOGGER)
+            dfc_as_dl = DataFileChunk(subdir_as_path/dfc.filename,dfc.filename,
+                                      dfc.file_hash,dfc.chunk_hash,
+                                      None,dfc.chunk_offset_write,
+                                      dfc.chunk_size,
+                                      dfc.chunk_i,dfc.n_total_chunks,data=dfc.data,file_size=dfc.file_size)
+            dfc_as_dl.rootdir = TEST_CONST.TEST_RECO_DIR_PATH
+            if dl_datafile is None :
+                dl_datafile = DownloadDataFileToMemory(dfc_as_dl.filepath,logger=LOGGER)
+            check = dl_datafile.add_chunk(dfc_as_dl)
+            self.assertEqual(len(dl_datafile.bytestring),len(ref_data))
+        self.assertEqual(check,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+        self.assertEqual(dl_datafile.bytestring,ref_data)
+        self.assertEqual(dl_datafile.data_memoryview,ref_data)
+        self.assertEqual(dl_datafile.data_array.tobytes(),ref_data)
+        with dl_datafile.data_reader as reader :
+            self.assertEqual(reader.read(),ref_data)
+            #the reader should also support reading in pieces from any position, like a file
+            reader.seek(-10,os.SEEK_END)
+            self.assertEqual(reader.read(4),ref_data[-10:-6])
+            self.assertEqual(reader.tell(),len(ref_data)-6)
+            reader.seek(0)
+            self.assertEqual(reader.readline(),ref_data[:ref_data.index(b'\n')+1])
+
+    def test_spill_download_to_disk(self) :
+        with open(TEST_CONST.TEST_DATA_FILE_PATH,'rb') as fp :
+            ref_data = fp.read()
+        subdir_as_path = pathlib.Path('').joinpath(*(pathlib.PurePosixPath(TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME).parts))
+        dl_datafile = None
+        n_chunks = len(self.ul_datafile.chunks_to_upload)
+        #spill the file to disk halfway through and make sure the rest of the chunks are added correctly
+        for ic,dfc in enumerate(self.ul_datafile.chunks_to_upload) :
+            dfc._populate_with_file_data(logger=LOGGER)
+            dfc_as_dl = DataFileChunk(subdir_as_path/dfc.filename,dfc.filename,
+                                      dfc.file_hash,dfc.chunk_hash,
+                                      None,dfc.chunk_offset_write,
+                                      dfc.chunk_size,
+                                      dfc.chunk_i,dfc.n_total_chunks,data=dfc.data,file_size=dfc.file_size)
+            dfc_as_dl.rootdir = TEST_CONST.TEST_RECO_DIR_PATH
+            if dl_datafile is None :
+                dl_datafile = DownloadDataFileToMemory(dfc_as_dl.filepath,logger=LOGGER)
+            if ic==n_chunks//2 :
+                self.assertEqual(dl_datafile.n_bytes_in_memory,len(ref_data))
+                dl_datafile.spill_to_disk()
+                self.assertTrue(dl_datafile.spilled)
+                self.assertEqual(dl_datafile.n_bytes_in_memory,0)
+            check = dl_datafile.add_chunk(dfc_as_dl)
+        self.assertEqual(check,DATA_FILE_HANDLING_CONST.FILE_SUCCESSFULLY_RECONSTRUCTED_CODE)
+        self.assertEqual(dl_datafile.data_memoryview,ref_data)
+        self.assertEqual(dl_datafile.data_array.tobytes(),ref_data)
+        with dl_datafile.data_reader as reader :
+            self.assertEqual(reader.read(),ref_data)
+        #closing the temporary file (once the file is done being used) shouldn't leave anything spilled
+        dl_datafile.close_spill_file()
+        self.assertFalse(dl_datafile.spilled)
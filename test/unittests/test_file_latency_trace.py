@@ -0,0 +1,59 @@
+#imports
+import unittest, pathlib, logging, time
+from openmsipython.utilities.logging import Logger
+from openmsipython.utilities.metrics import METRICS
+from openmsipython.my_kafka.config import MSG_HEADER_CONST
+from openmsipython.data_file_io.file_latency_trace import FileLatencyTrace
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+
+class ConsumedChunk :
+    """
+    Stands in for a DataFileChunk consumed from a message with the given headers
+    """
+    def __init__(self,headers) :
+        self.headers = headers
+
+class TestFileLatencyTrace(unittest.TestCase) :
+    """
+    Class for testing FileLatencyTrace functions
+    """
+
+    def test_latencies(self) :
+        now = time.time()
+        headers = {MSG_HEADER_CONST.DETECTED_AT:f'{now-10.:.6f}',MSG_HEADER_CONST.CHUNKED_AT:f'{now-8.:.6f}'}
+        trace = FileLatencyTrace()
+        #chunks can arrive in any order
+        for produced_at in (now-5.,now-7.,now-6.) :
+            trace.add_chunk(ConsumedChunk({**headers,MSG_HEADER_CONST.PRODUCED_AT:f'{produced_at:.6f}'}))
+        trace.set_completed()
+        latencies = trace.get_latencies()
+        self.assertAlmostEqual(latencies['chunking'],2.,places=3)
+        self.assertAlmostEqual(latencies['upload_queue'],1.,places=3)
+        self.assertAlmostEqual(latencies['producing'],2.,places=3)
+        self.assertAlmostEqual(latencies['transport'],7.,delta=0.5)
+        self.assertTrue(0.<=latencies['reconstruction']<0.5)
+        self.assertNotIn('processing',latencies)
+        self.assertAlmostEqual(latencies['end_to_end'],10.,delta=0.5)
+        #processing should extend the end-to-end latency
+        trace.set_processed()
+        latencies = trace.get_latencies()
+        self.assertIn('processing',latencies)
+        self.assertGreaterEqual(latencies['end_to_end'],trace.completed_at-trace.detected_at)
+
+    def test_missing_headers(self) :
+        #messages produced without the upload-side times should only have the consuming-side stages
+        trace = FileLatencyTrace()
+        trace.add_chunk(ConsumedChunk({MSG_HEADER_CONST.PRODUCED_AT:'not a time'}))
+        trace.set_completed()
+        self.assertEqual(list(trace.get_latencies().keys()),['reconstruction'])
+
+    def test_report(self) :
+        trace = FileLatencyTrace()
+        trace.add_chunk(ConsumedChunk({MSG_HEADER_CONST.DETECTED_AT:f'{time.time()-1.:.6f}'}))
+        trace.set_completed()
+        histogram = METRICS.histogram('openmsi_file_latency_end_to_end_seconds','')
+        count = histogram.count
+        trace.report('test_file.dat',LOGGER)
+        self.assertEqual(histogram.count,count+1)
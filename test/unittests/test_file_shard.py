@@ -0,0 +1,147 @@
+#imports
+import unittest, pathlib, time
+from queue import Queue
+from threading import Thread, Event
+from openmsipython.data_file_io.file_shard import CheckpointRequest, FileShard, FileShardRouter
+from openmsipython.data_file_io.worker_processes import WorkerProcessGroupMember
+
+class TestFileShard(unittest.TestCase) :
+    """
+    Class for testing FileShard functions
+    """
+
+    def test_get_shard_index(self) :
+        n_shards = 4
+        filepaths = [pathlib.Path('subdir')/f'file_{i}.dat' for i in range(100)]
+        indices = [FileShard.get_shard_index(fp,n_shards) for fp in filepaths]
+        for index in indices :
+            self.assertTrue(0<=index<n_shards)
+        #the same path should always go to the same shard
+        self.assertEqual(indices,[FileShard.get_shard_index(fp,n_shards) for fp in filepaths])
+        #and files should be spread out across all of the shards
+        self.assertEqual(set(indices),set(range(n_shards)))
+
+    def test_get_items(self) :
+        shard = FileShard(0)
+        self.assertEqual(shard.get_items(),[])
+        self.assertEqual(shard.get_items(0.01),[])
+        for i in range(5) :
+            shard.queue.put(i)
+        self.assertEqual(shard.get_items(),list(range(5)))
+        self.assertEqual(shard.get_items(),[])
+        #an item put in the queue from another thread should be returned while waiting
+        thread = Thread(target=shard.queue.put,args=('item',))
+        thread.start()
+        self.assertEqual(shard.get_items(5.),['item'])
+        thread.join()
+
+    def test_get_data_files_snapshot(self) :
+        shard = FileShard(0)
+        #keep adding and removing files from another thread while snapshots are taken
+        stop = Event()
+        def churn() :
+            i = 0
+            while not stop.is_set() :
+                shard.data_files_by_path[i] = i
+                shard.data_files_by_path.pop(i-100,None)
+                i+=1
+        thread = Thread(target=churn)
+        thread.start()
+        try :
+            for _ in range(1000) :
+                snapshot = shard.get_data_files_snapshot()
+                self.assertIsNot(snapshot,shard.data_files_by_path)
+        finally :
+            stop.set()
+            thread.join()
+        self.assertEqual(shard.get_data_files_snapshot(),shard.data_files_by_path)
+
+    def test_checkpoint_request(self) :
+        request = CheckpointRequest()
+        self.assertFalse(request.is_done())
+        self.assertFalse(request.succeeded)
+        request.set_done(True)
+        self.assertTrue(request.is_done())
+        self.assertTrue(request.succeeded)
+
+    def test_file_shard_router_resize(self) :
+        router = FileShardRouter(2)
+        filepaths = [pathlib.Path('subdir')/f'file_{i}.dat' for i in range(20)]
+        for fp in filepaths :
+            shard = router.shards[router.get_shard_index(fp)]
+            shard.data_files_by_path[fp] = str(fp)
+            shard.last_chunk_times[fp] = 1.
+            shard.n_msgs_read+=1
+        router.shards[0].completed_filepaths.append('done.dat')
+        router.resize(5)
+        self.assertEqual(len(router.shards),5)
+        self.assertEqual(router.n_total_shards,5)
+        #every file and everything stored about it should now be in the shard that owns it
+        for fp in filepaths :
+            shard = router.shards[router.get_shard_index(fp)]
+            self.assertEqual(shard.data_files_by_path[fp],str(fp))
+            self.assertIn(fp,shard.last_chunk_times)
+        self.assertEqual(sum([len(s.data_files_by_path) for s in router.shards]),len(filepaths))
+        self.assertEqual(sum([s.n_msgs_read for s in router.shards]),len(filepaths))
+        self.assertEqual([fp for s in router.shards for fp in s.completed_filepaths],['done.dat'])
+        #items should be handed off to the new shards
+        router.hand_off('chunk',4)
+        self.assertEqual(router.shards[4].get_items(),['chunk'])
+
+    def test_file_shard_router_between_processes(self) :
+        #two routers standing in for worker processes with two threads each (queues and events are shared 
+        #the same way they are between processes)
+        n_processes = 2; n_threads = 2
+        inbound_queues = [Queue() for _ in range(n_processes)]
+        finished_events = [Event() for _ in range(n_processes)]
+        routers = []
+        for pi in range(n_processes) :
+            member = WorkerProcessGroupMember(pi,inbound_queues,finished_events,Queue(),Queue())
+            routers.append(FileShardRouter(n_threads,member))
+        self.assertEqual([s.index for r in routers for s in r.shards],list(range(n_processes*n_threads)))
+        self.assertEqual(routers[0].n_total_shards,n_processes*n_threads)
+        #an item handed off to a shard in the other process should end up in that shard's queue
+        routers[0].hand_off('chunk',3)
+        self.assertEqual(routers[1].shards[1].get_items(5.),['chunk'])
+        #and a checkpoint request should be answered once the owner of that shard sets it as done
+        request = routers[0].request_checkpoint(2)
+        remote_request = routers[1].shards[0].get_items(5.)[0]
+        self.assertTrue(isinstance(remote_request,CheckpointRequest))
+        remote_request.set_done(True)
+        start = time.time()
+        while (not request.is_done()) and time.time()-start<5. :
+            time.sleep(0.01)
+        self.assertTrue(request.is_done())
+        self.assertTrue(request.succeeded)
+        #every process only counts as finished when all of their shards are
+        for router in routers :
+            for shard in router.shards :
+                self.assertFalse(router.all_finished())
+                router.set_finished(shard)
+        self.assertTrue(all([router.all_finished() for router in routers]))
+        for router in routers :
+            router.join()
+
+    def test_file_shard_router_dead_process(self) :
+        #a router standing in for one of two worker processes, where the other process never answers
+        inbound_queues = [Queue() for _ in range(2)]
+        finished_events = [Event() for _ in range(2)]
+        router = FileShardRouter(1,WorkerProcessGroupMember(0,inbound_queues,finished_events,Queue(),Queue()))
+        request = router.request_checkpoint(1)
+        self.assertEqual(inbound_queues[1].get(timeout=5.)[0],'checkpoint')
+        self.assertFalse(request.is_done())
+        #the request should fail once the other process is reported dead
+        inbound_queues[0].put(('dead',1))
+        start = time.time()
+        while (not request.is_done()) and time.time()-start<5. :
+            time.sleep(0.01)
+        self.assertTrue(request.is_done())
+        self.assertFalse(request.succeeded)
+        #and so should any new requests sent to it
+        request = router.request_checkpoint(1)
+        self.assertTrue(request.is_done())
+        self.assertFalse(request.succeeded)
+        self.assertTrue(inbound_queues[1].empty())
+        finished_events[1].set()
+        router.set_finished(router.shards[0])
+        router.join()
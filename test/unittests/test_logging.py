@@ -0,0 +1,97 @@
+#imports
+import unittest, pathlib, logging, tempfile, shutil, time
+from threading import Thread
+from openmsipython.utilities.logging import LogQueueHandler, Logger, RateLimitedWarnings
+from openmsipython.utilities.metrics import METRICS
+
+class TestLogging(unittest.TestCase) :
+    """
+    Class for testing Logger functions
+    """
+
+    def setUp(self) :
+        self.log_dir = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self) :
+        shutil.rmtree(self.log_dir)
+
+    def test_loggers_with_the_same_name(self) :
+        log_filepath = self.log_dir/'test.log'
+        loggers = [Logger('test_loggers_with_the_same_name',logging.ERROR,log_filepath) for _ in range(3)]
+        #the loggers should all share a single handler on the underlying logging.Logger and a single file handler
+        handlers = logging.getLogger('test_loggers_with_the_same_name').handlers
+        self.assertEqual(len(handlers),1)
+        self.assertTrue(isinstance(handlers[0],LogQueueHandler))
+        self.assertEqual(len(set([id(logger._filehandler) for logger in loggers])),1)
+        loggers[1].info('logged once')
+        loggers[0].flush()
+        with open(log_filepath) as fp :
+            lines = fp.readlines()
+        self.assertEqual(len(lines),1)
+        self.assertTrue(lines[0].endswith('logged once\n'))
+        loggers[0]._filehandler.close()
+
+    def test_logging_from_threads(self) :
+        log_filepath = self.log_dir/'test.log'
+        logger = Logger('test_logging_from_threads',logging.ERROR,log_filepath)
+        def log_lines(i) :
+            for j in range(100) :
+                logger.info(f'thread {i} line {j}')
+        threads = [Thread(target=log_lines,args=(i,)) for i in range(4)]
+        for t in threads :
+            t.start()
+        for t in threads :
+            t.join()
+        #records below a handler's level when they're logged shouldn't be written even if the level changes later
+        logger.debug('not written')
+        logger.set_file_level(logging.DEBUG)
+        logger.flush()
+        with open(log_filepath) as fp :
+            lines = fp.readlines()
+        self.assertEqual(len(lines),400)
+        for i in range(4) :
+            lines_from_thread = [line for line in lines if f'thread {i} ' in line]
+            #lines from each thread should be written in the order they were logged
+            self.assertEqual([int(line.split()[-1]) for line in lines_from_thread],list(range(100)))
+        logger._filehandler.close()
+
+    def test_rate_limited_warnings(self) :
+        logger = Logger('test_rate_limited_warnings',logging.ERROR)
+        warnings = RateLimitedWarnings('test_rate_limited','tests',n_per_period=3,period_secs=0.5)
+        n_formatted = []
+        def get_msg() :
+            n_formatted.append(1)
+            return 'WARNING: something happened'
+        with self.assertLogs('test_rate_limited_warnings',level='WARNING') as logs :
+            for _ in range(10) :
+                warnings.warning(logger,get_msg)
+            time.sleep(0.6)
+            warnings.warning(logger,get_msg)
+        #the first three should be logged (the last saying that more will be summarized), 
+        #then a summary of the other seven along with the first one in the next period
+        self.assertEqual(len(logs.output),5)
+        self.assertIn('further similar warnings will be summarized',logs.output[2])
+        self.assertIn('suppressed 7 similar warnings',logs.output[3])
+        #suppressed messages should never be formatted
+        self.assertEqual(len(n_formatted),4)
+        self.assertEqual(METRICS.get('openmsi_test_rate_limited_warnings_total').value,11)
+        self.assertEqual(METRICS.get('openmsi_test_rate_limited_warnings_suppressed_total').value,7)
+
+    def test_rate_limited_warnings_final_summary(self) :
+        logger = Logger('test_rate_limited_warnings_final_summary',logging.ERROR)
+        warnings = RateLimitedWarnings('test_rate_limited_final','tests',n_per_period=2,period_secs=0.5)
+        with self.assertLogs('test_rate_limited_warnings_final_summary',level='WARNING') as logs :
+            for _ in range(5) :
+                warnings.warning(logger,'WARNING: something happened')
+            #the summary should be logged when the period ends even though no more warnings come in
+            time.sleep(1.)
+        self.assertEqual(len(logs.output),3)
+        self.assertIn('suppressed 3 similar warnings',logs.output[2])
+        #and when the log is flushed, without waiting for the period to end
+        warnings = RateLimitedWarnings('test_rate_limited_flushed','tests',n_per_period=1,period_secs=60.)
+        with self.assertLogs('test_rate_limited_warnings_final_summary',level='WARNING') as logs :
+            for _ in range(3) :
+                warnings.warning(logger,'WARNING: something happened')
+            logger.flush()
+        self.assertEqual(len(logs.output),2)
+        self.assertIn('suppressed 2 similar warnings',logs.output[1])
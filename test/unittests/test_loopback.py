@@ -0,0 +1,178 @@
+#imports
+import unittest, pathlib, logging, tempfile, shutil, time, filecmp
+from confluent_kafka import KafkaException, KafkaError
+from openmsipython.data_file_io.config import RUN_OPT_CONST
+from openmsipython.utilities.logging import Logger
+from openmsipython.my_kafka import loopback
+from openmsipython.my_kafka.loopback import LoopbackProducer, LoopbackConsumer, LoopbackSerializingProducer
+from openmsipython.my_kafka.my_producers import MySerializingProducer
+from openmsipython.my_kafka.my_consumers import MyDeserializingConsumer, MyLoopbackDeserializingConsumer
+from openmsipython.data_file_io.upload_data_file import UploadDataFile
+from openmsipython.data_file_io.data_file_download_directory import DataFileDownloadDirectory
+from config import TEST_CONST
+from utilities import MyThread
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+TIMEOUT_SECS = 60
+TOPIC_NAME = 'test_loopback'
+
+class TestLoopback(unittest.TestCase) :
+    """
+    Class for testing the in-process loopback transport
+    """
+
+    def setUp(self) :
+        self.tempdir = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self) :
+        shutil.rmtree(self.tempdir)
+
+    #called by the test methods below
+    def produce_and_consume_in_group(self,servers) :
+        producer = LoopbackProducer({'bootstrap.servers':servers,'num.partitions':4})
+        delivered = []
+        for i in range(200) :
+            producer.produce(TOPIC_NAME,value=f'value_{i}',key=f'key_{i%10}',headers=[('i',str(i).encode())],
+                             on_delivery=lambda err,msg : delivered.append((err,msg)))
+            if i%50==0 :
+                producer.poll(0)
+        self.assertEqual(producer.flush(),0)
+        self.assertEqual(len(delivered),200)
+        self.assertTrue(all([err is None for err,_ in delivered]))
+        #messages with the same key should all have gone to the same partition
+        partitions_by_key = {}
+        for _,msg in delivered :
+            partitions_by_key.setdefault(msg.key(),set()).add(msg.partition())
+        self.assertEqual([len(partitions) for partitions in partitions_by_key.values()],[1]*10)
+        configs = {'bootstrap.servers':servers,'group.id':'test_group','auto.offset.reset':'earliest',
+                   'enable.auto.commit':False}
+        consumers = [LoopbackConsumer(configs) for _ in range(2)]
+        for consumer in consumers :
+            consumer.subscribe([TOPIC_NAME])
+        msgs_by_consumer = [consumer.consume(300,0.1) for consumer in consumers]
+        #the partitions should have been split between the consumers in the group
+        self.assertEqual([len(consumer.assignment()) for consumer in consumers],[2,2])
+        msgs = msgs_by_consumer[0]+msgs_by_consumer[1]
+        self.assertEqual(sorted([msg.value() for msg in msgs]),sorted([f'value_{i}'.encode() for i in range(200)]))
+        self.assertEqual(msgs[0].headers()[0][0],'i')
+        #committing twice in a row should raise an error with the "no offset" code the second time
+        consumers[0].commit(asynchronous=False)
+        with self.assertRaises(KafkaException) as cm :
+            consumers[0].commit(asynchronous=False)
+        self.assertEqual(cm.exception.args[0].code(),KafkaError._NO_OFFSET)
+        for consumer in consumers :
+            consumer.close()
+        #a new consumer in the group should only get the messages whose offsets weren't committed
+        consumer = LoopbackConsumer(configs)
+        consumer.subscribe([TOPIC_NAME])
+        self.assertEqual(len(consumer.consume(300,0.1)),len(msgs_by_consumer[1]))
+        #and new messages as they're produced
+        producer.produce(TOPIC_NAME,value=b'new')
+        producer.flush()
+        self.assertEqual([msg.value() for msg in consumer.consume(300,1)],[b'new'])
+        consumer.commit()
+        consumer.close()
+
+    def test_in_memory(self) :
+        self.produce_and_consume_in_group('loopback://test_loopback_in_memory')
+
+    def test_segment_files(self) :
+        servers = f'loopback://{self.tempdir/"loopback_logs"}'
+        self.produce_and_consume_in_group(servers)
+        self.assertTrue(len(list((self.tempdir/'loopback_logs'/TOPIC_NAME).glob('*/*.log')))>0)
+        #a broker starting from the same directory (as in a different process) should see the same messages
+        #and committed offsets
+        address = str((self.tempdir/'loopback_logs').resolve())
+        old_broker = loopback.BROKERS.pop(address)
+        consumer = LoopbackConsumer({'bootstrap.servers':servers,'group.id':'test_group'})
+        self.assertIsNot(loopback.get_loopback_broker({'bootstrap.servers':servers}),old_broker)
+        consumer.subscribe([TOPIC_NAME])
+        self.assertEqual(consumer.consume(300,0.1),[])
+        consumer.close()
+        consumer = LoopbackConsumer({'bootstrap.servers':servers,'group.id':'new_group','auto.offset.reset':'earliest'})
+        consumer.subscribe([TOPIC_NAME])
+        self.assertEqual(len(consumer.consume(300,0.5)),201)
+        consumer.close()
+
+    def test_members_expire(self) :
+        for servers in ('loopback://test_loopback_members_expire',f'loopback://{self.tempdir/"loopback_logs"}') :
+            producer = LoopbackProducer({'bootstrap.servers':servers,'num.partitions':4})
+            for i in range(20) :
+                producer.produce(TOPIC_NAME,value=f'value_{i}')
+            producer.flush()
+            configs = {'bootstrap.servers':servers,'group.id':'test_group','auto.offset.reset':'earliest',
+                       'session.timeout.ms':300}
+            consumers = [LoopbackConsumer(configs) for _ in range(2)]
+            for consumer in consumers :
+                consumer.subscribe([TOPIC_NAME])
+            n_msgs = len(consumers[0].consume(100,0.1))
+            self.assertEqual(len(consumers[0].assignment()),2)
+            #once the second consumer stops polling for longer than the session timeout, 
+            #the first one should get all of the partitions
+            time.sleep(0.5)
+            n_msgs+=len(consumers[0].consume(100,0.1))
+            self.assertEqual(len(consumers[0].assignment()),4)
+            self.assertEqual(n_msgs,20)
+            for consumer in consumers :
+                consumer.close()
+
+    def test_torn_append_dropped(self) :
+        servers = f'loopback://{self.tempdir/"loopback_logs"}'
+        producer = LoopbackProducer({'bootstrap.servers':servers,'num.partitions':1})
+        producer.produce(TOPIC_NAME,value=b'first')
+        producer.flush()
+        #leave part of a record at the end of the segment, like an append that was interrupted
+        segment = list((self.tempdir/'loopback_logs'/TOPIC_NAME/'0').glob('*.log'))[0]
+        with open(segment,'ab') as fp :
+            fp.write(b'\x00\x00\x01\x00torn')
+        producer.produce(TOPIC_NAME,value=b'second')
+        producer.flush()
+        consumer = LoopbackConsumer({'bootstrap.servers':servers,'group.id':'test_group',
+                                     'auto.offset.reset':'earliest'})
+        consumer.subscribe([TOPIC_NAME])
+        self.assertEqual([msg.value() for msg in consumer.consume(10,0.5)],[b'first',b'second'])
+        consumer.close()
+
+    def test_in_memory_with_several_processes(self) :
+        #an in-memory broker can't be shared by worker processes
+        with self.assertRaises(ValueError) :
+            _ = DataFileDownloadDirectory(self.tempdir,TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,TOPIC_NAME,
+                                          n_threads=1,n_processes=2,logger=LOGGER)
+
+    def test_selected_from_config_file(self) :
+        producer = MySerializingProducer.from_file(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,logger=LOGGER)
+        self.assertIsInstance(producer,LoopbackSerializingProducer)
+        consumer = MyDeserializingConsumer.from_file(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,logger=LOGGER)
+        self.assertIsInstance(consumer,MyLoopbackDeserializingConsumer)
+        consumer.close()
+
+    def test_upload_and_download_offline(self) :
+        #upload the test file
+        topic_name = f'{TOPIC_NAME}_{time.time()}'
+        datafile = UploadDataFile(TEST_CONST.TEST_DATA_FILE_PATH,
+                                  rootdir=TEST_CONST.TEST_DATA_FILE_ROOT_DIR_PATH,logger=LOGGER)
+        datafile.upload_whole_file(TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,topic_name,
+                                   n_threads=RUN_OPT_CONST.N_DEFAULT_UPLOAD_THREADS,
+                                   chunk_size=RUN_OPT_CONST.DEFAULT_CHUNK_SIZE)
+        #reconstruct it from the loopback broker in a separate thread so it can be timed out
+        reco_dir = self.tempdir/'reco'
+        reco_dir.mkdir()
+        dfdd = DataFileDownloadDirectory(reco_dir,TEST_CONST.LOOPBACK_CONFIG_FILE_PATH,topic_name,
+                                         n_threads=RUN_OPT_CONST.N_DEFAULT_DOWNLOAD_THREADS,
+                                         consumer_group_ID='test_upload_and_download_offline',logger=LOGGER)
+        download_thread = MyThread(target=dfdd.reconstruct)
+        download_thread.start()
+        try :
+            time_waited = 0
+            while TEST_CONST.TEST_DATA_FILE_NAME not in [fp.name for fp in dfdd.completely_reconstructed_filepaths] :
+                if time_waited>=TIMEOUT_SECS :
+                    raise TimeoutError(f'ERROR: file was not reconstructed after {TIMEOUT_SECS} seconds!')
+                time.sleep(0.5)
+                time_waited+=0.5
+        finally :
+            dfdd.control_command_queue.put('q')
+            download_thread.join(timeout=TIMEOUT_SECS)
+        self.assertFalse(download_thread.is_alive())
+        fp = reco_dir/TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME/TEST_CONST.TEST_DATA_FILE_NAME
+        self.assertTrue(filecmp.cmp(TEST_CONST.TEST_DATA_FILE_PATH,fp,shallow=False))
@@ -0,0 +1,70 @@
+#imports
+import unittest, pathlib, logging
+from openmsipython.utilities.logging import Logger
+from openmsipython.data_file_io.config import RUN_OPT_CONST
+from openmsipython.data_file_io.upload_data_file import UploadDataFile
+from openmsipython.my_kafka.message_filter import MessageFilter
+from config import TEST_CONST
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+
+class RawMessage :
+    """
+    Stands in for a consumed message whose key hasn't been deserialized yet
+    """
+    def __init__(self,key,headers=None) :
+        self.__key = key
+        self.__headers = headers
+    def key(self) :
+        return self.__key
+    def headers(self) :
+        return self.__headers
+
+class TestMessageFilter(unittest.TestCase) :
+    """
+    Class for testing MessageFilter functions
+    """
+
+    def setUp(self) :
+        #get the raw key of a message for a chunk of the test file (which is in a subdirectory)
+        udf = UploadDataFile(TEST_CONST.TEST_DATA_FILE_PATH,
+                             rootdir=TEST_CONST.TEST_DATA_FILE_ROOT_DIR_PATH,logger=LOGGER)
+        udf._build_list_of_file_chunks(RUN_OPT_CONST.DEFAULT_CHUNK_SIZE)
+        self.chunk = udf.chunks_to_upload[0]
+        self.msg = RawMessage(self.chunk.message_key.encode())
+        self.subdir = TEST_CONST.TEST_DATA_FILE_SUB_DIR_NAME
+
+    def test_include(self) :
+        self.assertTrue(MessageFilter().accepts(self.msg))
+        self.assertTrue(MessageFilter(include_globs=['*.dat']).accepts(self.msg))
+        self.assertTrue(MessageFilter(include_globs=[f'{self.subdir}/*']).accepts(self.msg))
+        self.assertTrue(MessageFilter(include_globs=['*.txt',f'{self.subdir}/*.dat']).accepts(self.msg))
+        self.assertFalse(MessageFilter(include_globs=['*.txt']).accepts(self.msg))
+        self.assertFalse(MessageFilter(include_globs=['other_subdir/*']).accepts(self.msg))
+        #the "_chunk_i_of_n" part of the key shouldn't be matched
+        self.assertFalse(MessageFilter(include_globs=['*_of_*']).accepts(self.msg))
+
+    def test_exclude(self) :
+        self.assertFalse(MessageFilter(exclude_globs=['*.dat']).accepts(self.msg))
+        self.assertFalse(MessageFilter(include_globs=['*.dat'],exclude_globs=[f'{self.subdir}/*']).accepts(self.msg))
+        self.assertTrue(MessageFilter(exclude_globs=['*.txt']).accepts(self.msg))
+
+    def test_relpath_header(self) :
+        #with headers, paths should be matched exactly instead of based on the key
+        msg = RawMessage(self.chunk.message_key.encode(),self.chunk.message_headers)
+        self.assertTrue(MessageFilter(include_globs=[f'{self.subdir}/*']).accepts(msg))
+        self.assertFalse(MessageFilter(include_globs=[f'{self.subdir}_*']).accepts(msg))
+        self.assertTrue(MessageFilter(include_globs=[f'{self.subdir}_*']).accepts(self.msg))
+
+    def test_unreadable_keys_are_kept(self) :
+        message_filter = MessageFilter(include_globs=['*.txt'])
+        self.assertTrue(message_filter.accepts(RawMessage(None)))
+        self.assertTrue(message_filter.accepts(RawMessage(b'\xff\xfe')))
+
+    def test_accepts_path(self) :
+        message_filter = MessageFilter(include_globs=['subdir/*.dat'],exclude_globs=['*/skip_*'])
+        self.assertTrue(message_filter.accepts_path('subdir/file.dat'))
+        self.assertTrue(message_filter.accepts_path(pathlib.PurePosixPath('subdir/file.dat')))
+        self.assertFalse(message_filter.accepts_path('subdir/skip_file.dat'))
+        self.assertFalse(message_filter.accepts_path('other/file.dat'))
@@ -0,0 +1,79 @@
+#imports
+import unittest, pathlib, logging, urllib.request, urllib.error
+from threading import Thread
+from openmsipython.utilities.logging import Logger
+from openmsipython.utilities.metrics import MetricsRegistry, MetricsServer
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+
+class TestMetrics(unittest.TestCase) :
+    """
+    Class for testing MetricsRegistry and MetricsServer functions
+    """
+
+    def test_counter_in_threads(self) :
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total','A test counter')
+        #getting a metric with the same name should return the same one
+        self.assertIs(registry.counter('test_total','A test counter'),counter)
+        with self.assertRaises(ValueError) :
+            registry.gauge('test_total','Not a counter')
+        def count() :
+            for _ in range(10000) :
+                counter.inc()
+        threads = [Thread(target=count) for _ in range(4)]
+        for t in threads :
+            t.start()
+        for t in threads :
+            t.join()
+        counter.inc(5)
+        self.assertEqual(counter.value,40005)
+
+    def test_gauge(self) :
+        registry = MetricsRegistry()
+        gauge = registry.gauge('test_gauge','A test gauge')
+        gauge.set(3)
+        self.assertEqual(gauge.value,3)
+        items = [1,2]
+        registry.gauge('test_gauge','A test gauge',function=lambda : len(items))
+        items.append(3)
+        self.assertEqual(gauge.value,3)
+
+    def test_histogram(self) :
+        registry = MetricsRegistry()
+        histogram = registry.histogram('test_seconds','A test histogram',buckets=(0.1,1.))
+        for value in (0.05,0.5,0.5,2.) :
+            histogram.observe(value)
+        self.assertEqual(histogram.get_bucket_counts(),[1,2,1])
+        self.assertEqual(histogram.count,4)
+        self.assertAlmostEqual(histogram.sum,3.05)
+        lines = histogram.get_prometheus_lines()
+        self.assertEqual(lines,['test_seconds_bucket{le="0.1"} 1','test_seconds_bucket{le="1.0"} 3',
+                                'test_seconds_bucket{le="+Inf"} 4','test_seconds_sum 3.05','test_seconds_count 4'])
+
+    def test_summary(self) :
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total','A test counter')
+        registry.histogram('test_seconds','A test histogram')
+        #nothing should be summarized until something has been recorded
+        self.assertIsNone(registry.get_summary())
+        counter.inc(2)
+        summary = registry.get_summary()
+        self.assertIn('test_total = 2',summary)
+        self.assertNotIn('test_seconds',summary)
+
+    def test_metrics_server(self) :
+        registry = MetricsRegistry()
+        registry.counter('test_total','A test counter').inc(7)
+        server = MetricsServer(0,LOGGER,registry=registry)
+        try :
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics',timeout=5) as response :
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+                text = response.read().decode()
+            self.assertIn('# TYPE test_total counter\n',text)
+            self.assertIn('\ntest_total 7\n',text)
+            with self.assertRaises(urllib.error.HTTPError) :
+                urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other',timeout=5)
+        finally :
+            server.close()
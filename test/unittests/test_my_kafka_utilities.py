@@ -2,8 +2,12 @@
 from openmsipython.my_kafka.serialization import DataFileChunkSerializer, DataFileChunkDeserializer
 from confluent_kafka.serialization import DoubleSerializer, IntegerSerializer, StringSerializer
 from confluent_kafka.serialization import DoubleDeserializer, IntegerDeserializer, StringDeserializer
-from openmsipython.my_kafka.utilities import get_transformed_configs, get_replaced_configs
-import unittest
+from openmsipython.my_kafka.utilities import get_transformed_configs, get_replaced_configs, get_next_messages
+from openmsipython.utilities.logging import Logger
+import unittest, pathlib, logging
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
 
 class ReplacementDummyClass :
     """
@@ -13,6 +17,32 @@ class ReplacementDummyClass :
     def __init__(self) :
         pass
 
+class DummyMessage :
+    """
+    A dummy class with the parts of the interface of a consumed message used by get_next_messages
+    """
+
+    def __init__(self,value,error=None) :
+        self.__value = value
+        self.__error = error
+
+    def value(self) :
+        return self.__value
+
+    def error(self) :
+        return self.__error
+
+class DummyConsumer :
+    """
+    A dummy consumer whose consume function returns a fixed batch of messages
+    """
+
+    def __init__(self,msgs) :
+        self.msgs = msgs
+
+    def consume(self,num_messages=1,timeout=-1) :
+        return self.msgs[:num_messages]
+
 class TestMyKafkaUtilities(unittest.TestCase) :
     """
     Class for testing functions in openmsipython.my_kafka.utilities
@@ -79,3 +109,15 @@ class TestMyKafkaUtilities(unittest.TestCase) :
             _ = get_transformed_configs(None,None)
         with self.assertRaises(AttributeError) :
             _ = get_transformed_configs(test_config_dict,'never make this a recognized parameter group name')
+
+    def test_get_next_messages(self) :
+        msgs = [DummyMessage('a'),
+                DummyMessage(None),
+                DummyMessage('b',error='an error'),
+                DummyMessage(ValueError('failed to deserialize')),
+                DummyMessage('c'),
+            ]
+        consumer = DummyConsumer(msgs)
+        self.assertEqual(get_next_messages(consumer,LOGGER,len(msgs),0.),['a','c'])
+        self.assertEqual(get_next_messages(consumer,LOGGER,1,0.),['a'])
+        self.assertEqual(get_next_messages(DummyConsumer([]),LOGGER,10,0.),[])
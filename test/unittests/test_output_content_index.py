@@ -0,0 +1,51 @@
+#imports
+import unittest, shutil, os
+from hashlib import sha512
+from openmsipython.data_file_io.output_content_index import OutputContentIndex
+from config import TEST_CONST
+
+class TestOutputContentIndex(unittest.TestCase) :
+    """
+    Class for testing OutputContentIndex functions
+    """
+
+    def setUp(self) :
+        TEST_CONST.TEST_RECO_DIR_PATH.mkdir()
+        self.filepath = TEST_CONST.TEST_RECO_DIR_PATH/'subdir'/'test_file.dat'
+        self.filepath.parent.mkdir()
+
+    def tearDown(self) :
+        shutil.rmtree(TEST_CONST.TEST_RECO_DIR_PATH)
+
+    def test_get_file_hash(self) :
+        index = OutputContentIndex(TEST_CONST.TEST_RECO_DIR_PATH)
+        try :
+            #files that don't exist shouldn't have a hash
+            self.assertIsNone(index.get_file_hash(self.filepath))
+            #files that aren't indexed yet should be hashed when they're looked up
+            self.filepath.write_bytes(b'file contents')
+            self.assertEqual(index.get_file_hash(self.filepath),sha512(b'file contents').digest())
+            #files that change should be hashed again
+            self.filepath.write_bytes(b'other file contents')
+            stat = os.stat(self.filepath)
+            os.utime(self.filepath,ns=(stat.st_atime_ns,stat.st_mtime_ns+1000000000))
+            self.assertEqual(index.get_file_hash(self.filepath),sha512(b'other file contents').digest())
+            self.filepath.unlink()
+            self.assertIsNone(index.get_file_hash(self.filepath))
+        finally :
+            index.close()
+
+    def test_record_persists(self) :
+        self.filepath.write_bytes(b'file contents')
+        recorded_hash = sha512(b'recorded').digest()
+        index = OutputContentIndex(TEST_CONST.TEST_RECO_DIR_PATH)
+        try :
+            index.record(self.filepath,recorded_hash)
+        finally :
+            index.close()
+        #the recorded hash should be used (without rehashing) as long as the file hasn't changed
+        index = OutputContentIndex(TEST_CONST.TEST_RECO_DIR_PATH)
+        try :
+            self.assertEqual(index.get_file_hash(self.filepath),recorded_hash)
+        finally :
+            index.close()
@@ -0,0 +1,40 @@
+#imports
+import unittest, shutil
+from hashlib import sha512
+from openmsipython.data_file_io.processed_file_index import ProcessedFileIndex
+from config import TEST_CONST
+
+class TestProcessedFileIndex(unittest.TestCase) :
+    """
+    Class for testing ProcessedFileIndex functions
+    """
+
+    def setUp(self) :
+        TEST_CONST.TEST_RECO_DIR_PATH.mkdir()
+        self.index_path = TEST_CONST.TEST_RECO_DIR_PATH/'processed_file_index.sqlite'
+
+    def tearDown(self) :
+        shutil.rmtree(TEST_CONST.TEST_RECO_DIR_PATH)
+
+    def test_record_and_get_processed(self) :
+        file_hash = sha512(b'file contents').digest()
+        other_hash = sha512(b'other file contents').digest()
+        index = ProcessedFileIndex(self.index_path)
+        try :
+            self.assertEqual(index.get_processed(file_hash,['a','b'],'1'),set())
+            index.record(file_hash,['a'],'1',TEST_CONST.TEST_DATA_FILE_PATH)
+            self.assertEqual(index.get_processed(file_hash,['a','b'],'1'),{'a'})
+            #other versions, processors, and file contents shouldn't be counted
+            self.assertEqual(index.get_processed(file_hash,['a','b'],'2'),set())
+            self.assertEqual(index.get_processed(other_hash,['a','b'],'1'),set())
+            self.assertEqual(index.get_filepath(file_hash,'a','1'),str(TEST_CONST.TEST_DATA_FILE_PATH))
+            self.assertIsNone(index.get_filepath(file_hash,'b','1'))
+        finally :
+            index.close()
+        #the index should persist after it's reopened
+        index = ProcessedFileIndex(self.index_path)
+        try :
+            index.record(file_hash,['b'],'1',TEST_CONST.TEST_DATA_FILE_PATH)
+            self.assertEqual(index.get_processed(file_hash,['a','b'],'1'),{'a','b'})
+        finally :
+            index.close()
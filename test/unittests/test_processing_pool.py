@@ -0,0 +1,93 @@
+#imports
+import unittest, pathlib, logging
+from threading import Event
+from openmsipython.utilities.logging import Logger
+from openmsipython.data_file_io.config import RUN_OPT_CONST
+from openmsipython.data_file_io.upload_data_file import UploadDataFile
+from openmsipython.data_file_io.download_data_file import DownloadDataFileToMemory
+from openmsipython.data_file_io import processing_pool
+from openmsipython.data_file_io.processing_pool import FileProcessingPool
+from config import TEST_CONST
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+
+def check_data(datafile,reference_bytes) :
+    """
+    A processing function for the test below (module-level so that it can be pickled)
+    """
+    if bytes(datafile.bytestring)!=reference_bytes :
+        raise ValueError('ERROR: data in shared memory do not match the reference file!')
+    return None
+
+class TestProcessingPool(unittest.TestCase) :
+    """
+    Class for testing processing files in a FileProcessingPool
+    """
+
+    def get_downloaded_datafile(self) :
+        """
+        Return a DownloadDataFileToMemory holding the test data file
+        """
+        ul_datafile = UploadDataFile(TEST_CONST.TEST_DATA_FILE_PATH,
+                                     rootdir=TEST_CONST.TEST_DATA_FILE_ROOT_DIR_PATH,logger=LOGGER)
+        ul_datafile._build_list_of_file_chunks(RUN_OPT_CONST.DEFAULT_CHUNK_SIZE)
+        dl_datafile = DownloadDataFileToMemory(TEST_CONST.TEST_DATA_FILE_PATH,logger=LOGGER)
+        for dfc in ul_datafile.chunks_to_upload :
+            dfc._populate_with_file_data(logger=LOGGER)
+            dl_datafile.add_chunk(dfc)
+        return dl_datafile
+
+    def run_pool(self,processors) :
+        """
+        Process the test data file in a pool with the given processors and return the results
+        """
+        dl_datafile = self.get_downloaded_datafile()
+        pool = FileProcessingPool(processors,2)
+        results = []
+        done = Event()
+        def on_done(result) :
+            results.append(result)
+            done.set()
+        try :
+            pool.submit(dl_datafile.filepath,dl_datafile,{},on_done)
+            #the data should have been moved out of this process's private memory (if shared memory is available)
+            if processing_pool.shared_memory is not None :
+                self.assertEqual(dl_datafile.n_bytes_in_memory,0)
+            self.assertEqual(bytes(dl_datafile.bytestring),TEST_CONST.TEST_DATA_FILE_PATH.read_bytes())
+            self.assertTrue(done.wait(60))
+        finally :
+            pool.shutdown()
+        self.assertEqual(len(results),1)
+        self.assertEqual(results[0].filepath,dl_datafile.filepath)
+        del dl_datafile
+        return results[0].get()
+
+    def test_process_file_in_pool(self) :
+        results = self.run_pool({'check':(check_data,{'reference_bytes':TEST_CONST.TEST_DATA_FILE_PATH.read_bytes()})})
+        self.assertEqual(list(results.keys()),['check'])
+        processing_retval, tb = results['check']
+        self.assertIsNone(processing_retval)
+        self.assertIsNone(tb)
+
+    def test_process_file_in_pool_with_several_processors(self) :
+        #the same file should be sent to every processor, and one failing shouldn't affect the others
+        processors = {'good':(check_data,{'reference_bytes':TEST_CONST.TEST_DATA_FILE_PATH.read_bytes()}),
+                      'bad':(check_data,{'reference_bytes':b'not the right data'})}
+        results = self.run_pool(processors)
+        self.assertEqual(set(results.keys()),{'good','bad'})
+        self.assertEqual(results['good'],(None,None))
+        processing_retval, tb = results['bad']
+        self.assertTrue(isinstance(processing_retval,ValueError))
+        self.assertTrue('ValueError' in tb)
+
+    def test_process_file_in_pool_without_shared_memory(self) :
+        #without shared memory (as in Python 3.7) the data should be pickled to the workers instead
+        shared_memory = processing_pool.shared_memory
+        processing_pool.shared_memory = None
+        try :
+            results = self.run_pool({'check':(check_data,
+                                              {'reference_bytes':TEST_CONST.TEST_DATA_FILE_PATH.read_bytes()})})
+        finally :
+            processing_pool.shared_memory = shared_memory
+        self.assertEqual(results['check'],(None,None))
@@ -0,0 +1,62 @@
+#imports
+import unittest, pathlib, logging, tempfile, shutil, pstats, tracemalloc
+from threading import Thread
+from openmsipython.utilities.logging import Logger
+from openmsipython.utilities.profiling import ThreadProfiler
+
+#constants
+LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
+
+def busy_function(n) :
+    return sum([i*i for i in range(n)])
+
+class TestProfiling(unittest.TestCase) :
+    """
+    Class for testing ThreadProfiler functions
+    """
+
+    def setUp(self) :
+        self.output_dir = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self) :
+        shutil.rmtree(self.output_dir)
+
+    def test_profile_threads(self) :
+        profiler = ThreadProfiler(self.output_dir,LOGGER)
+        profiler.start()
+        threads = [Thread(target=profiler.wrap(busy_function),args=(10000,),name=f'busy_{i}') for i in range(2)]
+        for t in threads :
+            t.start()
+        for t in threads :
+            t.join()
+        profiler.stop()
+        #there should be a file of statistics for each thread that called busy_function, and one combining them
+        thread_files = sorted([fp.name.split('_',1)[1] for fp in self.output_dir.glob('*_busy_*.prof')])
+        self.assertEqual(thread_files,['busy_0.prof','busy_1.prof'])
+        combined_files = list(self.output_dir.glob('*_all_threads.prof'))
+        self.assertEqual(len(combined_files),1)
+        stats = pstats.Stats(str(combined_files[0]))
+        n_calls = [v[1] for k,v in stats.stats.items() if k[2]=='busy_function']
+        self.assertEqual(n_calls,[2])
+
+    def test_dump_while_running(self) :
+        profiler = ThreadProfiler(self.output_dir,LOGGER)
+        profiler.start()
+        busy_function(1000)
+        #statistics can be written out without stopping the profile
+        profiler.dump()
+        self.assertEqual(len(list(self.output_dir.glob('*_all_threads.prof'))),1)
+        busy_function(1000)
+        profiler.stop()
+        stats = pstats.Stats(str(list(self.output_dir.glob('*_all_threads.prof'))[0]))
+        n_calls = [v[1] for k,v in stats.stats.items() if k[2]=='busy_function']
+        self.assertEqual(n_calls,[2])
+
+    def test_tracemalloc_snapshots(self) :
+        profiler = ThreadProfiler(self.output_dir,LOGGER,tracemalloc_secs=60)
+        profiler.start()
+        self.assertTrue(tracemalloc.is_tracing())
+        profiler.dump()
+        profiler.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(len(list(self.output_dir.glob('*_tracemalloc_*.snapshot'))),2)
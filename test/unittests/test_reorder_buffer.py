@@ -0,0 +1,42 @@
+#imports
+import unittest, random
+from openmsipython.data_file_io.reorder_buffer import ReorderBuffer
+
+class TestReorderBuffer(unittest.TestCase) :
+    """
+    Class for testing ReorderBuffer functions
+    """
+
+    def test_in_order(self) :
+        reorder_buffer = ReorderBuffer()
+        self.assertEqual(reorder_buffer.add(0,10),(0,10))
+        self.assertEqual(reorder_buffer.add(10,10),(10,20))
+        self.assertEqual(reorder_buffer.n_contiguous_bytes,20)
+        self.assertEqual(reorder_buffer.n_pending_ranges,0)
+
+    def test_out_of_order(self) :
+        reorder_buffer = ReorderBuffer()
+        self.assertEqual(reorder_buffer.add(20,5),(0,0))
+        self.assertEqual(reorder_buffer.add(10,10),(0,0))
+        self.assertEqual(reorder_buffer.n_pending_ranges,2)
+        #adding the first range should make everything after it available at once
+        self.assertEqual(reorder_buffer.add(0,10),(0,25))
+        self.assertEqual(reorder_buffer.n_pending_ranges,0)
+        #ranges that were already added shouldn't make anything new available
+        self.assertEqual(reorder_buffer.add(10,10),(25,25))
+        self.assertEqual(reorder_buffer.add(25,0),(25,25))
+
+    def test_shuffled_chunks(self) :
+        chunk_size = 7; n_chunks = 100; last_chunk_size = 3
+        ranges = [(i*chunk_size,chunk_size) for i in range(n_chunks-1)]
+        ranges.append(((n_chunks-1)*chunk_size,last_chunk_size))
+        random.shuffle(ranges)
+        reorder_buffer = ReorderBuffer()
+        n_bytes_streamed = 0
+        for offset,length in ranges :
+            start, end = reorder_buffer.add(offset,length)
+            #every new range should pick up exactly where the last one left off
+            self.assertEqual(start,n_bytes_streamed)
+            n_bytes_streamed = end
+        self.assertEqual(n_bytes_streamed,(n_chunks-1)*chunk_size+last_chunk_size)
+        self.assertEqual(reorder_buffer.n_pending_ranges,0)
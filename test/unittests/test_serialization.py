@@ -6,7 +6,7 @@ from openmsipython.data_file_io.data_file_chunk import DataFileChunk
 from openmsipython.data_file_io.config import RUN_OPT_CONST
 from openmsipython.utilities.logging import Logger
 from confluent_kafka.error import SerializationError
-import unittest, pathlib, logging
+import unittest, pathlib, logging, msgpack
 
 #constants
 LOGGER = Logger(pathlib.Path(__file__).name.split('.')[0],logging.ERROR)
@@ -51,7 +51,13 @@ class TestSerialization(unittest.TestCase) :
         with self.assertRaises(SerializationError) :
             dfcs('This is a string, not a DataFileChunk!')
         for chunk_i in self.test_chunk_binaries.keys() :
-            self.assertEqual(dfcs(self.test_ul_chunk_objects[chunk_i]),self.test_chunk_binaries[chunk_i])
+            #compare the decoded properties, since reference binaries made before the file size was added 
+            #to the message need it added to compare
+            ref_properties = msgpack.unpackb(self.test_chunk_binaries[chunk_i],raw=False)
+            if len(ref_properties)==9 :
+                ref_properties.append(self.test_ul_chunk_objects[chunk_i].file_size)
+            properties = msgpack.unpackb(dfcs(self.test_ul_chunk_objects[chunk_i]),raw=False)
+            self.assertEqual(properties,ref_properties)
 
     def test_data_file_chunk_deserializer(self) :
         dfcds = DataFileChunkDeserializer()